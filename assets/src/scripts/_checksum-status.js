@@ -0,0 +1,94 @@
+import outputs from "./_data";
+import { setChecksumInfo } from "./_set-metadata";
+import { openOutput } from "./_signals";
+
+const POLL_INTERVAL = 1000;
+
+/**
+ * Summarise the checksum state of all the files in an output
+ * @param {object} metadata - output metadata
+ * @returns {("true"|"false"|"pending")}
+ */
+function outputChecksumStatus(metadata) {
+  const values = metadata.files.map((filedata) => filedata.checksum_valid);
+  if (values.includes(false)) return "false";
+  if (values.includes("pending")) return "pending";
+  return "true";
+}
+
+/**
+ * Mark an output's list item with the checksum state of its files
+ * @param {string} outputName
+ */
+export function markListItem(outputName) {
+  const item = document.querySelector(
+    `#outputList li[data-output-name="${CSS.escape(outputName)}"]`
+  );
+  item?.setAttribute(
+    "data-checksum-valid",
+    outputChecksumStatus(outputs[outputName])
+  );
+}
+
+/**
+ * Apply the verified results for an output, updating the list and, if it is
+ * currently open, the file preview
+ *
+ * @param {string} outputName
+ * @param {Object.<string, boolean>} results - checksum_valid by filename
+ */
+function applyResults(outputName, results) {
+  const metadata = outputs[outputName];
+  if (!metadata) return;
+
+  metadata.files.forEach((filedata, i) => {
+    if (filedata.checksum_valid !== "pending") return;
+    if (!(filedata.name in results)) return;
+
+    // eslint-disable-next-line no-param-reassign
+    filedata.checksum_valid = results[filedata.name];
+
+    if (openOutput.value?.outputName === outputName) {
+      const el = document.querySelector(
+        `[data-sacro-el="file-preview-${i}"] [data-sacro-el="file-preview-template-checksum"]`
+      );
+      if (el) setChecksumInfo(el, filedata.checksum_valid);
+    }
+  });
+
+  markListItem(outputName);
+}
+
+/**
+ * Poll the checksum status endpoint until every file has been verified
+ */
+export default function checksumStatus() {
+  Object.keys(outputs).forEach(markListItem);
+
+  const urlEl = document.getElementById("checksumStatusUrl");
+  if (!urlEl) return;
+  const url = JSON.parse(urlEl.textContent);
+
+  const isPending = Object.values(outputs).some(
+    (metadata) => outputChecksumStatus(metadata) === "pending"
+  );
+  if (!isPending) return;
+
+  const poll = async () => {
+    const response = await fetch(url);
+    if (!response.ok) {
+      // eslint-disable-next-line no-console
+      console.error(`An error has occurred: ${response.status}`);
+      return;
+    }
+
+    const { complete, files } = await response.json();
+    Object.entries(files).forEach(([outputName, results]) =>
+      applyResults(outputName, results)
+    );
+
+    if (!complete) setTimeout(poll, POLL_INTERVAL);
+  };
+
+  poll();
+}
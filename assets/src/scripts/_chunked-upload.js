@@ -0,0 +1,63 @@
+/**
+ * Upload a file to the researcher-start-upload endpoint in chunks, so large
+ * outputs are neither held in memory nor sent in one long request.
+ *
+ * Each chunk is PUT at its offset. If a chunk fails, it is sent again; if it
+ * had in fact arrived, the server answers with the offset to carry on from.
+ */
+
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const ATTEMPTS = 5;
+
+async function request(url, options) {
+  const response = await fetch(url, options);
+  return response.json();
+}
+
+/**
+ * @param {Object} params
+ * @param {string} params.path - the outputs path
+ * @param {File} params.file
+ * @param {() => string} params.csrfToken
+ * @param {(sent: number, total: number) => void} [params.onProgress]
+ * @returns {Promise<string>} the upload id, to pass to researcher-add-output
+ */
+export async function uploadInChunks({ path, file, csrfToken, onProgress }) {
+  const headers = () => ({ "X-CSRFToken": csrfToken() });
+
+  const started = await request(
+    `/researcher/upload/?path=${encodeURIComponent(path)}`,
+    {
+      method: "POST",
+      body: JSON.stringify({ filename: file.name, size: file.size }),
+      headers: { ...headers(), "Content-Type": "application/json" },
+    }
+  );
+  if (!started.success) throw new Error(started.message);
+
+  const { url, upload } = started;
+  let { offset } = started;
+  let failures = 0;
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + CHUNK_SIZE);
+    let sent;
+    try {
+      sent = await request(`${url}&offset=${offset}`, {
+        method: "PUT",
+        body: chunk,
+        headers: { ...headers(), "Content-Type": "application/octet-stream" },
+      });
+    } catch (error) {
+      failures += 1;
+      if (failures >= ATTEMPTS) throw error;
+      continue;
+    }
+
+    if (sent.offset === undefined) throw new Error(sent.message);
+    offset = sent.offset;
+    if (onProgress) onProgress(offset, file.size);
+  }
+
+  return upload;
+}
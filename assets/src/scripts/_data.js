@@ -1,3 +1,48 @@
+// The page only embeds a summary of each output (status, type and file
+// checksum states). Full metadata is fetched on demand from the
+// outputs-metadata endpoint and merged in here.
 const outputs = JSON.parse(document.getElementById("outputData").textContent);
 
+const metadataUrl = JSON.parse(
+  document.getElementById("outputsMetadataUrl").textContent
+);
+
+const loaded = new Set();
+
+/**
+ * Fetch a page of full output metadata
+ * @param {Object.<string, string|string[]>} params - query parameters
+ * @returns {Promise<{total: number, offset: number, limit: number, outputs: object}>}
+ */
+export async function fetchOutputs(params) {
+  const url = new URL(metadataUrl, window.location.origin);
+  Object.entries(params).forEach(([key, value]) => {
+    [].concat(value).forEach((v) => url.searchParams.append(key, v));
+  });
+
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`An error has occurred: ${response.status}`);
+  }
+
+  const page = await response.json();
+  Object.entries(page.outputs).forEach(([name, metadata]) => {
+    outputs[name] = metadata;
+    loaded.add(name);
+  });
+  return page;
+}
+
+/**
+ * Get the full metadata for an output, fetching it if needed
+ * @param {string} name - output name
+ * @returns {Promise<object>}
+ */
+export async function loadOutput(name) {
+  if (!loaded.has(name)) {
+    await fetchOutputs({ name });
+  }
+  return outputs[name];
+}
+
 export default outputs;
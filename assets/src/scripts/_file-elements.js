@@ -1,31 +1,22 @@
 /* eslint-disable no-param-reassign */
-import hljs from "highlight.js";
 import fileLoader from "./_file-loader";
 import tableBuilder from "./_table-builder";
 import "highlight.js/styles/github.css";
 import { highlightJsName } from "./_utils";
 
+// Files at least this big show a progress bar while they load
+const LARGE_FILE_BYTES = 1024 * 1024;
+
 /**
  * @param {Object} params
  * @param {HTMLElement} params.element
- * @param {string} params.fileExtension
- * @param {string} params.fileUrl
- * @param {object} params.outcome
+ * @param {string} params.tableUrl
  * @param {string} params.fileIndex
  */
-export async function createTableElement({
-  element,
-  fileExtension,
-  fileUrl,
-  outcome,
-  fileIndex,
-}) {
-  const data = await fileLoader(fileExtension, fileUrl);
-
-  tableBuilder({
-    csvString: data,
+export async function createTableElement({ element, tableUrl, fileIndex }) {
+  await tableBuilder({
+    tableUrl,
     el: element,
-    outcome,
     fileIndex,
   });
 }
@@ -41,26 +32,70 @@ export function createImageElement(el, url) {
 }
 
 /**
- * @param {HTMLElement} el - Append the text to this element
- * @param {string} ext - File type extension
+ * Show a progress bar in el while a large file downloads
+ * @param {HTMLElement} el
+ * @returns {{onProgress: (loaded: number, total: number) => void, remove: () => void}}
+ */
+function progressBar(el) {
+  let progressEl = null;
+
+  return {
+    onProgress(loaded, total) {
+      if (total < LARGE_FILE_BYTES) return;
+      if (!progressEl) {
+        progressEl = document.createElement("progress");
+        progressEl.classList.add("w-full");
+        progressEl.setAttribute("aria-label", "Loading file");
+        progressEl.max = total;
+        el.appendChild(progressEl);
+      }
+      progressEl.value = loaded;
+    },
+    remove() {
+      progressEl?.remove();
+    },
+  };
+}
+
+/**
+ * Load a file in the worker, then add it to el as highlighted code
+ * @param {HTMLElement} el - Append the code to this element
  * @param {string} url - Valid URL for the file location
+ * @param {"text"|"json"} kind
+ * @param {string} language - highlight.js language name
  */
-export async function createTextElement(el, ext, url) {
-  const data = await fileLoader(ext, url);
+async function createHighlightedElement(el, url, kind, language) {
+  const progress = progressBar(el);
+  const html = await fileLoader({
+    url,
+    kind,
+    language,
+    onProgress: progress.onProgress,
+  });
+  progress.remove();
+  if (html === null) return;
 
-  const textEl = document.createElement("code");
-  textEl.classList.add(
+  const codeEl = document.createElement("code");
+  codeEl.classList.add(
+    "hljs",
     "break-words",
     "text-sm",
-    `language-${highlightJsName(ext)}`
+    `language-${language}`
   );
-  textEl.innerHTML = data;
+  codeEl.innerHTML = html;
 
   const preEl = document.createElement("pre");
-  preEl.appendChild(textEl);
+  preEl.appendChild(codeEl);
   el.appendChild(preEl);
+}
 
-  hljs.highlightAll();
+/**
+ * @param {HTMLElement} el - Append the text to this element
+ * @param {string} ext - File type extension
+ * @param {string} url - Valid URL for the file location
+ */
+export async function createTextElement(el, ext, url) {
+  await createHighlightedElement(el, url, "text", highlightJsName(ext));
 }
 
 /**
@@ -69,17 +104,7 @@ export async function createTextElement(el, ext, url) {
  * @param {string} url - Valid URL for the file location
  */
 export async function createCodeElement(el, ext, url) {
-  const data = await fileLoader(ext, url);
-
-  const codeEl = document.createElement("code");
-  codeEl.classList.add("break-words", "text-sm", "language-json");
-  codeEl.innerHTML = JSON.stringify(JSON.parse(JSON.stringify(data)), null, 2);
-
-  const preEl = document.createElement("pre");
-  preEl.appendChild(codeEl);
-  el.appendChild(preEl);
-
-  hljs.highlightAll();
+  await createHighlightedElement(el, url, "json", "json");
 }
 
 /**
@@ -1,27 +1,66 @@
-import { canDisplay, isCsv, isJson, isTxt } from "./_utils";
+/**
+ * Load text and JSON outputs in a Web Worker (see _file-worker.js), which
+ * fetches, parses and highlights them off the main thread.
+ */
 
-async function fileLoader(ext, url) {
-  const response = await fetch(url);
+let worker = null;
+let nextId = 0;
+const requests = new Map();
 
-  if (!response.ok) {
-    // eslint-disable-next-line no-console
-    console.error(`An error has occurred: ${response.status}`);
-    return null;
-  }
+function getWorker() {
+  if (worker) return worker;
 
-  let res;
+  worker = new Worker(new URL("./_file-worker.js", import.meta.url), {
+    type: "module",
+  });
+  worker.addEventListener("message", ({ data }) => {
+    const request = requests.get(data.id);
+    if (!request) return;
 
-  if (canDisplay(ext)) {
-    if (isCsv(ext) || isTxt(ext)) {
-      return response.text();
+    if (data.type === "progress") {
+      request.onProgress?.(data.loaded, data.total);
+      return;
     }
 
-    if (isJson(ext)) {
-      return response.json();
+    requests.delete(data.id);
+    if (data.type === "done") {
+      request.resolve(data.html);
+    } else {
+      request.reject(new Error(data.message));
     }
-  }
+  });
+
+  return worker;
+}
+
+/**
+ * @param {Object} params
+ * @param {string} params.url - Valid URL for the file location
+ * @param {"text"|"json"} params.kind - how to parse the file
+ * @param {string} params.language - highlight.js language name
+ * @param {(loaded: number, total: number) => void} [params.onProgress] -
+ *   called as the file downloads; total is 0 if the size is unknown
+ * @returns {Promise<string|null>} the highlighted HTML, or null on error
+ */
+async function fileLoader({ url, kind, language, onProgress }) {
+  nextId += 1;
+  const id = nextId;
 
-  return res;
+  try {
+    return await new Promise((resolve, reject) => {
+      requests.set(id, { resolve, reject, onProgress });
+      getWorker().postMessage({
+        id,
+        url: new URL(url, window.location.href).href,
+        kind,
+        language,
+      });
+    });
+  } catch (error) {
+    // eslint-disable-next-line no-console
+    console.error(error.message);
+    return null;
+  }
 }
 
 export default fileLoader;
@@ -0,0 +1,72 @@
+/**
+ * Web Worker which fetches, parses and highlights text and JSON outputs, so
+ * that large files do not block the review UI while they load.
+ *
+ * Receives {id, url, kind, language} messages, where kind is "text" or
+ * "json", and replies with any number of {id, type: "progress", loaded,
+ * total} messages as the file downloads, followed by either {id, type:
+ * "done", html} or {id, type: "error", message}.
+ */
+import hljs from "highlight.js";
+
+/**
+ * Fetch a file as text, reporting progress as each chunk arrives
+ * @param {number} id
+ * @param {string} url
+ * @returns {Promise<string>}
+ */
+async function fetchText(id, url) {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`An error has occurred: ${response.status}`);
+  }
+
+  // 0 if the length is unknown, eg the response is compressed
+  const total = Number(response.headers.get("Content-Length")) || 0;
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  const chunks = [];
+  let loaded = 0;
+
+  // eslint-disable-next-line no-constant-condition
+  while (true) {
+    // eslint-disable-next-line no-await-in-loop
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    loaded += value.byteLength;
+    chunks.push(decoder.decode(value, { stream: true }));
+    globalThis.postMessage({ id, type: "progress", loaded, total });
+  }
+  chunks.push(decoder.decode());
+
+  return chunks.join("");
+}
+
+/**
+ * @param {string} text
+ * @param {string} kind
+ * @param {string} language - highlight.js language name
+ * @returns {string} highlighted HTML
+ */
+function render(text, kind, language) {
+  if (kind === "json") {
+    const pretty = JSON.stringify(JSON.parse(text), null, 2);
+    return hljs.highlight(pretty, { language: "json" }).value;
+  }
+
+  return hljs.highlight(text, {
+    language: hljs.getLanguage(language) ? language : "plaintext",
+  }).value;
+}
+
+globalThis.addEventListener("message", async ({ data }) => {
+  const { id, url, kind, language } = data;
+  try {
+    const text = await fetchText(id, url);
+    const html = render(text, kind, language);
+    globalThis.postMessage({ id, type: "done", html });
+  } catch (error) {
+    globalThis.postMessage({ id, type: "error", message: error.message });
+  }
+});
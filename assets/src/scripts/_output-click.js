@@ -77,9 +77,7 @@ export default async function outputClick({ outputName, metadata }) {
     if (isCsv(ext)) {
       createTableElement({
         element: filePreviewContent,
-        fileExtension: ext,
-        fileUrl: url,
-        outcome: filedata.cell_index,
+        tableUrl: filedata.table_url,
         fileIndex: i,
       });
     } else if (isImg(ext)) {
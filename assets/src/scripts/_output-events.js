@@ -0,0 +1,76 @@
+import { markListItem } from "./_checksum-status";
+import outputs, { fetchOutputs } from "./_data";
+import outputClick from "./_output-click";
+import { openOutput } from "./_signals";
+
+/**
+ * Re-render the preview if the changed output is the one open
+ * @param {string} outputName
+ * @param {object} metadata
+ */
+function rerenderIfOpen(outputName, metadata) {
+  if (openOutput.value?.outputName === outputName) {
+    outputClick({ outputName, metadata });
+  }
+}
+
+/**
+ * Tell the user the metadata has changed on disk, offering to reload
+ */
+function showReloadBanner() {
+  if (document.getElementById("outputsChangedBanner")) return;
+
+  const banner = document.createElement("div");
+  banner.id = "outputsChangedBanner";
+  banner.className =
+    "fixed bottom-4 right-4 z-50 flex items-center gap-3 rounded bg-blue-50 px-4 py-3 text-sm text-blue-900 shadow";
+  banner.textContent = "These outputs have changed on disk.";
+
+  const button = document.createElement("button");
+  button.type = "button";
+  button.className = "font-semibold underline";
+  button.textContent = "Reload";
+  button.addEventListener("click", () => window.location.reload());
+
+  banner.appendChild(button);
+  document.body.appendChild(banner);
+}
+
+/**
+ * Listen for changes to the outputs directory, refreshing just the outputs
+ * whose files changed rather than reloading the page
+ *
+ * @param {object} [options]
+ * @param {function(string, object): void} [options.onOutputChange] - called
+ * with the name and fresh metadata of each changed output
+ * @param {function(): void} [options.onMetadataChange] - called when the
+ * metadata file itself changed
+ */
+export default function outputEvents({
+  onOutputChange = rerenderIfOpen,
+  onMetadataChange = showReloadBanner,
+} = {}) {
+  const urlEl = document.getElementById("eventsUrl");
+  if (!urlEl || !window.EventSource) return;
+
+  const source = new EventSource(JSON.parse(urlEl.textContent));
+
+  source.addEventListener("change", async (event) => {
+    const { files, metadata } = JSON.parse(event.data);
+
+    if (metadata) onMetadataChange();
+
+    const changed = Object.keys(outputs).filter((outputName) =>
+      outputs[outputName].files.some((filedata) =>
+        files.includes(filedata.name)
+      )
+    );
+    if (!changed.length) return;
+
+    await fetchOutputs({ name: changed });
+    changed.forEach((outputName) => {
+      markListItem(outputName);
+      onOutputChange(outputName, outputs[outputName]);
+    });
+  });
+}
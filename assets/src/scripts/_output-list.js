@@ -1,5 +1,5 @@
 import { effect } from "@preact/signals";
-import outputs from "./_data";
+import outputs, { loadOutput } from "./_data";
 import outputClick from "./_output-click";
 import { approvedOutputs } from "./_signals";
 
@@ -10,10 +10,10 @@ export default function outputList() {
   // add click handler to each list item
   outputListItems.forEach((el) => {
     const outputName = el.getAttribute("data-output-name");
-    const metadata = outputs[outputName];
 
     // toggle selected state for the output list
-    el.addEventListener("click", () => {
+    el.addEventListener("click", async () => {
+      const metadata = await loadOutput(outputName);
       outputClick({ outputName, metadata });
 
       // clear selected class from all items in the list
@@ -0,0 +1,92 @@
+/**
+ * Keep the researcher's session on the server up to date by sending it JSON
+ * Patch (RFC 6902) operations, rather than the whole session, each time.
+ *
+ * The server numbers each revision of the session. We send the revision our
+ * changes were made against, and it refuses them with a 409 if the session
+ * has been changed elsewhere since.
+ */
+
+/**
+ * Build a JSON Pointer (RFC 6901) from unescaped reference tokens
+ * @param {...(string|number)} tokens
+ * @returns {string}
+ */
+export function pointer(...tokens) {
+  return tokens
+    .map((token) => `/${String(token).replaceAll("~", "~0").replaceAll("/", "~1")}`)
+    .join("");
+}
+
+export class SessionPatcher {
+  /**
+   * @param {Object} params
+   * @param {string} params.url - the researcher-patch-session url
+   * @param {number} params.revision - the revision of the session we have
+   * @param {() => string} params.csrfToken
+   */
+  constructor({ url, revision, csrfToken }) {
+    this.url = url;
+    this.revision = revision;
+    this.csrfToken = csrfToken;
+    // path -> operation, so only the latest value of each path is sent
+    this.pending = new Map();
+    this.sending = Promise.resolve();
+  }
+
+  /**
+   * Queue setting the value at path, to be sent on the next flush
+   * @param {string} path - a JSON Pointer
+   * @param {*} value
+   */
+  set(path, value) {
+    this.pending.delete(path);
+    this.pending.set(path, { op: "add", path, value });
+  }
+
+  /**
+   * Record the revision returned by another researcher session endpoint
+   * @param {{revision?: number}} result
+   */
+  update(result) {
+    if (result.revision !== undefined) this.revision = result.revision;
+  }
+
+  async send() {
+    if (this.pending.size === 0) return;
+
+    const operations = [...this.pending.values()];
+    this.pending.clear();
+
+    const response = await fetch(this.url, {
+      method: "POST",
+      body: JSON.stringify({ revision: this.revision, operations }),
+      headers: {
+        "Content-Type": "application/json",
+        "X-CSRFToken": this.csrfToken(),
+      },
+    });
+    const result = await response.json();
+
+    if (!result.success) {
+      // keep them to try again, unless they have been superseded
+      const unsent = operations.filter((op) => !this.pending.has(op.path));
+      this.pending = new Map([
+        ...unsent.map((op) => [op.path, op]),
+        ...this.pending,
+      ]);
+      throw new Error(result.message);
+    }
+
+    this.update(result);
+  }
+
+  /**
+   * Send any queued changes, one request at a time
+   * @returns {Promise<void>}
+   */
+  flush() {
+    this.sending = this.sending.catch(() => {}).then(() => this.send());
+    return this.sending;
+  }
+}
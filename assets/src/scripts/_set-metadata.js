@@ -123,12 +123,16 @@ export function setExceptionRequest(comment, status) {
 }
 
 /**
- * If the checksum is invalid, show a message to the user
+ * If the checksum is invalid, or still being verified, show a message to the user
  * @param {HTMLElement} el - Append the text to this element
- * @param {boolean} checksumValid - true/false if the checksum is valid
+ * @param {boolean|"pending"} checksumValid - true/false if the checksum is valid
  */
 export function setChecksumInfo(el, checksumValid) {
-  if (!checksumValid) {
+  if (checksumValid === "pending") {
+    // eslint-disable-next-line no-param-reassign
+    el.innerText =
+      "Checking this file has not been modified since the ACRO runner generated it…";
+  } else if (!checksumValid) {
     // eslint-disable-next-line no-param-reassign
     el.innerText =
       "This file had been modified since the ACRO runner generated it.";
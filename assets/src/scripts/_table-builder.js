@@ -1,110 +1,319 @@
-import Papa from "papaparse";
-import { html } from "./_utils";
+// Rows per request to the contents-table endpoint
+const PAGE_SIZE = 200;
+
+// Extra rows rendered above and below the visible ones, so that scrolling a
+// little does not show blank rows
+const OVERSCAN = 20;
+
+// Used until a real row has been rendered and measured
+const ESTIMATED_ROW_HEIGHT = 29;
+
+const FLAGGED_CELL_CLASSES = [
+  "bg-red-50",
+  "!border",
+  "!border-red-600",
+  "text-red-900",
+  "relative",
+  "group",
+  "cursor-pointer",
+];
 
 /**
- * @param {Object} params
- * @param {Object.<string, string[]>} params.outcome
- * @param {string} params.tableId
+ * Compact SDC cell index, as built by models.build_cell_index. Parallel
+ * arrays with one entry per flagged cell; bit i of a mask is set if
+ * flags[i] was raised on that cell.
+ *
+ * @typedef {Object} CellIndex
+ * @property {string[]} flags
+ * @property {number[]} rows
+ * @property {number[]} cols
+ * @property {number[]} masks
  */
-function highlightFailingCells({ outcome, tableId }) {
-  /** @type {HTMLElement|null} */
-  const tableBody = document.getElementById(tableId);
-  if (!tableBody) return;
-
-  Object.keys(outcome).forEach((index) => {
-    const x = parseFloat(index.split(",")[0]) + 1;
-    const y = parseFloat(index.split(",")[1]) + 2;
-
-    /** @type {HTMLTableCellElement|null} */
-    const tableCell = tableBody.querySelector(
-      `tr:nth-child(${x}) > td:nth-child(${y})`
-    );
-    if (!tableCell) return;
-
-    tableCell.classList.add(
-      "bg-red-50",
-      "!border",
-      "!border-red-600",
-      "text-red-900",
-      "relative",
-      "group",
-      "cursor-pointer"
+
+/**
+ * A window of rows, as returned by the contents-table endpoint
+ *
+ * @typedef {Object} TableWindow
+ * @property {string[]} header
+ * @property {number} total
+ * @property {number} offset
+ * @property {number} limit
+ * @property {string[][]} rows
+ * @property {CellIndex} cells - the flagged cells within the window
+ */
+
+/**
+ * Decode a cell index into a row -> (column -> flag names) lookup
+ * @param {CellIndex} cellIndex
+ * @param {Map<number, Map<number, string[]>>} [lookup] - add to this lookup
+ * @returns {Map<number, Map<number, string[]>>}
+ */
+export function cellFlagLookup(cellIndex, lookup = new Map()) {
+  if (!cellIndex?.rows) return lookup;
+
+  const { flags, rows, cols, masks } = cellIndex;
+  rows.forEach((row, i) => {
+    // not a bitwise test, which only sees the low 32 bits
+    const names = flags.filter(
+      (_, bit) => Math.floor(masks[i] / 2 ** bit) % 2 === 1
     );
+    if (!lookup.has(row)) lookup.set(row, new Map());
+    lookup.get(row).set(cols[i], names);
+  });
 
-    /** @type {string} */
-    const tooltipContent = outcome[index]
-      .map(
-        (/** @type {string} */ str) => html`<span class="block">${str}</span>`
-      )
-      .join("");
-
-    const tooltipTemplateEl = document.getElementById(`tooltip`);
-    if (!(tooltipTemplateEl instanceof HTMLTemplateElement)) return;
-    const tooltipEl = tooltipTemplateEl?.content?.firstElementChild;
-    if (!tooltipEl) return;
-
-    const cellTooltip = tooltipEl.cloneNode(true);
-    tableCell.appendChild(cellTooltip);
-
-    const tooltip = tableCell.querySelector("span:first-child");
-    if (tooltip) {
-      tooltip.classList.add("flex", "-bottom-2");
-
-      const tooltipContentSpan = tooltip?.querySelector(
-        `[data-sacro-el="tooltip-content"]`
-      );
-      if (tooltipContentSpan) {
-        tooltipContentSpan.innerHTML = tooltipContent;
-      }
+  return lookup;
+}
+
+/**
+ * @param {string} tableUrl
+ * @param {number} offset
+ * @param {number} limit
+ * @returns {Promise<TableWindow>}
+ */
+async function fetchWindow(tableUrl, offset, limit) {
+  const url = new URL(tableUrl, window.location.origin);
+  url.searchParams.set("offset", offset);
+  url.searchParams.set("limit", limit);
+
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`An error has occurred: ${response.status}`);
+  }
+  return response.json();
+}
+
+/**
+ * The rows of a table, fetched a page at a time as they are needed, along
+ * with a lookup of the flagged cells in the pages fetched so far
+ */
+class TableRows {
+  /**
+   * @param {string} tableUrl
+   * @param {TableWindow} first - the first page
+   */
+  constructor(tableUrl, first) {
+    this.tableUrl = tableUrl;
+    this.header = first.header;
+    this.total = first.total;
+    this.pages = new Map([[0, first.rows]]);
+    this.pending = new Map();
+    this.flags = cellFlagLookup(first.cells);
+  }
+
+  /**
+   * @param {number} i - body row index
+   * @returns {string[]|undefined} the row, if its page has been fetched
+   */
+  row(i) {
+    return this.pages.get(Math.floor(i / PAGE_SIZE))?.[i % PAGE_SIZE];
+  }
+
+  /**
+   * The pages covering rows [start, end) which have not been fetched yet
+   * @param {number} start
+   * @param {number} end
+   * @returns {number[]}
+   */
+  missing(start, end) {
+    const pages = [];
+    for (
+      let page = Math.floor(start / PAGE_SIZE);
+      page * PAGE_SIZE < end;
+      page += 1
+    ) {
+      if (!this.pages.has(page)) pages.push(page);
     }
+    return pages;
+  }
+
+  /**
+   * Fetch any pages not yet fetched covering rows [start, end)
+   * @param {number} start
+   * @param {number} end
+   */
+  async load(start, end) {
+    const requests = this.missing(start, end).map((page) => {
+      if (!this.pending.has(page)) {
+        this.pending.set(
+          page,
+          fetchWindow(this.tableUrl, page * PAGE_SIZE, PAGE_SIZE)
+            .then((data) => {
+              this.pages.set(page, data.rows);
+              cellFlagLookup(data.cells, this.flags);
+            })
+            .finally(() => this.pending.delete(page))
+        );
+      }
+      return this.pending.get(page);
+    });
+    await Promise.all(requests);
+  }
+}
+
+/**
+ * @param {HTMLTableCellElement} cell
+ * @param {string[]} flags
+ * @param {Element|undefined} tooltipEl
+ */
+function flagCell(cell, flags, tooltipEl) {
+  cell.classList.add(...FLAGGED_CELL_CLASSES);
+  if (!tooltipEl) return;
+
+  const tooltip = tooltipEl.cloneNode(true);
+  cell.appendChild(tooltip);
+  tooltip.classList.add("flex", "-bottom-2");
+
+  const tooltipContent = tooltip.querySelector(
+    `[data-sacro-el="tooltip-content"]`
+  );
+  if (!tooltipContent) return;
+
+  tooltipContent.replaceChildren(
+    ...flags.map((flag) => {
+      const span = document.createElement("span");
+      span.classList.add("block");
+      span.textContent = flag;
+      return span;
+    })
+  );
+}
+
+/**
+ * Render a body row, highlighting its flagged cells as we go
+ * @param {TableRows} table
+ * @param {number} i - body row index
+ * @param {Element|undefined} tooltipEl
+ * @returns {HTMLTableRowElement}
+ */
+function renderRow(table, i, tooltipEl) {
+  const tr = document.createElement("tr");
+  tr.className = "divide-x divide-gray-200";
+  if (i % 2 === 0) tr.classList.add("bg-gray-50");
+
+  const values = table.row(i) ?? table.header.map(() => "…");
+  const flags = table.flags.get(i);
+  values.forEach((value, col) => {
+    const td = document.createElement("td");
+    td.className = "p-1 whitespace-nowrap";
+    td.textContent = value;
+
+    // the first column holds the row labels
+    const cellFlags = flags?.get(col - 1);
+    if (cellFlags) flagCell(td, cellFlags, tooltipEl);
+
+    tr.appendChild(td);
   });
+  return tr;
 }
 
 /**
+ * @param {number} height
+ * @returns {HTMLTableRowElement}
+ */
+function spacerRow(height) {
+  const tr = document.createElement("tr");
+  tr.setAttribute("aria-hidden", "true");
+  tr.style.height = `${height}px`;
+  return tr;
+}
+
+/**
+ * Render a CSV output as a virtualised table, which only has the rows in
+ * view in the DOM, fetching them from the server as they are scrolled to.
  *
  * @param {object} params
- * @param {Object.<string, string[]>} params.outcome
+ * @param {string} params.tableUrl - the file's contents-table url
  * @param {HTMLElement} params.el
- * @param {string} params.csvString
  * @param {string} params.fileIndex
  */
-function tableBuilder({ csvString, el, outcome, fileIndex }) {
-  const csvToJson = Papa.parse(csvString).data;
-
-  const bodyCell = (row) =>
-    row.map((cell) => html`<td class="p-1">${cell}</td>`);
-  const bodyRows = csvToJson.map((row, i) =>
-    i > 0
-      ? html`<tr class="divide-x divide-gray-200 odd:bg-gray-50">
-          ${bodyCell(row)}
-        </tr>`
-      : ``
-  );
+async function tableBuilder({ tableUrl, el, fileIndex }) {
+  const startMark = `sacro-table-${fileIndex}-start`;
+  performance.mark(startMark);
 
-  const tableHtmlStr = html`
-    <table
-      id=${`csvTable${fileIndex}`}
-      class="min-w-full divide-y divide-gray-300 text-left text-sm text-gray-900"
-    >
-      <thead class="font-semibold bg-gray-200">
-        <tr>
-          ${csvToJson[0].map((cell) => html`<th>${cell}</th>`)}
-        </tr>
-      </thead>
-      <tbody id="csvBody" class="divide-y divide-gray-200">
-        ${bodyRows}
-      </tbody>
-    </table>
-  `;
-
-  if (typeof tableHtmlStr === "string") {
-    el.innerHTML = tableHtmlStr; // eslint-disable-line no-param-reassign
-
-    highlightFailingCells({
-      outcome,
-      tableId: `csvTable${fileIndex}`,
-    });
+  const table = new TableRows(tableUrl, await fetchWindow(tableUrl, 0, PAGE_SIZE));
+
+  const tooltipTemplateEl = document.getElementById(`tooltip`);
+  const tooltipEl =
+    tooltipTemplateEl instanceof HTMLTemplateElement
+      ? tooltipTemplateEl.content?.firstElementChild
+      : undefined;
+
+  const scroller = document.createElement("div");
+  scroller.className = "max-h-[70vh] overflow-auto";
+
+  const tableEl = document.createElement("table");
+  tableEl.id = `csvTable${fileIndex}`;
+  tableEl.className =
+    "min-w-full divide-y divide-gray-300 text-left text-sm text-gray-900";
+
+  const thead = tableEl.createTHead();
+  thead.className = "font-semibold bg-gray-200 sticky top-0 z-20";
+  const headerRow = thead.insertRow();
+  table.header.forEach((value) => {
+    const th = document.createElement("th");
+    th.textContent = value;
+    headerRow.appendChild(th);
+  });
+
+  const tbody = tableEl.createTBody();
+  tbody.id = "csvBody";
+  tbody.className = "divide-y divide-gray-200";
+
+  scroller.appendChild(tableEl);
+  el.replaceChildren(scroller);
+
+  let rowHeight = ESTIMATED_ROW_HEIGHT;
+  let rendered = { start: -1, end: -1 };
+
+  const render = () => {
+    const visible = Math.ceil(scroller.clientHeight / rowHeight) || PAGE_SIZE;
+    const first = Math.floor(scroller.scrollTop / rowHeight);
+    const start = Math.max(0, first - OVERSCAN);
+    const end = Math.min(table.total, first + visible + OVERSCAN);
+
+    const missing = table.missing(start, end).length > 0;
+    if (start === rendered.start && end === rendered.end && !missing) return;
+    rendered = { start, end };
+
+    const rows = [spacerRow(start * rowHeight)];
+    for (let i = start; i < end; i += 1) {
+      rows.push(renderRow(table, i, tooltipEl));
+    }
+    rows.push(spacerRow((table.total - end) * rowHeight));
+    tbody.replaceChildren(...rows);
+
+    if (missing) {
+      table
+        .load(start, end)
+        .then(() => {
+          rendered = { start: -1, end: -1 };
+          render();
+        })
+        // eslint-disable-next-line no-console
+        .catch((error) => console.error(error));
+    }
+  };
+
+  render();
+
+  // now we have real rows, use their height for the spacers
+  const measured = tbody.rows[1]?.getBoundingClientRect().height;
+  if (measured) {
+    rowHeight = measured;
+    rendered = { start: -1, end: -1 };
+    render();
   }
+
+  performance.measure(`sacro-table-${fileIndex}-interactive`, startMark);
+
+  let frame = null;
+  scroller.addEventListener("scroll", () => {
+    if (frame) return;
+    frame = requestAnimationFrame(() => {
+      frame = null;
+      render();
+    });
+  });
 }
 
 export default tableBuilder;
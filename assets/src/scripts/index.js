@@ -1,10 +1,14 @@
 import "../styles/index.css";
+import checksumStatus from "./_checksum-status";
 import formSetup from "./_form-setup";
 import modalSetup from "./_modal-setup";
+import outputEvents from "./_output-events";
 import outputList from "./_output-list";
 
 document.addEventListener("DOMContentLoaded", () => {
   outputList();
   formSetup();
   modalSetup();
+  checksumStatus();
+  outputEvents();
 });
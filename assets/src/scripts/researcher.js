@@ -1,9 +1,14 @@
 import "../styles/index.css";
-import outputs from "./_data";
+import checksumStatus from "./_checksum-status";
+import { uploadInChunks } from "./_chunked-upload";
+import outputs, { loadOutput } from "./_data";
 import outputClick from "./_output-click";
+import outputEvents from "./_output-events";
+import { pointer, SessionPatcher } from "./_session-patch";
+import { openOutput } from "./_signals";
 import { getFileExt } from "./_utils";
 
-document.addEventListener("DOMContentLoaded", () => {
+document.addEventListener("DOMContentLoaded", async () => {
   console.log("Researcher JS loaded");
 
   const currentPath = JSON.parse(
@@ -15,6 +20,22 @@ document.addEventListener("DOMContentLoaded", () => {
   const config = JSON.parse(
     document.getElementById("outputConfig").textContent
   );
+  const revision = JSON.parse(
+    document.getElementById("sessionRevision").textContent
+  );
+
+  // changes are queued here, and sent to the server when the draft is saved
+  const session = new SessionPatcher({
+    url: `/researcher/session/patch/?path=${encodeURIComponent(currentPath)}`,
+    revision,
+    csrfToken: getCsrfToken,
+  });
+
+  function queueComments(outputName) {
+    session.set(pointer("results", outputName, "comments"), [
+      ...sessionData.results[outputName].comments,
+    ]);
+  }
 
   const sessionData = {
     version,
@@ -22,15 +43,42 @@ document.addEventListener("DOMContentLoaded", () => {
     results: {},
   };
 
+  // the page only embeds a summary of each output, so, as in the checker
+  // view, an output's full metadata is only fetched when it is selected
+  const loadedResults = new Set();
+
   Object.keys(outputs).forEach((key) => {
-    sessionData.results[key] = {
-      ...outputs[key],
-      comments: outputs[key].comments || [],
-      exception: outputs[key].exception || null,
-    };
+    sessionData.results[key] = { ...outputs[key] };
   });
 
+  async function loadResult(outputName) {
+    if (!loadedResults.has(outputName)) {
+      const metadata = await loadOutput(outputName);
+      sessionData.results[outputName] = {
+        ...metadata,
+        comments: metadata.comments || [],
+        exception: metadata.exception || null,
+      };
+      loadedResults.add(outputName);
+    }
+    return sessionData.results[outputName];
+  }
+
   setupResearcherInterface();
+  checksumStatus();
+  outputEvents({
+    onOutputChange(outputName, metadata) {
+      const result = sessionData.results[outputName];
+      if (!result) return;
+      result.files = metadata.files;
+      if (openOutput.value?.outputName === outputName) {
+        outputClick({ outputName, metadata: result });
+      }
+    },
+    // our own saves rewrite the metadata, so there is nothing to tell the
+    // researcher about
+    onMetadataChange() {},
+  });
 
   function updateOutputCount() {
     const outputCountElement = document.getElementById("outputCount");
@@ -82,7 +130,7 @@ document.addEventListener("DOMContentLoaded", () => {
       }
 
       const outputName = item.getAttribute("data-output-name");
-      const metadata = sessionData.results[outputName];
+      const metadata = await loadResult(outputName);
 
       await outputClick({ outputName, metadata });
 
@@ -259,6 +307,7 @@ document.addEventListener("DOMContentLoaded", () => {
         sessionData.results[selectedOutput].comments.push(commentText);
         console.log("Comment added to", selectedOutput);
       }
+      queueComments(selectedOutput);
 
       commentTextarea.value = "";
       updateCommentsDisplay(selectedOutput);
@@ -295,6 +344,10 @@ document.addEventListener("DOMContentLoaded", () => {
       }
 
       sessionData.results[selectedOutput].exception = exceptionText;
+      session.set(
+        pointer("results", selectedOutput, "exception"),
+        exceptionText
+      );
       exceptionTextarea.value = "";
       updateExceptionDisplay(selectedOutput);
       console.log(
@@ -443,30 +496,13 @@ document.addEventListener("DOMContentLoaded", () => {
     if (!saveDraftBtn) return;
 
     saveDraftBtn.addEventListener("click", () => {
-      console.log("Save draft clicked", sessionData);
-      const formData = new FormData();
-      formData.append("session_data", JSON.stringify(sessionData));
-
-      fetch(
-        `/researcher/session/save/?path=${encodeURIComponent(currentPath)}`,
-        {
-          method: "POST",
-          body: formData,
-          headers: {
-            "X-CSRFToken": getCsrfToken(),
-          },
-        }
-      )
-        .then((response) => response.json())
-        .then((result) => {
-          if (result.success) {
-            alert("Draft saved successfully!");
-          } else {
-            alert(`Error saving draft: ${result.message}`);
-          }
-        })
+      console.log("Save draft clicked", session.pending);
+
+      session
+        .flush()
+        .then(() => alert("Draft saved successfully!"))
         .catch((error) => {
-          alert(`Error saving draft: ${error}`);
+          alert(`Error saving draft: ${error.message}`);
           console.error(error);
         });
     });
@@ -501,6 +537,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
     if (confirm("Are you sure you want to delete this comment?")) {
       sessionData.results[outputName].comments.splice(index, 1);
+      queueComments(outputName);
 
       if (editingCommentIndex === index) {
         editingCommentIndex = null;
@@ -558,17 +595,20 @@ document.addEventListener("DOMContentLoaded", () => {
         label: cb.nextElementSibling.textContent,
         checked: cb.checked
       }));
-
-      const formData = new FormData();
-      formData.append("session_data", JSON.stringify(sessionData));
-
-      fetch(`/researcher/finalize/?path=${encodeURIComponent(currentPath)}`, {
-        method: "POST",
-        body: formData,
-        headers: {
-          "X-CSRFToken": getCsrfToken(),
-        },
-      })
+      session.set("/title", sessionData.title);
+      session.set("/checklist", sessionData.checklist);
+
+      // finalize the session as saved on the server
+      session
+        .flush()
+        .then(() =>
+          fetch(`/researcher/finalize/?path=${encodeURIComponent(currentPath)}`, {
+            method: "POST",
+            headers: {
+              "X-CSRFToken": getCsrfToken(),
+            },
+          })
+        )
         .then((response) => response.json())
         .then((result) => {
           if (result.success) {
@@ -611,11 +651,13 @@ document.addEventListener("DOMContentLoaded", () => {
       const files = e.dataTransfer.files;
       if (files.length > 0) {
         const dataTransfer = new DataTransfer();
-        dataTransfer.items.add(files[0]);
+        [...files].forEach((file) => dataTransfer.items.add(file));
         fileInput.files = dataTransfer.files;
 
+        // several files are each named after the file
         const nameInput = document.getElementById("addOutputName");
-        nameInput.value = files[0].name.split(".").slice(0, -1).join(".");
+        nameInput.value =
+          files.length === 1 ? files[0].name.split(".").slice(0, -1).join(".") : "";
 
         addModal.classList.remove("hidden");
       }
@@ -638,12 +680,57 @@ document.addEventListener("DOMContentLoaded", () => {
         document.getElementById("addOutputFile").value = "";
       });
 
+    function addOutputs(files, type) {
+      const formData = new FormData();
+      formData.append("type", type);
+      [...files].forEach((file) => formData.append("files", file));
+
+      session
+        .flush()
+        .then(() => {
+          formData.append("revision", session.revision);
+          return fetch(
+            `/researcher/outputs/add/?path=${encodeURIComponent(currentPath)}`,
+            {
+              method: "POST",
+              body: formData,
+              headers: { "X-CSRFToken": getCsrfToken() },
+            }
+          );
+        })
+        .then((response) => response.json())
+        .then((result) => {
+          if (result.success) {
+            session.update(result);
+            Object.assign(sessionData.results, result.outputs);
+            Object.keys(result.outputs).forEach((name) =>
+              loadedResults.add(name)
+            );
+            const outputList = document.getElementById("outputList");
+            outputList.insertAdjacentHTML("beforeend", result.html);
+            updateOutputCount();
+            addModal.classList.add("hidden");
+            document.getElementById("addOutputName").value = "";
+            document.getElementById("addOutputFile").value = "";
+          } else {
+            alert(`Error: ${result.message}`);
+          }
+        })
+        .catch((error) => alert(`Error: ${error}`));
+    }
+
     document
       .getElementById("confirmAddOutput")
       ?.addEventListener("click", () => {
         const name = document.getElementById("addOutputName").value.trim();
         const type = document.getElementById("addOutputType").value;
-        const file = document.getElementById("addOutputFile").files[0];
+        const { files } = document.getElementById("addOutputFile");
+        const file = files[0];
+
+        if (files.length > 1) {
+          addOutputs(files, type);
+          return;
+        }
 
         if (!name || !file) {
           alert("Please provide a name and a file.");
@@ -661,23 +748,31 @@ document.addEventListener("DOMContentLoaded", () => {
         };
 
         const formData = new FormData();
-        formData.append("session_data", JSON.stringify(sessionData));
         formData.append("name", name);
         formData.append("data", JSON.stringify(newOutputData));
-        formData.append("file", file);
 
-        fetch(
-          `/researcher/output/add/?path=${encodeURIComponent(currentPath)}`,
-          {
-            method: "POST",
-            body: formData,
-            headers: { "X-CSRFToken": getCsrfToken() },
-          }
-        )
+        uploadInChunks({ path: currentPath, file, csrfToken: getCsrfToken })
+          .then((upload) => {
+            formData.append("upload", upload);
+            return session.flush();
+          })
+          .then(() => {
+            formData.append("revision", session.revision);
+            return fetch(
+              `/researcher/output/add/?path=${encodeURIComponent(currentPath)}`,
+              {
+                method: "POST",
+                body: formData,
+                headers: { "X-CSRFToken": getCsrfToken() },
+              }
+            );
+          })
           .then((response) => response.json())
           .then((result) => {
             if (result.success) {
+              session.update(result);
               sessionData.results[name] = result.output_data;
+              loadedResults.add(name);
               const outputList = document.getElementById("outputList");
               outputList.insertAdjacentHTML("beforeend", result.html);
               updateOutputCount();
@@ -731,29 +826,37 @@ document.addEventListener("DOMContentLoaded", () => {
           return;
         }
 
-        const updatedData = { ...sessionData.results[currentEditOutput] };
-        updatedData.type = newType;
-
         const formData = new FormData();
-        formData.append("session_data", JSON.stringify(sessionData));
         formData.append("original_name", currentEditOutput);
         formData.append("new_name", newName);
-        formData.append("data", JSON.stringify(updatedData));
 
-        fetch(
-          `/researcher/output/edit/?path=${encodeURIComponent(currentPath)}`,
-          {
-            method: "POST",
-            body: formData,
-            headers: { "X-CSRFToken": getCsrfToken() },
-          }
-        )
+        // the whole result is sent, so it must be loaded first. Queued
+        // changes may be to the output being renamed, so send them first too.
+        loadResult(currentEditOutput)
+          .then((current) => {
+            formData.append("data", JSON.stringify({ ...current, type: newType }));
+            return session.flush();
+          })
+          .then(() => {
+            formData.append("revision", session.revision);
+            return fetch(
+              `/researcher/output/edit/?path=${encodeURIComponent(currentPath)}`,
+              {
+                method: "POST",
+                body: formData,
+                headers: { "X-CSRFToken": getCsrfToken() },
+              }
+            );
+          })
           .then((response) => response.json())
           .then((result) => {
             if (result.success) {
+              session.update(result);
               sessionData.results[newName] = result.output_data || sessionData.results[currentEditOutput];
+              loadedResults.add(newName);
               if (newName !== currentEditOutput) {
                 delete sessionData.results[currentEditOutput];
+                loadedResults.delete(currentEditOutput);
               }
 
               const item = document.querySelector(`li[data-output-name="${currentEditOutput}"]`);
@@ -803,21 +906,27 @@ document.addEventListener("DOMContentLoaded", () => {
       ?.addEventListener("click", () => {
         const outputName = currentDeleteOutput;
         const formData = new FormData();
-        formData.append("session_data", JSON.stringify(sessionData));
         formData.append("name", outputName);
 
-        fetch(
-          `/researcher/output/delete/?path=${encodeURIComponent(currentPath)}`,
-          {
-            method: "POST",
-            body: formData,
-            headers: { "X-CSRFToken": getCsrfToken() },
-          }
-        )
+        session
+          .flush()
+          .then(() => {
+            formData.append("revision", session.revision);
+            return fetch(
+              `/researcher/output/delete/?path=${encodeURIComponent(currentPath)}`,
+              {
+                method: "POST",
+                body: formData,
+                headers: { "X-CSRFToken": getCsrfToken() },
+              }
+            );
+          })
           .then((response) => response.json())
           .then((result) => {
             if (result.success) {
+              session.update(result);
               delete sessionData.results[outputName];
+              loadedResults.delete(outputName);
               const item = document.querySelector(`li[data-output-name="${outputName}"]`);
               if (item) item.remove();
               updateOutputCount();
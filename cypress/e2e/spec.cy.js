@@ -19,13 +19,16 @@ describe("Start to finish user journey for approving and downloading outputs", (
     );
     cy.get("#approveForm").submit();
 
-    cy.url().should("eq", "http://localhost:8000/review/current/");
+    cy.url().should(
+      "match",
+      /^http:\/\/localhost:8000\/review\/[0-9a-f]{32}\/$/
+    );
     //
     // prepare for form submission that returns back a file
     // https://on.cypress.io/intercept
     cy.intercept(
       {
-        pathname: "/review/current/approved-outputs/",
+        pathname: "/review/*/approved-outputs/",
         method: "POST",
       },
       (req) => {
@@ -34,7 +37,7 @@ describe("Start to finish user journey for approving and downloading outputs", (
         // we download the file ourselves
         // but we cannot use Cypress commands inside the callback
         // so we will download it later using the captured URL
-        req.redirect("/review/current");
+        req.redirect(new URL("..", req.url).pathname);
       }
     ).as("approvedOutputs");
 
@@ -54,7 +57,7 @@ describe("Start to finish user journey for approving and downloading outputs", (
 
     cy.intercept(
       {
-        pathname: "/review/current/summary/",
+        pathname: "/review/*/summary/",
         method: "POST",
       },
       (req) => {
@@ -0,0 +1,71 @@
+// A table much larger than any test output, served a window at a time
+const TOTAL_ROWS = 100000;
+const COLUMNS = 10;
+const FLAG_EVERY = 20; // 5,000 flagged cells
+
+// Time from starting to build the table to it being interactive
+const INTERACTIVE_BUDGET_MS = 1000;
+
+function tableWindow(offset, limit) {
+  const end = Math.min(TOTAL_ROWS, offset + limit);
+  const rows = [];
+  const cells = { flags: ["threshold"], rows: [], cols: [], masks: [] };
+
+  for (let row = offset; row < end; row += 1) {
+    rows.push([
+      `row ${row}`,
+      ...Array.from({ length: COLUMNS }, (_, col) => String(row * col)),
+    ]);
+    if (row % FLAG_EVERY === 0) {
+      cells.rows.push(row);
+      cells.cols.push(row % COLUMNS);
+      cells.masks.push(1);
+    }
+  }
+
+  return {
+    header: ["", ...Array.from({ length: COLUMNS }, (_, col) => `col ${col}`)],
+    total: TOTAL_ROWS,
+    offset,
+    limit,
+    rows,
+    cells,
+  };
+}
+
+describe("Rendering large tables", () => {
+  beforeEach(() => {
+    cy.intercept({ pathname: "/contents/table/" }, (req) => {
+      const offset = Number(req.query.offset);
+      const limit = Number(req.query.limit);
+      req.reply(tableWindow(offset, limit));
+    });
+
+    cy.visit("http://localhost:8000");
+    cy.contains("Output Checker").click();
+  });
+
+  it("only renders the rows in view, and becomes interactive quickly", () => {
+    cy.findByText("crosstab_fail").click();
+
+    cy.get("#csvTable0 tbody tr").should("have.length.lessThan", 500);
+    cy.get("#csvTable0").contains("td", "row 0").should("be.visible");
+
+    cy.window().then((win) => {
+      const [measure] = win.performance.getEntriesByName(
+        "sacro-table-0-interactive"
+      );
+      expect(measure.duration).to.be.lessThan(INTERACTIVE_BUDGET_MS);
+    });
+  });
+
+  it("fetches and highlights rows as they are scrolled to", () => {
+    cy.findByText("crosstab_fail").click();
+    cy.get("#csvTable0").contains("td", "row 0");
+
+    cy.get("#csvTable0").parent().scrollTo(0, 29 * 50000);
+
+    cy.get("#csvTable0").contains("td", /^row 5\d{4}$/).should("be.visible");
+    cy.get("#csvTable0 td.bg-red-50").should("have.length.greaterThan", 0);
+  });
+});
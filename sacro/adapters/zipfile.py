@@ -1,11 +1,21 @@
 import copy
-import io
+import hashlib
 import json
 import logging
-import zipfile
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_FILECOUNT_LIMIT, ZIP_STORED
 
+from django.conf import settings
 from django.template.loader import render_to_string
 
+from sacro import cache, checksums
+
 
 logger = logging.getLogger(__name__)
 
@@ -19,54 +29,546 @@ def get_summary(review, outputs):
     return render_to_string("summary.txt", context={"review": review})
 
 
-def create(outputs, review, approved_outputs):
-    in_memory_zf = io.BytesIO()
-    with zipfile.ZipFile(in_memory_zf, "w") as zip_obj:
-        missing = []
+# bump whenever the contents of a release change for the same inputs, so that
+# releases cached by older versions are not served
+RELEASE_FORMAT = 1
+
+# how much of each output file to read, and so hold in memory, at a time
+CHUNK_SIZE = 1024 * 1024
+
+# ends a deflate stream: an empty final block, as flushing an unused
+# compressor gives
+DEFLATE_END = zlib.compressobj(wbits=-zlib.MAX_WBITS).flush()
+
+# outputs which are already compressed, so deflating them again would cost
+# time for little or no saving
+STORED_SUFFIXES = {
+    ".7z",
+    ".docx",
+    ".gif",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".pdf",
+    ".png",
+    ".pptx",
+    ".xlsx",
+    ".zip",
+}
+
+# zip format records, see APPNOTE.TXT
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_HEADER_SIGNATURE = 0x04034B50
+DATA_DESCRIPTOR = struct.Struct("<IIII")
+DATA_DESCRIPTOR64 = struct.Struct("<IIQQ")
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_HEADER_SIGNATURE = 0x02014B50
+END_RECORD64 = struct.Struct("<IQHHIIQQQQ")
+END_RECORD64_SIGNATURE = 0x06064B50
+END_LOCATOR64 = struct.Struct("<IIQI")
+END_LOCATOR64_SIGNATURE = 0x07064B50
+END_RECORD = struct.Struct("<IHHHHIIH")
+END_RECORD_SIGNATURE = 0x06054B50
+EXTRA_HEADER = struct.Struct("<HH")
+ZIP64_EXTRA = 0x0001
+
+DEFAULT_VERSION = 20
+ZIP64_VERSION = 45
+# version made by: unix, so that external_attr holds the file mode
+MADE_BY = (3 << 8) | ZIP64_VERSION
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+MAX_32 = 0xFFFFFFFF
+MAX_16 = 0xFFFF
+
+
+def compression_for(name):
+    """The compression to use for a member called name"""
+    if Path(name).suffix.lower() in STORED_SUFFIXES:
+        return ZIP_STORED
+    return ZIP_DEFLATED
+
+
+def deflater():
+    # raw deflate, as zip members have no zlib header
+    return zlib.compressobj(
+        settings.RELEASE_COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS
+    )
+
+
+def deflate_piece(data):
+    """Deflate data as one piece of a longer deflate stream.
+
+    A sync flush ends the piece on a byte boundary without ending the stream,
+    so pieces deflated separately, and so in parallel, can simply be joined
+    and then ended with DEFLATE_END. Each piece starts without a dictionary,
+    which costs very little at CHUNK_SIZE.
+    """
+    compressor = deflater()
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class OutputChanged(Exception):
+    pass
+
+
+def dos_datetime(date_time):
+    """Pack a (year, month, day, hour, minute, second) tuple as DOS date, time"""
+    year, month, day, hour, minute, second = date_time[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    return (
+        (year - 1980) << 9 | month << 5 | day,
+        hour << 11 | minute << 5 | second // 2,
+    )
+
+
+@dataclass
+class Member:
+    """A file to be added to a release zipfile.
+
+    chunks generates the file's data a piece at a time, as (data, compressed)
+    pairs, where compressed is that piece as it is to be written, compressed
+    with compress_type. file_size is only used to decide whether ZIP64
+    records are needed. If expected is given, it is the SHA-256 digest the
+    data must have.
+    """
+
+    name: str
+    chunks: object
+    file_size: int
+    compress_type: int = ZIP_STORED
+    date_time: tuple = field(default_factory=lambda: time.localtime()[:6])
+    mode: int = 0o600
+    expected: str = None
+
+
+@dataclass
+class Entry:
+    """What the central directory needs to know about a written member"""
+
+    name: bytes
+    flags: int
+    compress_type: int
+    date_time: tuple
+    mode: int
+    header_offset: int
+    crc: int = 0
+    compress_size: int = 0
+    file_size: int = 0
+
+
+class ZipWriter:
+    """Writes a zipfile in one pass, generating it a chunk at a time.
+
+    Sizes and checksums follow each member in a data descriptor, so nothing
+    needs to be known before its data is written, and nothing already
+    written needs to be revisited. If a member's data does not have the
+    digest expected of it, OutputChanged is raised before its data
+    descriptor, so the zipfile is never completed. ZIP64 records are used for members,
+    offsets and entry counts which are too big for the original format.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.entries = []
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def write(self, member):
+        """Generate the local header, data and data descriptor for member"""
+        name = member.name.encode()
+        flags = FLAG_DATA_DESCRIPTOR | (0 if name.isascii() else FLAG_UTF8)
+        entry = Entry(
+            name=name,
+            flags=flags,
+            compress_type=member.compress_type,
+            date_time=member.date_time,
+            mode=member.mode,
+            header_offset=self.offset,
+        )
+        # the compressed size is not known yet, but is no more than a little
+        # over the file size, even for data which does not compress
+        zip64 = member.file_size * 1.05 > ZIP64_LIMIT
+
+        date, time_ = dos_datetime(member.date_time)
+        if zip64:
+            extra = EXTRA_HEADER.pack(ZIP64_EXTRA, 16) + struct.pack("<QQ", 0, 0)
+            sizes = MAX_32
+        else:
+            extra = b""
+            sizes = 0
+        yield self._emit(
+            LOCAL_HEADER.pack(
+                LOCAL_HEADER_SIGNATURE,
+                ZIP64_VERSION if zip64 else DEFAULT_VERSION,
+                flags,
+                member.compress_type,
+                time_,
+                date,
+                0,
+                sizes,
+                sizes,
+                len(name),
+                len(extra),
+            )
+            + name
+            + extra
+        )
+
+        digest = hashlib.sha256() if member.expected is not None else None
+        for data, compressed in member.chunks:
+            entry.crc = zlib.crc32(data, entry.crc)
+            entry.file_size += len(data)
+            entry.compress_size += len(compressed)
+            if digest is not None:
+                digest.update(data)
+            yield self._emit(compressed)
+
+        if digest is not None and digest.hexdigest() != member.expected:
+            raise OutputChanged(f"{member.name} has changed since it was reviewed")
 
-        redacted_metadata = copy.deepcopy(outputs.raw_metadata)
-        results = redacted_metadata.get("results", {})
+        if not zip64 and max(entry.file_size, entry.compress_size) > ZIP64_LIMIT:
+            raise RuntimeError(f"{member.name} grew too large while being written")
 
-        to_remove = [k for k in results if k not in approved_outputs]
-        for k in to_remove:
-            del results[k]
+        if zip64:
+            descriptor = DATA_DESCRIPTOR64
+        else:
+            descriptor = DATA_DESCRIPTOR
+        yield self._emit(
+            descriptor.pack(
+                DATA_DESCRIPTOR_SIGNATURE,
+                entry.crc,
+                entry.compress_size,
+                entry.file_size,
+            )
+        )
+        self.entries.append(entry)
+
+    def writestr(self, name, data):
+        """Generate a member holding data, compressed according to its name"""
+        if isinstance(data, str):
+            data = data.encode()
+        compress_type = compression_for(name)
+        if compress_type == ZIP_DEFLATED:
+            compressor = deflater()
+            compressed = compressor.compress(data) + compressor.flush()
+        else:
+            compressed = data
+        yield from self.write(
+            Member(
+                name=name,
+                chunks=[(data, compressed)],
+                file_size=len(data),
+                compress_type=compress_type,
+            )
+        )
+
+    def close(self):
+        """Return the central directory and end records"""
+        records = []
+        start = self.offset
+        for entry in self.entries:
+            extra = []
+            file_size = entry.file_size
+            compress_size = entry.compress_size
+            header_offset = entry.header_offset
+            if file_size > ZIP64_LIMIT:
+                extra.append(file_size)
+                file_size = MAX_32
+            if compress_size > ZIP64_LIMIT:
+                extra.append(compress_size)
+                compress_size = MAX_32
+            if header_offset > ZIP64_LIMIT:
+                extra.append(header_offset)
+                header_offset = MAX_32
+
+            if extra:
+                extra_data = EXTRA_HEADER.pack(ZIP64_EXTRA, 8 * len(extra))
+                extra_data += struct.pack(f"<{len(extra)}Q", *extra)
+                version = ZIP64_VERSION
+            else:
+                extra_data = b""
+                version = DEFAULT_VERSION
+
+            date, time_ = dos_datetime(entry.date_time)
+            records.append(
+                CENTRAL_HEADER.pack(
+                    CENTRAL_HEADER_SIGNATURE,
+                    MADE_BY,
+                    version,
+                    entry.flags,
+                    entry.compress_type,
+                    time_,
+                    date,
+                    entry.crc,
+                    compress_size,
+                    file_size,
+                    len(entry.name),
+                    len(extra_data),
+                    0,
+                    0,
+                    0,
+                    entry.mode << 16,
+                    header_offset,
+                )
+                + entry.name
+                + extra_data
+            )
+        central_directory = b"".join(records)
+
+        count = len(self.entries)
+        size = len(central_directory)
+        end = b""
+        if count > ZIP_FILECOUNT_LIMIT or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            end += END_RECORD64.pack(
+                END_RECORD64_SIGNATURE,
+                END_RECORD64.size - 12,
+                MADE_BY,
+                ZIP64_VERSION,
+                0,
+                0,
+                count,
+                count,
+                size,
+                start,
+            )
+            end += END_LOCATOR64.pack(END_LOCATOR64_SIGNATURE, 0, start + size, 1)
+        end += END_RECORD.pack(
+            END_RECORD_SIGNATURE,
+            0,
+            0,
+            min(count, MAX_16),
+            min(count, MAX_16),
+            min(size, MAX_32),
+            min(start, MAX_32),
+            0,
+        )
+        return self._emit(central_directory + end)
+
+
+def recorded_checksum(checksums_dir, filename):
+    """The checksum recorded for an output file, if there is one"""
+    try:
+        return (checksums_dir / f"{filename}.txt").read_text(encoding="utf8")
+    except FileNotFoundError:
+        return None
 
-        for name in approved_outputs:
-            if name in results:
-                decision = review["decisions"].get(name, {})
-                comment = decision.get("comment")
-                if comment:
-                    if "comments" not in results[name]:
-                        results[name]["comments"] = []
-                    results[name]["comments"].append(f"Output Checker: {comment}")
 
-                results[name]["status"] = "approved"
+class ReadAhead:
+    """Reads the output files for a release once each, in order.
 
-        zip_obj.writestr("results.json", json.dumps(redacted_metadata, indent=2))
+    Files are read a chunk at a time on the thread writing the zipfile, and
+    chunks which are to be deflated are handed to a pool of workers threads,
+    which zlib lets work in parallel. Reading keeps up to limit bytes ahead
+    of what has been written, across as many files as that spans, so the
+    workers have something to compress while memory use stays bounded
+    however large the outputs are, and a large file starts being written as
+    soon as its first chunk is ready.
+    """
 
-        # add approved files
-        for output in approved_outputs:
-            if output not in outputs:
+    def __init__(self, paths, workers, limit):
+        self.paths = iter(paths)
+        self.limit = limit
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sacro-release"
+        )
+        # (path, data, compressed) for each chunk read, and (path, None, None)
+        # at the end of each file
+        self.queue = deque()
+        self.buffered = 0
+        # (path, file, deflate) for the file being read
+        self.reading = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # cancel everything queued before waiting on what is being compressed
+        for _, _, compressed in self.queue:
+            if compressed is not None:
+                compressed.cancel()
+        self.queue.clear()
+        self.pool.shutdown()
+        if self.reading is not None:
+            self.reading[1].close()
+            self.reading = None
+
+    def fill(self):
+        # always at least one chunk ahead, however small the limit
+        while not self.queue or self.buffered < self.limit:
+            if self.reading is None:
+                if (path := next(self.paths, None)) is None:
+                    return
+                deflate = compression_for(path.name) == ZIP_DEFLATED
+                self.reading = path, open(path, "rb"), deflate
+
+            path, f, deflate = self.reading
+            if not (data := f.read(CHUNK_SIZE)):
+                f.close()
+                self.reading = None
+                self.queue.append((path, None, None))
                 continue
 
-            for filedata in outputs[output]["files"]:
-                path = outputs.get_file_path(output, filedata["name"])
-                if path.exists():
-                    zip_obj.write(path, arcname=path.name)
-                else:
-                    logger.warning(f"{path} does not exist. Excluding from zipfile")
-                    missing.append(str(path))
+            compressed = self.pool.submit(deflate_piece, data) if deflate else None
+            self.queue.append((path, data, compressed))
+            self.buffered += len(data)
+
+    def chunks(self, path):
+        """Generate (data, compressed) pairs for path, the next file to be read"""
+        deflate = compression_for(path.name) == ZIP_DEFLATED
+        while True:
+            self.fill()
+            _, data, compressed = self.queue.popleft()
+            if data is None:
+                if deflate:
+                    yield b"", DEFLATE_END
+                return
+            self.buffered -= len(data)
+            yield data, compressed.result() if compressed else data
+
+
+def redact_metadata(outputs, review, approved_outputs):
+    """The ACRO metadata, with only the approved outputs and review comments"""
+    redacted_metadata = copy.deepcopy(outputs.raw_metadata)
+    results = redacted_metadata.get("results", {})
+
+    to_remove = [k for k in results if k not in approved_outputs]
+    for k in to_remove:
+        del results[k]
+
+    for name in approved_outputs:
+        if name in results:
+            decision = review["decisions"].get(name, {})
+            comment = decision.get("comment")
+            if comment:
+                if "comments" not in results[name]:
+                    results[name]["comments"] = []
+                results[name]["comments"].append(f"Output Checker: {comment}")
+
+            results[name]["status"] = "approved"
+
+    return redacted_metadata
+
+
+def stream(outputs, review, approved_outputs, workers=None):
+    """Generate the release zipfile a chunk at a time.
+
+    Only a little of each output file is held in memory at once, so releasing
+    large outputs does not need as much memory, and the download can start
+    before the whole archive has been written. Outputs are compressed in
+    parallel, but always added in the same order.
+
+    Each output file is read once, and checked against its recorded checksum
+    in the same read that archives it. If any has changed since it was
+    reviewed, OutputChanged is raised and the release is refused, as what
+    has already been sent of it cannot be taken back.
+    """
+    if workers is None:
+        workers = settings.RELEASE_COMPRESSION_WORKERS
+
+    writer = ZipWriter()
+    missing = []
+
+    redacted_metadata = redact_metadata(outputs, review, approved_outputs)
+    yield from writer.writestr("results.json", json.dumps(redacted_metadata, indent=2))
+
+    # add approved files
+    checksums_dir = outputs.path.parent / "checksums"
+    paths = []
+    expected = {}
+    for output in approved_outputs:
+        if output not in outputs:
+            continue
+
+        for filedata in outputs[output]["files"]:
+            path = outputs.get_file_path(output, filedata["name"])
+            if path.exists():
+                paths.append(path)
+                expected[path] = recorded_checksum(checksums_dir, filedata["name"])
+            else:
+                logger.warning(f"{path} does not exist. Excluding from zipfile")
+                missing.append(str(path))
+
+    read_ahead = ReadAhead(paths, workers, settings.RELEASE_READ_AHEAD_BYTES)
+    with read_ahead:
+        for path in paths:
+            stat = path.stat()
+            member = Member(
+                name=path.name,
+                chunks=read_ahead.chunks(path),
+                file_size=stat.st_size,
+                compress_type=compression_for(path.name),
+                date_time=time.localtime(stat.st_mtime)[:6],
+                mode=stat.st_mode,
+                expected=expected[path],
+            )
+            try:
+                yield from writer.write(member)
+            except OutputChanged:
+                logger.warning(f"{path} has changed since review. Refusing release")
+                raise
+
+    if missing:
+        lines = [
+            "The following output files were not found when creating this zipfile:",
+            "",
+        ] + missing
+        yield from writer.writestr("missing-files.txt", "\n".join(lines))
+
+    yield from writer.writestr("summary.txt", get_summary(review, outputs))
+    yield writer.close()
+
+
+def release_key(outputs, review, approved_outputs):
+    """Hash of everything that goes into a release, to key RELEASE_CACHE.
+
+    Output files are identified by their stat fingerprint and recorded
+    checksum, as the verified index does, so working out the key never needs
+    to read them.
+    """
+    checksums_dir = outputs.path.parent / "checksums"
+    files = []
+    for output in approved_outputs:
+        if output not in outputs:
+            continue
 
-        if missing:
-            lines = [
-                "The following output files were not found when creating this zipfile:",
-                "",
-            ] + missing
-            zip_obj.writestr("missing-files.txt", data="\n".join(lines))
+        for filedata in outputs[output]["files"]:
+            path = outputs.get_file_path(output, filedata["name"])
+            try:
+                fingerprint = checksums.stat_key(path.stat())
+            except FileNotFoundError:
+                fingerprint = None
+            files.append(
+                [
+                    str(path),
+                    fingerprint,
+                    recorded_checksum(checksums_dir, filedata["name"]),
+                ]
+            )
 
-        zip_obj.writestr("summary.txt", data=get_summary(review, outputs))
+    metadata = json.dumps(outputs.raw_metadata, sort_keys=True).encode()
+    inputs = {
+        "format": RELEASE_FORMAT,
+        "compression_level": settings.RELEASE_COMPRESSION_LEVEL,
+        "comment": review.get("comment"),
+        "decisions": {
+            name: {"state": decision.get("state"), "comment": decision.get("comment")}
+            for name, decision in review["decisions"].items()
+        },
+        "approved": list(approved_outputs),
+        "metadata": hashlib.sha256(metadata).hexdigest(),
+        "files": files,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
 
-    # rewind the file stream to the start
-    in_memory_zf.seek(0)
 
-    return in_memory_zf
+RELEASE_CACHE = cache.ReleaseCache()
@@ -9,9 +9,20 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sacro.settings")
 
-application = get_asgi_application()
+# as get_asgi_application, but with our handler
+django.setup(set_prefix=False)
+
+# must be imported after django is set up
+from sacro.handlers import StreamingASGIHandler  # noqa: E402
+from sacro.watcher import EventStreamApp  # noqa: E402
+
+
+django_application = StreamingASGIHandler()
+
+
+application = EventStreamApp(django_application)
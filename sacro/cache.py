@@ -0,0 +1,316 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro.checksums import CHUNK_SIZE
+
+
+logger = logging.getLogger(__name__)
+
+
+def stat_fingerprint(path):
+    """Cheap identity of a file's contents: (mtime_ns, size), or None if missing"""
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class OutputsCache:
+    """Process-wide LRU cache of annotated ACROOutputs objects.
+
+    Entries are keyed by the resolved metadata path plus the stat fingerprints
+    of the metadata and config.json files, so any edit to either produces a new
+    key. On a hit we also re-stat the output and checksum files the entry was
+    built from, as a change to any of them invalidates the checksum annotations.
+
+    The memory budget is approximate: each entry is weighted by the on-disk size
+    of its metadata file.
+    """
+
+    def __init__(self, loader, max_bytes=None):
+        self.loader = loader
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.OUTPUTS_CACHE_MAX_BYTES
+
+    @property
+    def size(self):
+        return sum(entry["weight"] for entry in self._entries.values())
+
+    def key(self, path):
+        path = Path(path).resolve()
+        return (
+            str(path),
+            stat_fingerprint(path),
+            stat_fingerprint(path.parent / "config.json"),
+        )
+
+    def get(self, path):
+        key = self.key(path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_fresh(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["outputs"]
+
+            self.misses += 1
+            # drop any stale entries for this path
+            self._discard(key[0])
+
+        outputs = self.loader(Path(path))
+
+        with self._lock:
+            self._entries[key] = {
+                "outputs": outputs,
+                "files": self._file_fingerprints(outputs),
+                "weight": key[1][1] if key[1] else 0,
+            }
+            self._evict()
+
+        return outputs
+
+    def invalidate(self, path=None):
+        """Drop cached entries for path, or everything if no path is given"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._discard(str(Path(path).resolve()))
+
+    def refresh(self, dirpath, names):
+        """Update entries for metadata in dirpath after the named files changed.
+
+        Entries whose metadata or config.json changed are dropped. Otherwise
+        only the affected output files are reverified, in place, so the rest
+        of the entry can still be used.
+        """
+        dirpath = Path(dirpath).resolve()
+        with self._lock:
+            entries = []
+            for key, entry in list(self._entries.items()):
+                path = Path(key[0])
+                if path.parent != dirpath:
+                    continue
+                if path.name in names or "config.json" in names:
+                    del self._entries[key]
+                else:
+                    entries.append(entry)
+
+        for entry in entries:
+            outputs = entry["outputs"]
+            checksums_dir = outputs.path.parent / "checksums"
+            # fingerprint before reverifying, so that any change made while we
+            # are reverifying still invalidates the entry
+            fingerprints = {}
+            for name in names:
+                for path in (
+                    outputs.path.parent / name,
+                    checksums_dir / (name + ".txt"),
+                ):
+                    if path in entry["files"]:
+                        fingerprints[path] = stat_fingerprint(path)
+
+            if outputs.reverify(names):
+                with self._lock:
+                    entry["files"].update(fingerprints)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _discard(self, resolved_path):
+        for key in [k for k in self._entries if k[0] == resolved_path]:
+            del self._entries[key]
+
+    def _evict(self):
+        # always keep the most recent entry, even if it alone is over budget
+        while len(self._entries) > 1 and self.size > self.max_bytes:
+            key, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            logger.debug(f"evicted {key[0]} from outputs cache")
+
+    def _file_fingerprints(self, outputs):
+        checksums_dir = outputs.path.parent / "checksums"
+        fingerprints = {}
+        for output, metadata in outputs.items():
+            for filedata in metadata["files"]:
+                for path in (
+                    outputs.get_file_path(output, filedata["name"]),
+                    checksums_dir / (filedata["name"] + ".txt"),
+                ):
+                    fingerprints[path] = stat_fingerprint(path)
+        return fingerprints
+
+    def _is_fresh(self, entry):
+        return all(
+            stat_fingerprint(path) == fingerprint
+            for path, fingerprint in entry["files"].items()
+        )
+
+
+class ReleaseCache:
+    """On-disk cache of built release zipfiles.
+
+    Entries are named by a key which hashes everything that goes into the
+    release, so a changed decision, comment or file gives a new key rather
+    than needing to be invalidated. Old entries are evicted least recently
+    used first once the directory is over its size budget.
+
+    The SHA-256 digest of each entry is recorded alongside it, and checked
+    before the entry is served, so a damaged or substituted entry is rebuilt
+    rather than released.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def directory(self):
+        if self._directory is not None:
+            return Path(self._directory)
+        return Path(settings.RELEASE_CACHE_DIR)
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.RELEASE_CACHE_MAX_BYTES
+
+    def path(self, key):
+        return self.directory / f"{key}.zip"
+
+    def digest_path(self, key):
+        return self.directory / f"{key}.sha256"
+
+    def get(self, key):
+        """Return the cached release for key as an open file, or None"""
+        path = self.path(key)
+        try:
+            expected = self.digest_path(key).read_text()
+            f = open(path, "rb")
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # check the file we are about to serve, rather than the path, so it
+        # cannot be swapped after it is checked
+        digest = hashlib.sha256()
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+        if digest.hexdigest() != expected:
+            f.close()
+            logger.warning(f"discarding cached release {key}: its digest has changed")
+            self.discard(key)
+            self.misses += 1
+            return None
+        f.seek(0)
+
+        self.hits += 1
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:  # pragma: no cover
+            pass
+        return f
+
+    def store(self, key, chunks):
+        """Pass chunks through, caching them as the release for key.
+
+        The entry is only added once every chunk has been generated, so an
+        abandoned download leaves nothing behind. Failing to write the cache
+        does not fail the download.
+        """
+        tmp = None
+        digest = hashlib.sha256()
+        try:
+            # only readable by us, as releases are served from here
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp = tempfile.NamedTemporaryFile(
+                dir=self.directory, prefix=".", suffix=".partial", delete=False
+            )
+        except OSError as exc:
+            logger.warning(f"not caching release {key}: {exc}")
+
+        complete = False
+        try:
+            for chunk in chunks:
+                if tmp is not None:
+                    try:
+                        tmp.write(chunk)
+                        digest.update(chunk)
+                    except OSError as exc:
+                        logger.warning(f"not caching release {key}: {exc}")
+                        tmp.close()
+                        Path(tmp.name).unlink(missing_ok=True)
+                        tmp = None
+                yield chunk
+            complete = True
+        finally:
+            if tmp is not None:
+                tmp.close()
+                try:
+                    if complete:
+                        self.digest_path(key).write_text(digest.hexdigest())
+                        os.replace(tmp.name, self.path(key))
+                except OSError as exc:
+                    logger.warning(f"not caching release {key}: {exc}")
+                finally:
+                    Path(tmp.name).unlink(missing_ok=True)
+
+        if tmp is not None:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until under budget"""
+        entries = []
+        for path in self.directory.glob("*.zip"):
+            try:
+                stat = path.stat()
+            except OSError:  # pragma: no cover
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        # oldest first, always keeping the most recent entry, even if it alone
+        # is over budget
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.discard(path.stem)
+            total -= size
+            logger.debug(f"evicted {path.name} from release cache")
+
+    def discard(self, key):
+        """Remove the entry for key"""
+        self.path(key).unlink(missing_ok=True)
+        self.digest_path(key).unlink(missing_ok=True)
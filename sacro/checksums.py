@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro import writer
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = ".verified"
+
+# large enough to keep syscall overhead negligible, small enough that memory
+# use does not depend on the size of the file being hashed
+CHUNK_SIZE = 1024 * 1024
+
+# runs lazy verification jobs one at a time, off the request thread. Each job
+# hashes its files with its own pool of CHECKSUM_WORKERS threads.
+BACKGROUND = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sacro-checksums")
+
+
+def sha256_file(path, chunk_size=CHUNK_SIZE):
+    """Return the hex SHA-256 digest of the file at path.
+
+    The file is streamed through a single reused buffer, so peak memory is
+    bounded by chunk_size however large the file is.
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while size := f.readinto(buffer):
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def stat_key(stat):
+    """Fingerprint used to decide whether a file needs rehashing"""
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+class VerifiedIndex:
+    """Persistent record of the digests we have already computed.
+
+    Stored as a JSON sidecar in the checksums directory, mapping each file's
+    resolved path to its stat fingerprint and SHA-256 digest. A file is only
+    rehashed if its fingerprint has changed, or if force is set.
+    """
+
+    def __init__(self, checksums_dir):
+        self.path = Path(checksums_dir) / INDEX_NAME
+        self.entries = self._read()
+        self.dirty = False
+
+    def _read(self):
+        try:
+            entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(entries, dict):
+            return {}
+        return entries
+
+    def lookup(self, path, force=False):
+        """Return the recorded digest of path if it is still current, else None"""
+        if force:
+            return None
+        entry = self.entries.get(str(Path(path).resolve()))
+        if entry and entry.get("stat") == stat_key(Path(path).stat()):
+            return entry["digest"]
+        return None
+
+    def digest(self, path, force=False):
+        """Return the SHA-256 digest of path, hashing only if needed"""
+        path = Path(path)
+        return self.digest_many([path], force=force)[path]
+
+    def digest_many(self, paths, force=False, workers=None, on_digest=None):
+        """Return {path: digest} for paths, hashing stale files in parallel.
+
+        hashlib releases the GIL while hashing, so a thread pool lets us use
+        several cores and keep the disk busy. If given, on_digest(path, digest)
+        is called as each stale file finishes hashing.
+        """
+        if workers is None:
+            workers = settings.CHECKSUM_WORKERS
+
+        digests = {}
+        stale = {}
+        for path in map(Path, paths):
+            digest = self.lookup(path, force=force)
+            if digest is None:
+                stale[path] = stat_key(path.stat())
+            else:
+                digests[path] = digest
+
+        def record(path, digest):
+            self.entries[str(path.resolve())] = {
+                "stat": stale[path],
+                "digest": digest,
+            }
+            self.dirty = True
+            digests[path] = digest
+            if on_digest:
+                on_digest(path, digest)
+
+        if len(stale) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(sha256_file, path): path for path in stale}
+                for future in as_completed(futures):
+                    record(futures[future], future.result())
+        else:
+            for path in stale:
+                record(path, sha256_file(path))
+
+        return digests
+
+    def save(self):
+        """Atomically write the index, if anything has changed"""
+        if not self.dirty:
+            return
+
+        # forget files which no longer exist
+        self.entries = {k: v for k, v in self.entries.items() if os.path.exists(k)}
+
+        try:
+            data = json.dumps(self.entries).encode()
+            writer.WRITER.write_now(self.path, data, "checksum_index")
+        except OSError as exc:
+            logger.warning(f"could not write checksum index {self.path}: {exc}")
+        else:
+            self.dirty = False
@@ -0,0 +1,387 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro import jsonpatch, writer
+from sacro.cache import stat_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+# compacts journals into their drafts one at a time, off the request thread
+BACKGROUND = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sacro-drafts")
+
+
+class RevisionConflict(Exception):
+    def __init__(self, *args, revision, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.revision = revision
+
+    def __str__(self):
+        return f"The session has been changed elsewhere, and is now at revision {self.revision}. Please reload it."
+
+
+def draft_path(metadata_path):
+    """Where the researcher's draft of the metadata at metadata_path is saved"""
+    return Path(metadata_path).parent / "results.json"
+
+
+def journal_path(metadata_path):
+    """Where changes to the draft are logged until they are compacted into it"""
+    path = draft_path(metadata_path)
+    return path.with_name(f".{path.name}.journal")
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_journal(path, base_digest):
+    """Return the revision of the base with base_digest, and the changes since.
+
+    The journal is a JSON line for each change, {"revision": n, "operations":
+    [...]}, plus a line {"base": digest, "revision": n} whenever a draft file
+    with that digest is written at revision n. Changes are replayed on top of
+    the draft file from its revision on, so a crash at any point while
+    compacting leaves a draft file and journal which agree.
+
+    Returns (None, []) if there is no journal for this base.
+    """
+    bases = {}
+    entries = []
+    try:
+        with open(path, "rb") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None, []
+
+    for number, line in enumerate(lines, start=1):
+        try:
+            entry = json.loads(line)
+            revision = entry["revision"]
+        except (ValueError, KeyError, TypeError):
+            # most likely the last line, cut short by a crash
+            logger.warning(f"ignoring the rest of {path} from line {number}")
+            break
+        if "base" in entry:
+            bases[entry["base"]] = revision
+        else:
+            entries.append(entry)
+
+    if base_digest not in bases:
+        if lines:
+            logger.warning(f"ignoring {path}, as it is for a different draft")
+        return None, []
+
+    base_revision = bases[base_digest]
+    return base_revision, [e for e in entries if e["revision"] > base_revision]
+
+
+@dataclass
+class Draft:
+    document: dict
+    # the file document was last read from or written to, and its fingerprint
+    source: Path
+    fingerprint: tuple
+    revision: int = 0
+    # the digest and revision of the draft file the journal is based on, and
+    # whether the journal has been started
+    base_digest: str = None
+    base_revision: int = 0
+    journal_started: bool = False
+    # changes made since the draft file was written: (revision, journal line,
+    # number of operations)
+    entries: list = field(default_factory=list)
+    compacting: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def journalled_operations(self):
+        return sum(operations for _, _, operations in self.entries)
+
+
+class DraftStore:
+    """Researchers' draft sessions, held in memory between requests.
+
+    This lets the researcher UI send just the changes it has made, as JSON
+    Patch operations, rather than the whole session on every edit.
+
+    Each draft has a revision number, which goes up by one with every change.
+    Clients send the revision their changes were made against, and get a
+    RevisionConflict if someone else has changed the draft since.
+
+    A draft is saved as results.json, plus a journal of the changes made since
+    it was written. Each change is appended to the journal, so costs as much
+    as the change rather than the whole session. Once DRAFT_COMPACT_OPERATIONS
+    operations have built up, they are compacted into a new results.json in
+    the background.
+
+    A draft is read from results.json if there is one, or else the ACRO
+    metadata itself, and then the journal is replayed on top of it. If the
+    draft file is changed by anything else, the draft is reread.
+    """
+
+    def __init__(self):
+        self._drafts = {}
+        self._lock = threading.Lock()
+
+    def _read(self, metadata_path):
+        source = draft_path(metadata_path)
+        if not source.exists():
+            source = Path(metadata_path)
+        fingerprint = stat_fingerprint(source)
+        data = source.read_bytes()
+        document = json.loads(data)
+
+        draft = Draft(document, source, fingerprint)
+        if source != draft_path(metadata_path):
+            return draft
+
+        draft.base_digest = digest(data)
+        base_revision, entries = read_journal(
+            journal_path(metadata_path), draft.base_digest
+        )
+        if base_revision is None:
+            return draft
+
+        draft.journal_started = True
+        draft.base_revision = draft.revision = base_revision
+        for entry in entries:
+            try:
+                jsonpatch.apply(document, entry["operations"])
+            except jsonpatch.PatchError as exc:
+                logger.warning(
+                    f"stopped replaying {journal_path(metadata_path)} at revision"
+                    f" {entry['revision']}: {exc}"
+                )
+                break
+            draft.revision = entry["revision"]
+            draft.entries.append(
+                (entry["revision"], json.dumps(entry), len(entry["operations"]))
+            )
+        return draft
+
+    def key(self, metadata_path):
+        # the session's outputs.json and its results.json, once there is one,
+        # are both paths to the same draft
+        return draft_path(metadata_path).resolve()
+
+    def get(self, metadata_path):
+        """Return the Draft for the metadata at metadata_path"""
+        key = self.key(metadata_path)
+        with self._lock:
+            draft = self._drafts.get(key)
+            # while we are writing a draft, its file is expected to change
+            if draft is not None and (
+                draft.lock.locked()
+                or (
+                    draft.fingerprint is not None
+                    and stat_fingerprint(draft.source) == draft.fingerprint
+                )
+            ):
+                return draft
+
+            new = self._read(Path(metadata_path).resolve())
+            if draft is not None:
+                # keep revisions going up, so clients notice the change
+                new.revision = max(new.revision, draft.revision + 1)
+                if not new.journal_started:
+                    new.base_revision = new.revision
+            self._drafts[key] = new
+            return new
+
+    def discard(self, metadata_path):
+        """Forget the draft for metadata_path"""
+        with self._lock:
+            self._drafts.pop(self.key(metadata_path), None)
+
+    def remove(self, metadata_path):
+        """Delete the draft for metadata_path, eg once it has been finalized"""
+        path = draft_path(metadata_path)
+        if path.exists() and path != Path(metadata_path):
+            path.unlink()
+        journal_path(metadata_path).unlink(missing_ok=True)
+        self.discard(metadata_path)
+
+    def _append(self, metadata_path, draft, entry):
+        """Log a change in the journal, starting a new journal if need be"""
+        start = time.monotonic()
+        line = json.dumps(entry)
+        with open(
+            journal_path(metadata_path), "a" if draft.journal_started else "w"
+        ) as f:
+            if not draft.journal_started:
+                base = {"base": draft.base_digest, "revision": draft.base_revision}
+                f.write(json.dumps(base) + "\n")
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        draft.journal_started = True
+        draft.entries.append((entry["revision"], line, len(entry["operations"])))
+        writer.WRITER.record("draft_journal", time.monotonic() - start)
+
+    def _write_base(self, metadata_path, draft, data, revision, staged=None):
+        """Make data, the draft at revision, the new draft file.
+
+        If data has already been written to the file staged, it is moved into
+        place rather than written again. Must be called with draft.lock held.
+        """
+        path = draft_path(metadata_path)
+        journal = journal_path(metadata_path)
+        new_digest = digest(data)
+        base = json.dumps({"base": new_digest, "revision": revision})
+
+        def record_base():
+            # record the new base first, so that whenever we crash the journal
+            # still applies to whichever draft file is in place
+            with open(journal, "a" if draft.journal_started else "w") as f:
+                f.write(base + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+        if staged is None:
+            writer.WRITER.write_now(path, data, "draft", before_replace=record_base)
+        else:
+            record_base()
+            os.replace(staged, path)
+
+        # then drop the changes the new draft file includes
+        entries = [e for e in draft.entries if e[0] > revision]
+        lines = [base] + [line for _, line, _ in entries]
+        writer.write_atomically(
+            journal, "".join(f"{line}\n" for line in lines).encode()
+        )
+
+        draft.source = path
+        draft.fingerprint = stat_fingerprint(path)
+        draft.base_digest = new_digest
+        draft.base_revision = revision
+        draft.journal_started = True
+        draft.entries = entries
+        logger.info(f"Saved draft session to {path} at revision {revision}")
+
+    def _compact(self, metadata_path, draft):
+        """Write the draft to its draft file. Must be called with draft.lock held."""
+        data = json.dumps(draft.document, indent=2).encode()
+        try:
+            self._write_base(metadata_path, draft, data, draft.revision)
+        except Exception:
+            # the files on disk may no longer match what we hold, so reread
+            # them next time
+            draft.fingerprint = None
+            raise
+
+    def compact(self, metadata_path):
+        """Compact any journalled changes into the draft file now"""
+        draft = self.get(metadata_path)
+        with draft.lock:
+            if draft.entries:
+                self._compact(metadata_path, draft)
+
+    def _compact_in_background(self, metadata_path, draft):
+        try:
+            # serialise the draft as it is now, but write it out without
+            # holding up any further changes
+            with draft.lock:
+                revision = draft.revision
+                data = json.dumps(draft.document, indent=2).encode()
+
+            start = time.monotonic()
+            path = draft_path(metadata_path)
+            tmp = path.with_name(f".{path.name}.compacting")
+            writer.write_atomically(tmp, data)
+
+            with draft.lock:
+                if (
+                    draft.fingerprint is None
+                    or stat_fingerprint(draft.source) != draft.fingerprint
+                    or draft.base_revision >= revision
+                ):
+                    # the draft has been rewritten or reread since
+                    tmp.unlink()
+                    return
+                try:
+                    self._write_base(metadata_path, draft, data, revision, tmp)
+                except Exception:
+                    draft.fingerprint = None
+                    raise
+                finally:
+                    tmp.unlink(missing_ok=True)
+            writer.WRITER.record("draft_compaction", time.monotonic() - start)
+        except Exception as exc:
+            logger.error(f"Error compacting draft for {metadata_path}: {exc}")
+        finally:
+            draft.compacting = False
+
+    @contextmanager
+    def changing(self, metadata_path, revision=None):
+        """Hold a draft while making changes which go with a patch to it.
+
+        Yields the draft's document, and a function which applies JSON Patch
+        operations to it, returning its new revision. The draft is locked
+        throughout, so if revision is given and the draft is no longer at
+        that revision, RevisionConflict is raised before anything, such as
+        renaming an output's files, is changed.
+        """
+        draft = self.get(metadata_path)
+        with draft.lock:
+            if revision is not None and int(revision) != draft.revision:
+                raise RevisionConflict(revision=draft.revision)
+            yield draft.document, partial(self._patch, metadata_path, draft)
+
+    def patch(self, metadata_path, operations, revision=None):
+        """Apply JSON Patch operations to a draft, returning its new revision.
+
+        If revision is given and the draft is no longer at that revision,
+        nothing is changed and RevisionConflict is raised.
+        """
+        with self.changing(metadata_path, revision) as (_, patch):
+            return patch(operations)
+
+    def _patch(self, metadata_path, draft, operations):
+        """Apply operations to a draft. Must be called with draft.lock held."""
+        jsonpatch.apply(draft.document, operations)
+        draft.revision += 1
+
+        if draft.source != draft_path(metadata_path):
+            # the first change, so there is no draft file to journal yet
+            self._compact(metadata_path, draft)
+            return draft.revision
+
+        entry = {"revision": draft.revision, "operations": operations}
+        try:
+            self._append(metadata_path, draft, entry)
+        except Exception:
+            draft.fingerprint = None
+            raise
+
+        if (
+            draft.journalled_operations >= settings.DRAFT_COMPACT_OPERATIONS
+            and not draft.compacting
+        ):
+            draft.compacting = True
+            BACKGROUND.submit(self._compact_in_background, metadata_path, draft)
+
+        return draft.revision
+
+    def replace(self, metadata_path, document):
+        """Replace a draft with a whole new document, returning its new revision"""
+        draft = self.get(metadata_path)
+        with draft.lock:
+            draft.document = document
+            draft.revision += 1
+            self._compact(metadata_path, draft)
+            return draft.revision
+
+
+DRAFTS = DraftStore()
@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+
+
+# the receive channel of the request being handled, which Django does not
+# pass on to send_response
+RECEIVE = contextvars.ContextVar("receive", default=None)
+
+
+async def wait_for_disconnect(receive):
+    """Return once the client has disconnected"""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGI handler which generates streaming responses in a worker thread.
+
+    Django 4.1 iterates streaming responses on the event loop, so while a long
+    response such as a release zipfile is being generated no other request
+    could be served. Here each part is generated in a thread, and the event
+    loop is only used to send it.
+
+    Django 4.1 also carries on generating a streaming response after the
+    client has gone. Here the response is closed as soon as the client
+    disconnects, once the part being generated is ready, so nothing more is
+    generated for nobody.
+    """
+
+    async def handle(self, scope, receive, send):
+        token = RECEIVE.set(receive)
+        try:
+            await super().handle(scope, receive, send)
+        finally:
+            RECEIVE.reset(token)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # as ASGIHandler.send_response, preserving header case
+        response_headers = [
+            (header.encode("ascii"), value.encode("latin1"))
+            for header, value in response.items()
+        ]
+        for c in response.cookies.values():
+            response_headers.append(
+                (b"Set-Cookie", c.output(header="").encode("ascii").strip())
+            )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": response_headers,
+            }
+        )
+
+        if (receive := RECEIVE.get()) is not None:
+            disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        else:
+            disconnected = asyncio.get_running_loop().create_future()
+
+        parts = iter(response)
+        done = object()
+        next_part = sync_to_async(next, thread_sensitive=False)
+        try:
+            while True:
+                part = asyncio.ensure_future(next_part(parts, done))
+                await asyncio.wait(
+                    {part, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected.done():
+                    # the generator cannot be closed while it is running
+                    await asyncio.wait({part})
+                    break
+                if (part := part.result()) is done:
+                    await send({"type": "http.response.body"})
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+        finally:
+            disconnected.cancel()
+
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,173 @@
+"""A minimal JSON Patch (RFC 6902) implementation.
+
+Patches are applied in place, so that a small edit to a large document costs
+only as much as the edit. They are still atomic: if any operation fails, the
+ones before it are undone before the error is raised.
+"""
+import copy
+
+
+class PatchError(Exception):
+    pass
+
+
+def parse_pointer(pointer):
+    """Split a JSON Pointer (RFC 6901) into its unescaped reference tokens"""
+    if not isinstance(pointer, str):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [
+        token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")
+    ]
+
+
+def pointer(*tokens):
+    """Build a JSON Pointer from unescaped reference tokens"""
+    return "".join(
+        "/" + str(token).replace("~", "~0").replace("/", "~1") for token in tokens
+    )
+
+
+def _index(container, token, *, appending=False):
+    """Convert token to an index into list container"""
+    if appending and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    limit = len(container) if appending else len(container) - 1
+    if index > limit:
+        raise PatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document, tokens):
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise PatchError(f"Path not found: {token!r}")
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_index(document, token)]
+        else:
+            raise PatchError(f"Cannot index into {type(document).__name__}")
+    return document
+
+
+def _parent(document, pointer):
+    tokens = parse_pointer(pointer)
+    if not tokens:
+        raise PatchError("Cannot modify the document root")
+    parent = _resolve(document, tokens[:-1])
+    if not isinstance(parent, dict | list):
+        raise PatchError(f"Cannot index into {type(parent).__name__}")
+    return parent, tokens[-1]
+
+
+def _add(document, pointer, value):
+    """Add value at pointer, returning a function which undoes it"""
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, list):
+        index = _index(parent, token, appending=True)
+        parent.insert(index, value)
+        return lambda: parent.pop(index)
+
+    if token in parent:
+        previous = parent[token]
+        parent[token] = value
+        return lambda: parent.__setitem__(token, previous)
+
+    parent[token] = value
+    return lambda: parent.pop(token)
+
+
+def _remove(document, pointer):
+    """Remove the value at pointer, returning it and a function to undo it"""
+    parent, token = _parent(document, pointer)
+    if isinstance(parent, list):
+        index = _index(parent, token)
+        value = parent.pop(index)
+        return value, lambda: parent.insert(index, value)
+
+    if token not in parent:
+        raise PatchError(f"Path not found: {pointer!r}")
+    value = parent.pop(token)
+    return value, lambda: parent.__setitem__(token, value)
+
+
+def _apply(document, operation):
+    """Apply a single operation, returning a list of functions to undo it"""
+    try:
+        op = operation["op"]
+        path = operation["path"]
+    except (KeyError, TypeError):
+        raise PatchError(f"Invalid operation: {operation!r}")
+
+    def value():
+        if "value" not in operation:
+            raise PatchError(f"Missing value for {op} operation")
+        return operation["value"]
+
+    def source():
+        if "from" not in operation:
+            raise PatchError(f"Missing from for {op} operation")
+        return operation["from"]
+
+    if op == "add":
+        return [_add(document, path, value())]
+
+    if op == "remove":
+        _, undo = _remove(document, path)
+        return [undo]
+
+    if op == "replace":
+        new = value()
+        _, undo_remove = _remove(document, path)
+        return [undo_remove, _add(document, path, new)]
+
+    if op == "move":
+        start = source()
+        if path != start and path.startswith(start + "/"):
+            raise PatchError(f"Cannot move {start!r} into its own child")
+        moved, undo_remove = _remove(document, start)
+        try:
+            return [undo_remove, _add(document, path, moved)]
+        except PatchError:
+            undo_remove()
+            raise
+
+    if op == "copy":
+        copied = copy.deepcopy(_resolve(document, parse_pointer(source())))
+        return [_add(document, path, copied)]
+
+    if op == "test":
+        expected = value()
+        if _resolve(document, parse_pointer(path)) != expected:
+            raise PatchError(f"Test failed at {path!r}")
+        return []
+
+    raise PatchError(f"Unknown operation: {op!r}")
+
+
+def apply(document, operations):
+    """Apply a list of JSON Patch operations to document, in place.
+
+    Either every operation is applied, or PatchError is raised and document is
+    left as it was.
+    """
+    if not isinstance(operations, list):
+        raise PatchError("A patch must be a list of operations")
+
+    undo = []
+    try:
+        for operation in operations:
+            undo.extend(_apply(document, operation))
+    except PatchError:
+        for step in reversed(undo):
+            step()
+        raise
+
+    return document
@@ -1,11 +1,38 @@
 import hashlib
 import json
+import logging
+import os
+import threading
 from collections import defaultdict
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 
-from sacro import utils, versioning
+from django.conf import settings
+from django.urls import reverse
+
+from sacro import cache, checksums, utils, versioning, writer
+
+
+logger = logging.getLogger(__name__)
+
+
+# how much of a json file to look at when sniffing for ACRO metadata
+SNIFF_HEAD_BYTES = 4096
+# ACRO metadata is small; anything bigger than this is assumed to be data
+SNIFF_MAX_BYTES = 64 * 1024 * 1024
+# cell flag bitmasks are sent to the browser as json numbers, which are only
+# exact up to 2**53
+MAX_CELL_FLAGS = 53
+
+SCAFFOLD_COMMENT = (
+    "This non-ACRO output metadata was auto generated the SACRO Viewer application"
+)
+# marks metadata generated by scaffold_acro_metadata, so it is updated even
+# before it has any results
+SCAFFOLD_KEY = "sacro_scaffolded"
+# serialises scaffolding, so concurrent requests do not race to update metadata
+SCAFFOLD_LOCK = threading.Lock()
 
 
 class MultipleACROFiles(Exception):
@@ -19,17 +46,14 @@ def find_acro_metadata(dirpath):
 
     if default.exists():
         path = default
+        # pick up any changes to a directory we scaffolded previously
+        scaffold_acro_metadata(default)
     elif len(json_files) == 1:
         path = dirpath / json_files[0]
     else:
-        valid_jsons = []
-        for jf in json_files:
-            try:
-                ACROOutputs(dirpath / jf)
-            except ACROOutputs.InvalidFile:
-                pass
-            else:
-                valid_jsons.append(dirpath / jf)
+        valid_jsons = [
+            dirpath / jf for jf in json_files if sniff_acro_metadata(dirpath / jf)
+        ]
         if len(valid_jsons) == 1:
             path = valid_jsons[0]
         elif len(valid_jsons) > 1:
@@ -46,48 +70,212 @@ def find_acro_metadata(dirpath):
     return path
 
 
+def validate_acro_metadata(raw_metadata):
+    """Super basic structural validation of parsed ACRO metadata.
+
+    Raises AssertionError if it is not valid.
+    """
+    assert isinstance(raw_metadata, dict), "not a json object"
+    assert "version" in raw_metadata
+    assert "results" in raw_metadata
+    assert isinstance(raw_metadata["results"], dict), "results is not an object"
+    for result in raw_metadata["results"].values():
+        assert "files" in result
+        assert len(result["files"]) > 0
+        for filedata in result["files"]:
+            assert "name" in filedata
+            cells = filedata.get("sdc", {}).get("cells", {})
+            assert (
+                len(cells) <= MAX_CELL_FLAGS
+            ), f"{filedata['name']} has more than {MAX_CELL_FLAGS} kinds of cell flag"
+
+
+def sniff_acro_metadata(path):
+    """Cheaply decide whether the json file at path is ACRO metadata.
+
+    Only the top level structure is checked: no config is read and no output
+    files are hashed. Files that do not start with a json object, or are
+    bigger than SNIFF_MAX_BYTES, are rejected without being parsed, so large
+    json data outputs stored alongside the metadata are skipped quickly.
+    """
+    try:
+        with path.open("rb") as f:
+            head = f.read(SNIFF_HEAD_BYTES).lstrip()
+            if not head.startswith(b"{"):
+                return False
+            if os.fstat(f.fileno()).st_size > SNIFF_MAX_BYTES:
+                return False
+            f.seek(0)
+            raw_metadata = json.load(f)
+        validate_acro_metadata(raw_metadata)
+    except (OSError, ValueError, AssertionError):
+        return False
+    return True
+
+
+def is_scaffolded(result):
+    """Was this result auto generated by scaffold_acro_metadata?"""
+    return SCAFFOLD_COMMENT in (result.get("comments") or [])
+
+
+def is_scaffolded_metadata(metadata):
+    """Was this metadata, or any of its results, generated by scaffolding?"""
+    return metadata.get(SCAFFOLD_KEY) is True or any(
+        map(is_scaffolded, metadata["results"].values())
+    )
+
+
+def scaffold_output(output):
+    uid = output.name
+    return {
+        "uid": uid,
+        "files": [{"name": output.name}],
+        "status": "review",
+        "type": "custom",
+        "properties": {},
+        "outcome": {},
+        "command": "custom",
+        "summary": "review",
+        "exception": None,
+        "timestamp": file_timestamp(output),
+        "comments": [SCAFFOLD_COMMENT],
+    }
+
+
+def file_timestamp(path):
+    return datetime.fromtimestamp(path.stat().st_mtime).isoformat()
+
+
 def scaffold_acro_metadata(path):
+    """Generate ACRO metadata at path for a directory of non-ACRO outputs.
+
+    If path already holds metadata we generated, it is updated incrementally:
+    files new to the directory get a result of their own, changed files get a
+    new timestamp, and results whose files have all gone are dropped. Results
+    are matched to files by the files' names, so results the researcher has
+    renamed or commented on are kept as they are. Results that were not
+    generated by us are left alone, and metadata we did not generate is not
+    touched.
+
+    Checksums are only recorded for new files, which are hashed in parallel.
+    A changed file keeps the checksum it was first seen with, so it fails
+    verification rather than being quietly accepted.
+    """
     dirpath = path.parent
     checksums_dir = dirpath / "checksums"
-    metadata = {
-        "version": "0.4.0",
-        "results": {},
-    }
 
-    for output in dirpath.glob("*"):
-        if output.is_dir():
-            continue
-        uid = output.name
-        if uid.startswith("."):
-            continue
-        metadata["results"][uid] = {
-            "uid": uid,
-            "files": [{"name": output.name}],
-            "status": "review",
-            "type": "custom",
-            "properties": {},
-            "outcome": {},
-            "command": "custom",
-            "summary": "review",
-            "exception": None,
-            "timestamp": datetime.fromtimestamp(output.stat().st_mtime).isoformat(),
-            "comments": [
-                "This non-ACRO output metadata was auto generated the SACRO Viewer application",
-            ],
+    with SCAFFOLD_LOCK:
+        # build on any write to it which is still pending
+        writer.WRITER.flush(path)
+        if path.exists():
+            metadata = json.loads(path.read_text())
+            if not is_scaffolded_metadata(metadata):
+                # real ACRO metadata
+                return
+            changed = False
+        else:
+            metadata = {
+                "version": "0.4.0",
+                SCAFFOLD_KEY: True,
+                "results": {},
+            }
+            changed = True
+        results = metadata["results"]
+
+        # the result each file belongs to, whoever generated it
+        owners = {
+            file_info.get("name"): uid
+            for uid, result in results.items()
+            for file_info in result.get("files", [])
         }
 
-        # Write the checksums at the time of first looking at the directory
-        # This is a bit of a hack. Ideally, we'd find a way to disable checksums in such cases
         checksums_dir.mkdir(exist_ok=True)
-        checksum_path = checksums_dir / (output.name + ".txt")
-        checksum_path.write_text(hashlib.sha256(output.read_bytes()).hexdigest())
+        index = checksums.VerifiedIndex(checksums_dir)
+
+        # the files of our results, and any new files
+        existing = {}
+        new = {}
+        for output in dirpath.glob("*"):
+            name = output.name
+            if output.is_dir() or name.startswith(".") or output == path:
+                continue
+            if name in owners:
+                if is_scaffolded(results[owners[name]]):
+                    existing[name] = output
+            elif name in results:
+                # a result which has been given this name, but not its file
+                continue
+            elif not (output.suffix == ".json" and sniff_acro_metadata(output)):
+                # other metadata, such as a researcher's draft, is not an output
+                new[name] = output
+
+        for uid, result in list(results.items()):
+            names = [file_info.get("name") for file_info in result.get("files", [])]
+            if is_scaffolded(result) and not any(n in existing for n in names):
+                del results[uid]
+                for name in names:
+                    (checksums_dir / f"{name}.txt").unlink(missing_ok=True)
+                changed = True
+
+        for name, output in existing.items():
+            # the researcher's comments, exception and status are kept
+            result = results[owners[name]]
+            if result.get("timestamp") != (timestamp := file_timestamp(output)):
+                result["timestamp"] = timestamp
+                changed = True
+
+        # files already hashed are answered from the index
+        digests = index.digest_many(new.values())
+        for name, output in new.items():
+            # Write the checksums at the time of first looking at the file
+            # This is a bit of a hack. Ideally, we'd find a way to disable checksums in such cases
+            (checksums_dir / f"{name}.txt").write_text(digests[output])
+            results[name] = scaffold_output(output)
+            changed = True
+
+        index.save()
+        if changed:
+            data = json.dumps(metadata, indent=2).encode()
+            writer.WRITER.write_now(path, data, "scaffold")
+
+
+def build_cell_index(cells):
+    """Build a compact, columnar index of the SDC flags raised on table cells.
+
+    cells is ACRO's {flag: [[row, col], ...]} mapping. The index has one entry
+    per flagged cell, sorted by (row, col), stored as parallel integer lists.
+    Each cell's flags are packed into a bitmask, where bit i is set if
+    flags[i] was raised on that cell.
+    """
+    flags = list(cells)
+    masks = defaultdict(int)
+    for bit, flag in enumerate(flags):
+        for x, y in cells[flag]:
+            masks[(x, y)] |= 1 << bit
+
+    keys = sorted(masks)
+    return {
+        "flags": flags,
+        "rows": [x for x, _ in keys],
+        "cols": [y for _, y in keys],
+        "masks": [masks[key] for key in keys],
+    }
 
-    path.write_text(json.dumps(metadata, indent=2))
 
+def load_from_path(path, force_verify=False):
+    """Use outputs path from request and load it
 
-def load_from_path(path):
-    """Use outputs path from request and load it"""
-    outputs = ACROOutputs(path)
+    If force_verify is set, every output file is rehashed rather than trusting
+    the checksum index, and the result bypasses the outputs cache.
+    """
+    # make sure we read any metadata we are about to write
+    writer.WRITER.flush(path)
+
+    if force_verify:
+        OUTPUTS_CACHE.invalidate(path)
+        outputs = ACROOutputs(path, force_verify=True)
+    else:
+        outputs = OUTPUTS_CACHE.get(path)
 
     versioning.check_version(outputs.version)
 
@@ -104,23 +292,22 @@ class ACROOutputs(dict):
     path: Path
     version: str = None
     config: dict = field(default_factory=dict)
+    force_verify: bool = None
+    lazy_verify: bool = None
 
     def __post_init__(self):
+        if self.force_verify is None:
+            self.force_verify = settings.CHECKSUM_FORCE_VERIFY
+        if self.lazy_verify is None:
+            self.lazy_verify = settings.CHECKSUM_LAZY
+        self.verification = None
         self.raw_metadata = json.loads(self.path.read_text())
         config_path = self.path.parent / "config.json"
         if config_path.exists():
             self.config = json.loads(config_path.read_text())
 
-        # super basic structural validation
         try:
-            assert "version" in self.raw_metadata
-            assert "results" in self.raw_metadata
-            for result in self.raw_metadata["results"].values():
-                assert "files" in result
-                assert len(result["files"]) > 0
-                for filedata in result["files"]:
-                    assert "name" in filedata
-
+            validate_acro_metadata(self.raw_metadata)
         except AssertionError as exc:
             raise self.InvalidFile(f"{self.path} is not a valid ACRO json file: {exc}")
 
@@ -131,21 +318,28 @@ class ACROOutputs(dict):
     def annotate(self):
         """Add various useful annotations to the JSON data"""
 
-        # add urls to JSON data
+        # add urls to JSON data. The route and path are the same for every
+        # file, so only resolve and encode them once.
+        path_param = utils.encode_param("path", str(self.path))
+        url_prefix = reverse("contents") + "?" + path_param
+        table_url_prefix = reverse("contents-table") + "?" + path_param
         for output, metadata in self.items():
+            output_param = utils.encode_param("output", output)
             for filedata in metadata["files"]:
-                filedata["url"] = utils.reverse_with_params(
-                    {
-                        "path": str(self.path),
-                        "output": output,
-                        "filename": filedata["name"],
-                    },
-                    "contents",
+                params = (
+                    output_param
+                    + "&"
+                    + utils.encode_param("filename", filedata["name"])
                 )
+                filedata["url"] = url_prefix + "&" + params
+                if filedata["name"].lower().endswith(".csv"):
+                    # windows of rows from the parsed table
+                    filedata["table_url"] = table_url_prefix + "&" + params
 
         # add and check checksum data, and transform cell data to more useful format
         checksums_dir = self.path.parent / "checksums"
         checksums_dir.mkdir(exist_ok=True)
+        to_verify = []
         for output, metadata in self.items():
             for filedata in metadata["files"]:
                 # checksums
@@ -162,19 +356,134 @@ class ACROOutputs(dict):
                 if not actual_file.exists():  # pragma: nocover
                     continue
 
-                checksum = hashlib.sha256(actual_file.read_bytes()).hexdigest()
-                filedata["checksum_valid"] = checksum == filedata["checksum"]
+                to_verify.append((filedata, actual_file))
 
                 # cells
                 cells = filedata.get("sdc", {}).get("cells", {})
-                cell_index = defaultdict(list)
+                filedata["cell_index"] = build_cell_index(cells)
+
+        index = checksums.VerifiedIndex(checksums_dir)
+        if self.lazy_verify:
+            # answer from the index where we can, and hash everything else
+            # in the background, marking it pending until it is done
+            pending = defaultdict(list)
+            for filedata, actual_file in to_verify:
+                digest = index.lookup(actual_file, force=self.force_verify)
+                if digest is None:
+                    filedata["checksum_valid"] = "pending"
+                    pending[actual_file].append(filedata)
+                else:
+                    filedata["checksum_valid"] = digest == filedata["checksum"]
+
+            if pending:
+                self.verification = checksums.BACKGROUND.submit(
+                    self._verify_pending, index, pending
+                )
+            return
+
+        # hash all the files together, so that it can be done in parallel
+        digests = index.digest_many(
+            [actual_file for _, actual_file in to_verify], force=self.force_verify
+        )
+        for filedata, actual_file in to_verify:
+            filedata["checksum_valid"] = digests[actual_file] == filedata["checksum"]
+        index.save()
 
-                for flag, indicies in cells.items():
-                    for x, y in indicies:
-                        key = f"{x},{y}"
-                        cell_index[key].append(flag)
+    def _verify_pending(self, index, pending):
+        """Hash pending files, updating their checksum_valid as each completes"""
 
-                filedata["cell_index"] = cell_index
+        def record(path, digest):
+            for filedata in pending[path]:
+                filedata["checksum_valid"] = digest == filedata["checksum"]
+
+        try:
+            index.digest_many(list(pending), force=self.force_verify, on_digest=record)
+        except OSError as exc:
+            logger.warning(f"checksum verification failed for {self.path}: {exc}")
+            for filedatas in pending.values():
+                for filedata in filedatas:
+                    if filedata["checksum_valid"] == "pending":
+                        filedata["checksum_valid"] = False
+        index.save()
+
+    def reverify(self, filenames):
+        """Recheck the checksums of the named output files after they changed.
+
+        Returns the names of the outputs that include any of them.
+        """
+        checksums_dir = self.path.parent / "checksums"
+        index = checksums.VerifiedIndex(checksums_dir)
+        affected = set()
+        for output, metadata in self.items():
+            for filedata in metadata["files"]:
+                if filedata["name"] not in filenames:
+                    continue
+                affected.add(output)
+
+                filedata["checksum_valid"] = False
+                filedata["checksum"] = None
+
+                path = checksums_dir / (filedata["name"] + ".txt")
+                if not path.exists():
+                    continue
+
+                filedata["checksum"] = path.read_text(encoding="utf8")
+                actual_file = self.get_file_path(output, filedata["name"])
+                if not actual_file.exists():
+                    continue
+
+                digest = index.digest(actual_file, force=self.force_verify)
+                filedata["checksum_valid"] = digest == filedata["checksum"]
+
+        index.save()
+        return affected
+
+    @property
+    def verification_complete(self):
+        return self.verification is None or self.verification.done()
+
+    def digest(self):
+        """SHA-256 digest of what a reviewer decides on.
+
+        That is each output's status, and the name and recorded checksum of
+        each of its files. Whether the checksums have been verified yet is left
+        out, so the digest is the same before and after lazy verification.
+        """
+        reviewed = {
+            name: {
+                "status": metadata.get("status"),
+                "files": [
+                    [filedata["name"], filedata.get("checksum")]
+                    for filedata in metadata["files"]
+                ],
+            }
+            for name, metadata in self.items()
+        }
+        return hashlib.sha256(json.dumps(reviewed, sort_keys=True).encode()).hexdigest()
+
+    def summary(self):
+        """Just enough metadata for each output to render the output list.
+
+        The full metadata is fetched page by page, or per output, from the
+        outputs-metadata endpoint instead.
+        """
+        return {
+            name: {
+                "status": metadata.get("status"),
+                "type": metadata.get("type"),
+                "properties": {
+                    "method": (metadata.get("properties") or {}).get("method")
+                },
+                "files": [
+                    {
+                        "name": filedata["name"],
+                        "checksum_valid": filedata.get("checksum_valid"),
+                    }
+                    for filedata in metadata["files"]
+                ],
+            }
+            for name, metadata in self.items()
+        }
 
     def get_file_path(self, output, filename):
         """Return absolute path to output file"""
@@ -191,3 +500,6 @@ class ACROOutputs(dict):
         self.clear()
         self.version = None
         self.__post_init__()
+
+
+OUTPUTS_CACHE = cache.OutputsCache(ACROOutputs)
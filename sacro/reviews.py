@@ -0,0 +1,104 @@
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    decisions TEXT NOT NULL,
+    metadata_digest TEXT NOT NULL,
+    created TEXT NOT NULL
+)
+"""
+
+
+class ReviewStore:
+    """Submitted reviews, kept in SQLite so they survive a restart.
+
+    Each review has its own id, so several directories can be under review at
+    once. A review records the path of the metadata reviewed, the overall
+    comment, the decision on each output, and the digest of the outputs as
+    they were reviewed (see ACROOutputs.digest).
+    """
+
+    def __init__(self, path=None):
+        self._path = path
+        self._lock = threading.Lock()
+        self._initialised = set()
+
+    @property
+    def path(self):
+        if self._path is not None:
+            return Path(self._path)
+        return Path(settings.REVIEW_STORE_PATH)
+
+    def _connect(self):
+        path = self.path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(path)
+        connection.row_factory = sqlite3.Row
+        with self._lock:
+            if path not in self._initialised:
+                with connection:
+                    connection.execute(SCHEMA)
+                self._initialised.add(path)
+        return connection
+
+    def create(self, path, comment, decisions, metadata_digest):
+        """Store a new review, returning its id"""
+        pk = uuid.uuid4().hex
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT INTO reviews VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        pk,
+                        str(Path(path).resolve()),
+                        comment,
+                        json.dumps(decisions),
+                        metadata_digest,
+                        datetime.now(timezone.utc).isoformat(),
+                    ),
+                )
+        finally:
+            connection.close()
+        logger.info(f"stored review {pk} of {path}")
+        return pk
+
+    def get(self, pk):
+        """Return the review with id pk, or None"""
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                "SELECT * FROM reviews WHERE id = ?", (pk,)
+            ).fetchone()
+        finally:
+            connection.close()
+
+        if row is None:
+            return None
+
+        return {
+            "id": row["id"],
+            "path": Path(row["path"]),
+            "comment": row["comment"],
+            "decisions": json.loads(row["decisions"]),
+            "metadata_digest": row["metadata_digest"],
+            "created": row["created"],
+        }
+
+
+REVIEWS = ReviewStore()
@@ -14,7 +14,7 @@ from pathlib import Path
 
 from environs import Env
 
-from .logging import logging_config_dict
+from .logging import get_appdir, logging_config_dict
 
 
 env = Env()
@@ -176,3 +176,69 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedStaticFilesStorage"
 
 # PROJECT SETTINGS
 ACRO_SUPPORTED_VERSION = "0.4.x"
+
+# Approximate memory budget for the in-process cache of loaded ACRO outputs
+OUTPUTS_CACHE_MAX_BYTES = env.int(
+    "SACRO_OUTPUTS_CACHE_MAX_BYTES", default=256 * 1024 * 1024
+)
+
+# Ignore the persisted checksum index and rehash every output file on load
+CHECKSUM_FORCE_VERIFY = env.bool("SACRO_CHECKSUM_FORCE_VERIFY", default=False)
+
+# Number of threads used to hash output files when verifying checksums
+CHECKSUM_WORKERS = env.int(
+    "SACRO_CHECKSUM_WORKERS", default=min(32, (os.cpu_count() or 1) + 4)
+)
+
+# Render pages straight away, verifying uncached checksums in the background
+CHECKSUM_LAZY = env.bool("SACRO_CHECKSUM_LAZY", default=False)
+
+# How to watch loaded output directories for changes: "inotify" (Linux only),
+# "poll", or "auto" to use inotify where available and poll otherwise
+WATCH_BACKEND = env.str("SACRO_WATCH_BACKEND", default="auto")
+
+# Seconds between directory scans when polling, and between SSE heartbeats
+WATCH_POLL_INTERVAL = env.float("SACRO_WATCH_POLL_INTERVAL", default=1.0)
+WATCH_HEARTBEAT_INTERVAL = env.float("SACRO_WATCH_HEARTBEAT_INTERVAL", default=15.0)
+
+# Approximate memory budget for the in-process cache of parsed CSV outputs
+TABLE_CACHE_MAX_BYTES = env.int("SACRO_TABLE_CACHE_MAX_BYTES", default=64 * 1024 * 1024)
+
+# Number of threads used to compress outputs when building a release zipfile,
+# and the zlib level (1-9) they use
+RELEASE_COMPRESSION_WORKERS = env.int(
+    "SACRO_RELEASE_COMPRESSION_WORKERS", default=min(8, os.cpu_count() or 1)
+)
+RELEASE_COMPRESSION_LEVEL = env.int("SACRO_RELEASE_COMPRESSION_LEVEL", default=6)
+
+# How far reading output files for a release may get ahead of writing them, so
+# the compression threads are kept busy, in bytes
+RELEASE_READ_AHEAD_BYTES = env.int(
+    "SACRO_RELEASE_READ_AHEAD_BYTES", default=64 * 1024 * 1024
+)
+
+# Where built release zipfiles are kept, so downloading the same release again
+# does not rebuild it, and the approximate disk budget for them. This is per
+# user, as anything in it may be released
+RELEASE_CACHE_DIR = env.path(
+    "SACRO_RELEASE_CACHE_DIR", default=Path(get_appdir()) / "SACRO" / "releases"
+)
+RELEASE_CACHE_MAX_BYTES = env.int(
+    "SACRO_RELEASE_CACHE_MAX_BYTES", default=1024 * 1024 * 1024
+)
+
+# SQLite database holding submitted reviews
+REVIEW_STORE_PATH = env.path(
+    "SACRO_REVIEW_STORE_PATH", default=Path(get_appdir()) / "SACRO" / "reviews.sqlite3"
+)
+
+# Researchers' changes to a draft are appended to a journal, and compacted into
+# the draft's results.json once this many operations have built up
+DRAFT_COMPACT_OPERATIONS = env.int("SACRO_DRAFT_COMPACT_OPERATIONS", default=100)
+
+# Seconds to hold metadata writes for, so a burst of writes to the same file
+# is written once. 0 writes straight away
+METADATA_WRITE_DELAY = env.float("SACRO_METADATA_WRITE_DELAY", default=0.5)
+
+# The most files that can be added in one request to researcher-add-outputs
+DATA_UPLOAD_MAX_NUMBER_FILES = env.int("SACRO_MAX_UPLOAD_FILES", default=1000)
@@ -0,0 +1,130 @@
+import bisect
+import csv
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro.cache import stat_fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_csv(path):
+    """Parse a CSV file into its header row and a list of body rows"""
+    with open(path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = list(reader)
+    return header, rows
+
+
+# how many rows of a table to measure when estimating its size
+SIZE_SAMPLE_ROWS = 1000
+
+
+def row_size(row):
+    return sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+
+
+def table_size(table):
+    """Estimate the memory taken by a parsed table, in bytes.
+
+    Every row is a list of str objects, which together take many times the
+    size of the file they were parsed from. Large tables are estimated from a
+    sample of evenly spaced rows, rather than measuring every cell.
+    """
+    header, rows = table
+    size = sys.getsizeof(rows) + row_size(header)
+    if rows:
+        sample = rows[:: max(1, len(rows) // SIZE_SAMPLE_ROWS)]
+        size += round(sum(map(row_size, sample)) * len(rows) / len(sample))
+    return size
+
+
+class TableCache:
+    """Process-wide LRU cache of parsed CSV files.
+
+    Entries are keyed by resolved path and stat fingerprint, so an edited file
+    is parsed again. Each entry is weighted by table_size, an estimate of the
+    memory its parsed rows take, so the budget bounds the memory used.
+    """
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.TABLE_CACHE_MAX_BYTES
+
+    def get(self, path):
+        """Return (header, rows) for the CSV file at path"""
+        path = Path(path).resolve()
+        fingerprint = stat_fingerprint(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                self._entries.move_to_end(path)
+                return entry["table"]
+
+        table = parse_csv(path)
+
+        with self._lock:
+            self._entries[path] = {
+                "fingerprint": fingerprint,
+                "table": table,
+                "weight": table_size(table),
+            }
+            self._entries.move_to_end(path)
+            # always keep the most recent entry, even if it alone is over budget
+            while len(self._entries) > 1 and self.size > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug(f"evicted {evicted} from table cache")
+
+        return table
+
+    @property
+    def size(self):
+        return sum(entry["weight"] for entry in self._entries.values())
+
+
+def cells_in_window(cell_index, offset, limit):
+    """The part of a cell index covering body rows [offset, offset + limit).
+
+    The index is sorted by row, so the window is found by bisection rather than
+    by scanning every flagged cell.
+    """
+    rows = cell_index["rows"]
+    start = bisect.bisect_left(rows, offset)
+    end = bisect.bisect_left(rows, offset + limit)
+    return {
+        "flags": cell_index["flags"],
+        "rows": rows[start:end],
+        "cols": cell_index["cols"][start:end],
+        "masks": cell_index["masks"][start:end],
+    }
+
+
+def window(path, offset, limit, cell_index):
+    """A window of body rows from the CSV file at path, with its flagged cells"""
+    header, rows = TABLES.get(path)
+    return {
+        "header": header,
+        "total": len(rows),
+        "offset": offset,
+        "limit": limit,
+        "rows": rows[offset : offset + limit],
+        "cells": cells_in_window(cell_index, offset, limit),
+    }
+
+
+TABLES = TableCache()
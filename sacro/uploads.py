@@ -0,0 +1,238 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro.checksums import CHUNK_SIZE, sha256_file
+
+
+logger = logging.getLogger(__name__)
+
+# where uploads in progress are kept, in the outputs directory. Hidden
+# directories are not scanned for outputs.
+UPLOADS_DIR = ".uploads"
+
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, *args, offset, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.offset = offset
+
+    def __str__(self):
+        return f"The upload is at offset {self.offset}. Please resume from there."
+
+
+class FileExists(UploadError):
+    def __init__(self, path):
+        super().__init__(f"{Path(path).name} is already in the outputs directory")
+
+
+def write_hashed(chunks, path):
+    """Write chunks to path, returning the hex SHA-256 digest of what was written.
+
+    The data is hashed as it is written, rather than read back afterwards. An
+    existing file at path is never overwritten: FileExists is raised instead.
+    """
+    digest = hashlib.sha256()
+    try:
+        f = open(path, "xb")
+    except FileExistsError:
+        raise FileExists(path) from None
+    with f:
+        for chunk in chunks:
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def copy_hashed(source, path):
+    """Copy the file at source to path, returning its hex SHA-256 digest"""
+    if Path(source).resolve() == Path(path).resolve():
+        return sha256_file(path)
+    with open(source, "rb") as f:
+        return write_hashed(iter(lambda: f.read(CHUNK_SIZE), b""), path)
+
+
+def write_many(writes, workers=None):
+    """Make many writes at once, returning the digest each one returns.
+
+    writes maps names to functions, such as write_hashed or copy_hashed with
+    their arguments bound, which write a file and return its digest. They are
+    run in a pool of CHECKSUM_WORKERS threads.
+    """
+    if workers is None:
+        workers = settings.CHECKSUM_WORKERS
+    with ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="sacro-uploads"
+    ) as pool:
+        futures = {name: pool.submit(write) for name, write in writes.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+@dataclass
+class Upload:
+    upload_id: str
+    directory: Path
+    filename: str
+    size: int
+    offset: int = 0
+    # the digest of the first offset bytes, updated as chunks are written
+    digest: object = field(default_factory=hashlib.sha256, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def part_path(self):
+        return self.directory / UPLOADS_DIR / f"{self.upload_id}.part"
+
+    @property
+    def state_path(self):
+        return self.directory / UPLOADS_DIR / f"{self.upload_id}.json"
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+
+class UploadStore:
+    """Resumable uploads of output files, sent as a series of chunks.
+
+    An upload is started with the name and size of the file, and its chunks
+    are then written at increasing offsets. If a chunk is lost, eg to a
+    dropped connection, the client asks for the current offset and carries
+    on from there. Once every byte has arrived, the upload is committed,
+    which moves it into the outputs directory.
+
+    Chunks are hashed as they are written, so committing does not read the
+    file again. Uploads are kept in the outputs directory, so they can be
+    resumed after a restart, at the cost of rehashing what has arrived so far.
+    """
+
+    def __init__(self):
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def start(self, directory, filename, size):
+        """Start uploading a file of size bytes called filename to directory"""
+        directory = Path(directory).resolve()
+        filename = Path(filename).name
+        if not filename or filename.startswith(".") or size < 0:
+            raise UploadError(f"Cannot upload {filename!r} of {size} bytes")
+
+        upload = Upload(secrets.token_hex(16), directory, filename, size)
+        upload.part_path.parent.mkdir(exist_ok=True)
+        upload.part_path.touch()
+        upload.state_path.write_text(json.dumps({"filename": filename, "size": size}))
+
+        with self._lock:
+            self._uploads[(directory, upload.upload_id)] = upload
+        return upload
+
+    def _read(self, directory, upload_id):
+        upload = Upload(upload_id, directory, filename="", size=0)
+        try:
+            state = json.loads(upload.state_path.read_text())
+            upload.filename = state["filename"]
+            upload.size = state["size"]
+            with open(upload.part_path, "rb") as f:
+                while chunk := f.read(CHUNK_SIZE):
+                    upload.digest.update(chunk)
+                    upload.offset += len(chunk)
+        except (OSError, ValueError, KeyError) as exc:
+            raise UploadError(f"Unknown upload {upload_id}") from exc
+        return upload
+
+    def get(self, directory, upload_id):
+        """Return the Upload upload_id to directory"""
+        if not UPLOAD_ID.fullmatch(upload_id):
+            raise UploadError(f"Unknown upload {upload_id}")
+
+        key = (Path(directory).resolve(), upload_id)
+        with self._lock:
+            upload = self._uploads.get(key)
+            if upload is None:
+                upload = self._uploads[key] = self._read(*key)
+            return upload
+
+    def write(self, directory, upload_id, offset, stream):
+        """Write the contents of stream to an upload at offset.
+
+        Returns the upload's new offset. Raises OffsetMismatch if offset is not
+        where the upload is up to. If the chunk cannot be written in full,
+        none of it is kept.
+        """
+        upload = self.get(directory, upload_id)
+        with upload.lock:
+            if offset != upload.offset:
+                raise OffsetMismatch(offset=upload.offset)
+
+            digest = upload.digest.copy()
+            written = 0
+            try:
+                with open(upload.part_path, "r+b") as f:
+                    f.seek(offset)
+                    while chunk := stream.read(CHUNK_SIZE):
+                        written += len(chunk)
+                        if offset + written > upload.size:
+                            raise UploadError(
+                                f"Upload is larger than its size of {upload.size}"
+                            )
+                        digest.update(chunk)
+                        f.write(chunk)
+            except Exception:
+                os.truncate(upload.part_path, offset)
+                raise
+
+            upload.digest = digest
+            upload.offset = offset + written
+            return upload.offset
+
+    def commit(self, directory, upload_id, destination):
+        """Move a completed upload to destination, returning its hex digest.
+
+        An existing file at destination is never overwritten: FileExists is
+        raised instead, and the upload is kept.
+        """
+        upload = self.get(directory, upload_id)
+        with upload.lock:
+            if not upload.complete:
+                raise UploadError(
+                    f"Upload is incomplete: {upload.offset} of {upload.size} bytes"
+                )
+            # unlike a rename, linking fails if destination exists
+            try:
+                os.link(upload.part_path, destination)
+            except FileExistsError:
+                raise FileExists(destination) from None
+            upload.part_path.unlink()
+            self._forget(upload)
+            return upload.digest.hexdigest()
+
+    def discard(self, directory, upload_id):
+        """Abandon an upload, deleting what has been uploaded so far"""
+        upload = self.get(directory, upload_id)
+        with upload.lock:
+            upload.part_path.unlink(missing_ok=True)
+            self._forget(upload)
+
+    def _forget(self, upload):
+        upload.state_path.unlink(missing_ok=True)
+        with self._lock:
+            self._uploads.pop((upload.directory, upload.upload_id), None)
+        logger.info(f"Finished with upload {upload.upload_id} of {upload.filename}")
+
+
+UPLOADS = UploadStore()
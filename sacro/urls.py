@@ -10,7 +10,12 @@ urlpatterns = [
     path("", views.role_selection, name="role-selection"),
     path("checker/", views.index, name="checker"),
     path("load/", views.load, name="load"),
+    path("outputs/", views.outputs_metadata, name="outputs-metadata"),
     path("contents/", views.contents, name="contents"),
+    path("contents/table/", views.contents_table, name="contents-table"),
+    path("checksums/status/", views.checksum_status, name="checksum-status"),
+    path("events/", views.events, name="events"),
+    path("stats/writes/", views.write_stats, name="write-stats"),
     path("error/", errors.error, name="error"),
     path("review/", views.review_create, name="review-create"),
     path("review/<str:pk>/", views.review_detail, name="review-detail"),
@@ -27,6 +32,11 @@ urlpatterns = [
         views.researcher_save_session,
         name="researcher-save-session",
     ),
+    path(
+        "researcher/session/patch/",
+        views.researcher_patch_session,
+        name="researcher-patch-session",
+    ),
     path(
         "researcher/session/load/",
         views.researcher_load_session,
@@ -38,6 +48,21 @@ urlpatterns = [
         views.researcher_add_output,
         name="researcher-add-output",
     ),
+    path(
+        "researcher/outputs/add/",
+        views.researcher_add_outputs,
+        name="researcher-add-outputs",
+    ),
+    path(
+        "researcher/upload/",
+        views.researcher_start_upload,
+        name="researcher-start-upload",
+    ),
+    path(
+        "researcher/upload/<str:upload_id>/",
+        views.researcher_upload,
+        name="researcher-upload",
+    ),
     path(
         "researcher/output/edit/",
         views.researcher_edit_output,
@@ -1,4 +1,4 @@
-from urllib.parse import urlencode
+from urllib.parse import quote_plus, urlencode
 
 from django.urls import reverse
 
@@ -7,3 +7,69 @@ def reverse_with_params(param_dict, *args, **kwargs):
     """Wrapper for django reverse that adds query parameters"""
     url = reverse(*args, **kwargs)
     return url + "?" + urlencode(param_dict)
+
+
+def encode_param(name, value):
+    """Encode a single name=value query parameter, exactly as urlencode does.
+
+    Useful for appending parameters to a prefix built once with
+    reverse_with_params, rather than reversing and encoding the whole URL
+    each time.
+    """
+    return quote_plus(name) + "=" + quote_plus(str(value))
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """Parse a single byte range Range header into an inclusive (start, end).
+
+    Returns None if the header should be ignored, which includes multiple
+    ranges, as the full file is then a valid response. Raises
+    RangeNotSatisfiable if the range lies outside a file of the given size.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first or last):
+        return None
+    if not (first.isdigit() or not first) or not (last.isdigit() or not last):
+        return None
+
+    if not first:
+        # suffix range: the last n bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+class FileRange:
+    """Read-only file-like view of length bytes of f, starting at start"""
+
+    def __init__(self, f, start, length):
+        self.f = f
+        self.f.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
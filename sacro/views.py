@@ -1,28 +1,50 @@
 import getpass
-import hashlib
 import html
 import json
 import logging
+import mimetypes
 import re
+from contextlib import contextmanager
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.http import (
     FileResponse,
     Http404,
     HttpResponse,
     HttpResponseBadRequest,
     JsonResponse,
+    StreamingHttpResponse,
 )
 from django.shortcuts import redirect
-from django.template.loader import render_to_string
+from django.template.loader import get_template, render_to_string
 from django.template.response import TemplateResponse
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.http import (
+    require_GET,
+    require_http_methods,
+    require_POST,
+)
 
-from sacro import errors, models, utils
+from sacro import (
+    checksums,
+    drafts,
+    errors,
+    jsonpatch,
+    models,
+    reviews,
+    tables,
+    uploads,
+    utils,
+    watcher,
+    writer,
+)
 from sacro.adapters import local_audit, zipfile
 from sacro.versioning import IncorrectVersionError
 
@@ -30,9 +52,6 @@ from sacro.versioning import IncorrectVersionError
 logger = logging.getLogger(__name__)
 
 
-REVIEWS = {}
-
-
 def _write_reviewer_text_to_results(outputs, review_data):
     """Write reviewer text back to results.json file"""
     try:
@@ -44,10 +63,13 @@ def _write_reviewer_text_to_results(outputs, review_data):
         results_data["review_timestamp"] = datetime.now().isoformat()
         results_data["reviewer"] = getpass.getuser()
 
-        with open(outputs.path, "w") as f:
-            json.dump(results_data, f, indent=2)
+        writer.WRITER.write(
+            outputs.path,
+            json.dumps(results_data, indent=2).encode(),
+            "reviewer_text",
+        )
 
-        logger.info(f"Reviewer text written to {outputs.path}")
+        logger.info(f"Reviewer text queued for {outputs.path}")
 
     except Exception as e:
         logger.error(f"Error writing reviewer text to results.json: {e}")
@@ -100,9 +122,53 @@ def get_filepath_from_request(data, name):
 
 
 def get_outputs_from_request(data):
-    """Use outputs path from request and load it"""
+    """Use outputs path from request and load it
+
+    Passing reverify=1 rehashes every output file, ignoring the checksum index.
+    """
     path = get_filepath_from_request(data, "path")
-    return models.load_from_path(path)
+    return models.load_from_path(path, force_verify=bool(data.get("reverify")))
+
+
+def get_session_from_request(data, outputs):
+    """The researcher's session: as posted in full, or else as held on the server
+
+    The researcher UI only sends its changes, and works on the session held in
+    drafts.DRAFTS. Posting the whole session as session_data replaces it.
+    """
+    if "session_data" in data:
+        return json.loads(data["session_data"])
+    return drafts.DRAFTS.get(outputs.path).document
+
+
+@contextmanager
+def session_changes(data, outputs):
+    """Change the researcher's session, along with any files which go with it
+
+    Yields the session and a function which applies JSON Patch operations to
+    it and saves it, returning its new revision. The session held on the
+    server is locked throughout, and if it is no longer at the posted
+    revision, RevisionConflict is raised before anything is changed.
+    Posting the whole session as session_data replaces it.
+    """
+    if "session_data" in data:
+        session_data = json.loads(data["session_data"])
+
+        def save(operations):
+            jsonpatch.apply(session_data, operations)
+            return drafts.DRAFTS.replace(outputs.path, session_data)
+
+        yield session_data, save
+    else:
+        with drafts.DRAFTS.changing(outputs.path, data.get("revision")) as changing:
+            yield changing
+
+
+def revision_conflict(exc):
+    return JsonResponse(
+        {"success": False, "message": str(exc), "revision": exc.revision},
+        status=409,
+    )
 
 
 @require_GET
@@ -144,25 +210,129 @@ def index(request):
         return errors.error(request, status=500, message=str(e))
 
     create_url = utils.reverse_with_params({"path": str(outputs.path)}, "review-create")
+    checksum_status_url = utils.reverse_with_params(
+        {"path": str(outputs.path)}, "checksum-status"
+    )
+    outputs_metadata_url = utils.reverse_with_params(
+        {"path": str(outputs.path)}, "outputs-metadata"
+    )
+    events_url = utils.reverse_with_params({"path": str(outputs.path)}, "events")
 
     return TemplateResponse(
         request,
         "index.html",
         context={
-            "outputs": dict(outputs),
+            "outputs": outputs.summary(),
             "config": outputs.config,
             "version": outputs.version,
             "create_url": create_url,
+            "checksum_status_url": checksum_status_url,
+            "outputs_metadata_url": outputs_metadata_url,
+            "events_url": events_url,
         },
     )
 
 
+METADATA_PAGE_SIZE = 100
+METADATA_MAX_PAGE_SIZE = 1000
+
+
+def _int_param(data, name, default, maximum=None):
+    try:
+        value = max(int(data.get(name, default)), 0)
+    except ValueError:
+        value = default
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
+@require_GET
+def outputs_metadata(request):
+    """Return a page of full output metadata as JSON.
+
+    Supports offset/limit paging, and filtering by ACRO status, a
+    case-insensitive substring of the output name, or exact output names
+    (name may be repeated).
+    """
+    outputs = get_outputs_from_request(request.GET)
+
+    names = request.GET.getlist("name")
+    status = request.GET.get("status")
+    query = request.GET.get("q", "").lower()
+
+    matching = [
+        name
+        for name, metadata in outputs.items()
+        if (not names or name in names)
+        and (not status or metadata.get("status") == status)
+        and (not query or query in name.lower())
+    ]
+
+    offset = _int_param(request.GET, "offset", 0)
+    limit = _int_param(
+        request.GET, "limit", METADATA_PAGE_SIZE, maximum=METADATA_MAX_PAGE_SIZE
+    )
+    page = matching[offset : offset + limit]
+
+    return JsonResponse(
+        {
+            "total": len(matching),
+            "offset": offset,
+            "limit": limit,
+            "outputs": {name: outputs[name] for name in page},
+        }
+    )
+
+
+TABLE_PAGE_SIZE = 200
+TABLE_MAX_PAGE_SIZE = 5000
+
+
+@require_GET
+def contents_table(request):
+    """Return a window of rows from a CSV output as JSON.
+
+    The file is parsed once and cached, and each request returns the header,
+    the total number of body rows, the rows in the offset/limit window, and
+    the flagged cells from its cell index that fall within it.
+    """
+    outputs = get_outputs_from_request(request.GET)
+    output = request.GET.get("output")
+    filename = request.GET.get("filename")
+
+    try:
+        filedata = next(f for f in outputs[output]["files"] if f["name"] == filename)
+    except (KeyError, StopIteration):
+        raise Http404
+
+    if Path(filename).suffix.lower() != ".csv":
+        return HttpResponseBadRequest(f"{filename} is not a CSV file")
+
+    file_path = outputs.get_file_path(output, filename)
+    if not file_path.exists():  # pragma: no cover
+        raise Http404
+
+    cell_index = filedata.get("cell_index") or models.build_cell_index(
+        filedata.get("sdc", {}).get("cells", {})
+    )
+    offset = _int_param(request.GET, "offset", 0)
+    limit = _int_param(
+        request.GET, "limit", TABLE_PAGE_SIZE, maximum=TABLE_MAX_PAGE_SIZE
+    )
+
+    return JsonResponse(tables.window(file_path, offset, limit, cell_index))
+
+
 @require_GET
 def contents(request):
     """Return file contents.
 
     We also require the json file and check that the requested file is present
     in the json.  This prevents loading arbitrary user files over http.
+
+    Conditional requests are answered with a 304 where possible, and a single
+    byte range with a 206, so clients can seek in large files.
     """
     outputs = get_outputs_from_request(request.GET)
     output = request.GET.get("output")
@@ -181,31 +351,148 @@ def contents(request):
         raise Http404
 
     try:
-        import mimetypes
+        stat = file_path.stat()
+    except FileNotFoundError:  # pragma: no cover
+        raise Http404
 
-        content_type, _ = mimetypes.guess_type(file_path)
-        is_pdf = content_type == "application/pdf"
+    # The recorded checksum makes a strong ETag, but only if the file still
+    # matches it. Otherwise, fall back to one derived from the file's stat.
+    filedata = next(f for f in outputs[output]["files"] if f["name"] == filename)
+    if filedata.get("checksum_valid") is True:
+        etag = quote_etag(filedata["checksum"])
+    else:
+        etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+
+    validators = HttpResponse()
+    validators["ETag"] = etag
+    validators["Last-Modified"] = http_date(last_modified)
+    conditional = get_conditional_response(
+        request, etag=etag, last_modified=last_modified, response=validators
+    )
+    if conditional is not validators:
+        return conditional
 
-        response = FileResponse(
-            open(file_path, "rb"), as_attachment=not is_pdf, filename=filename
-        )
+    byte_range = None
+    if "Range" in request.headers and if_range_passes(request, etag, last_modified):
+        try:
+            byte_range = utils.parse_range(request.headers["Range"], stat.st_size)
+        except utils.RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+
+    content_type, _ = mimetypes.guess_type(file_path)
+    is_pdf = content_type == "application/pdf"
+
+    try:
+        f = open(file_path, "rb")
     except FileNotFoundError:  # pragma: no cover
         raise Http404
 
+    if byte_range is None:
+        response = FileResponse(f, as_attachment=not is_pdf, filename=filename)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(
+            utils.FileRange(f, start, length),
+            as_attachment=not is_pdf,
+            filename=filename,
+            status=206,
+        )
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+        response["Content-Length"] = length
+
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+
     # enable electron opening this file with native app
     response["Content-Disposition"] += "; native=true"
     return response
 
 
+def if_range_passes(request, etag, last_modified):
+    """Should a Range request be honoured, given any If-Range header?
+
+    If-Range holds either an ETag, which must match strongly, or a date,
+    which must match the file's modification time exactly.
+    """
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_GET
+def checksum_status(request):
+    """Report the checksum results verified so far for each output file.
+
+    Files still being verified in the background are left out, so the client
+    can poll until complete is true, merging in results as they arrive.
+    """
+    outputs = get_outputs_from_request(request.GET)
+
+    files = {}
+    for output, metadata in outputs.items():
+        results = {
+            filedata["name"]: filedata["checksum_valid"]
+            for filedata in metadata["files"]
+            if filedata.get("checksum_valid") != "pending"
+        }
+        if results:
+            files[output] = results
+
+    return JsonResponse(
+        {"complete": outputs.verification_complete, "files": files},
+    )
+
+
+@require_GET
+def write_stats(request):
+    """Report, for each kind of metadata write, how many have been requested
+    and made, and how long they took to reach the disk"""
+    return JsonResponse(writer.WRITER.stats())
+
+
+@require_GET
+def events(request):
+    """Server-Sent Events stream of changes to the outputs directory.
+
+    Each change event lists the output files that changed, so the page can
+    refetch just those outputs. Under ASGI the stream is handed over to
+    watcher.EventStreamApp, so it does not block the event loop.
+    """
+    path = get_filepath_from_request(request.GET, "path")
+
+    if isinstance(request, ASGIRequest):
+        response = HttpResponse(content_type="text/event-stream")
+        response[watcher.HANDOFF_HEADER] = str(path)
+    else:
+        response = StreamingHttpResponse(
+            watcher.stream(path), content_type="text/event-stream"
+        )
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 @require_POST
 def approved_outputs(request, pk):
-    if not (review := REVIEWS.get(pk)):
+    if not (review := reviews.REVIEWS.get(pk)):
         raise Http404
 
-    outputs = models.ACROOutputs(review["path"])
+    outputs = models.OUTPUTS_CACHE.get(review["path"])
+    if outputs.digest() != review["metadata_digest"]:
+        return HttpResponse(
+            "The outputs have changed since they were reviewed. "
+            "Please review them again.",
+            status=409,
+        )
 
     approved_outputs = [k for k, v in review["decisions"].items() if v["state"] is True]
-    in_memory_zf = zipfile.create(outputs, review, approved_outputs)
 
     # use the directory name as the files might all just be results.json
     filename = f"{outputs.path.parent.stem}_{outputs.path.stem}.zip"
@@ -213,7 +500,20 @@ def approved_outputs(request, pk):
     username = getpass.getuser()
     local_audit.log_release(review["decisions"], username)
 
-    return FileResponse(in_memory_zf, as_attachment=True, filename=filename)
+    key = zipfile.release_key(outputs, review, approved_outputs)
+    if (cached := zipfile.RELEASE_CACHE.get(key)) is not None:
+        return FileResponse(cached, as_attachment=True, filename=filename)
+
+    response = FileResponse(
+        zipfile.RELEASE_CACHE.store(
+            key, zipfile.stream(outputs, review, approved_outputs)
+        ),
+        as_attachment=True,
+        filename=filename,
+    )
+    # FileResponse only sets these itself when streaming a file object
+    response.set_headers(None)
+    return response
 
 
 @require_POST
@@ -239,19 +539,24 @@ def review_create(request):
         "decisions": review,
         "path": outputs.path,
     }
-    REVIEWS["current"] = review_data
+    pk = reviews.REVIEWS.create(
+        path=outputs.path,
+        comment=comment,
+        decisions=review,
+        metadata_digest=outputs.digest(),
+    )
     _write_reviewer_text_to_results(outputs, review_data)
 
-    return redirect("review-detail", pk="current")
+    return redirect("review-detail", pk=pk)
 
 
 @require_GET
 def review_detail(request, pk):
-    if not (review := REVIEWS.get(pk)):
+    if not (review := reviews.REVIEWS.get(pk)):
         raise Http404
 
-    approved_outputs_url = reverse("approved-outputs", kwargs={"pk": "current"})
-    summary_url = reverse("summary", kwargs={"pk": "current"})
+    approved_outputs_url = reverse("approved-outputs", kwargs={"pk": pk})
+    summary_url = reverse("summary", kwargs={"pk": pk})
 
     approved = sum(1 for o in review["decisions"].values() if o["state"])
     total = len(review["decisions"])
@@ -273,10 +578,10 @@ def review_detail(request, pk):
 
 @require_POST
 def summary(request, pk):
-    if not (review := REVIEWS.get(pk)):
+    if not (review := reviews.REVIEWS.get(pk)):
         raise Http404
 
-    outputs = models.ACROOutputs(review["path"])
+    outputs = models.OUTPUTS_CACHE.get(review["path"])
     content = zipfile.get_summary(review, outputs)
 
     # Use an HttpResponse because FileResponse is for file handles which we
@@ -316,19 +621,31 @@ def researcher_index(request):
 
     outputs = get_outputs_from_request(data)
 
-    draft_path = outputs.path.parent / "results.json"
+    draft_path = drafts.draft_path(outputs.path)
     if draft_path.exists():  # pragma: no branch
+        # bring the draft file up to date with the journal before we read it
+        drafts.DRAFTS.compact(outputs.path)
         outputs = models.load_from_path(draft_path)
 
     return TemplateResponse(
         request,
         "researcher_index.html",
         context={
-            "outputs": dict(outputs),
+            "outputs": outputs.summary(),
             "config": outputs.config,
             "version": outputs.version,
+            "revision": drafts.DRAFTS.get(outputs.path).revision,
             "path": str(outputs.path),
             "username": getpass.getuser(),
+            "checksum_status_url": utils.reverse_with_params(
+                {"path": str(outputs.path)}, "checksum-status"
+            ),
+            "outputs_metadata_url": utils.reverse_with_params(
+                {"path": str(outputs.path)}, "outputs-metadata"
+            ),
+            "events_url": utils.reverse_with_params(
+                {"path": str(outputs.path)}, "events"
+            ),
         },
     )
 
@@ -363,17 +680,14 @@ def researcher_save_session(request):
         if "results" not in session_data:
             session_data["results"] = {}
 
-        draft_path = outputs.path.parent / "results.json"
-        with open(draft_path, "w") as f:
-            json.dump(session_data, f, indent=2)
-
-        logger.info(f"Saved draft session to {draft_path}")
+        revision = drafts.DRAFTS.replace(outputs.path, session_data)
 
         return JsonResponse(
             {
                 "success": True,
                 "message": "Draft saved successfully",
                 "saved_at": datetime.now().isoformat(),
+                "revision": revision,
             }
         )
 
@@ -388,6 +702,52 @@ def researcher_save_session(request):
         )
 
 
+@require_POST
+def researcher_patch_session(request):
+    """
+    Apply JSON Patch (RFC 6902) operations to the researcher's draft session.
+
+    The body is JSON: {"revision": n, "operations": [...]}, where revision is
+    the revision of the draft the operations were made against. If the draft
+    has changed since, nothing is applied and the current revision is returned
+    with a 409, so the researcher can reload it.
+    """
+    try:
+        outputs = get_outputs_from_request(request.GET)
+        body = json.loads(request.body)
+        if not isinstance(body, dict):
+            raise jsonpatch.PatchError("Expected a JSON object")
+
+        revision = drafts.DRAFTS.patch(
+            outputs.path, body.get("operations"), revision=body.get("revision")
+        )
+
+        return JsonResponse(
+            {
+                "success": True,
+                "message": "Draft saved successfully",
+                "saved_at": datetime.now().isoformat(),
+                "revision": revision,
+            }
+        )
+
+    except drafts.RevisionConflict as e:
+        return revision_conflict(e)
+
+    except (ValueError, jsonpatch.PatchError) as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    except Exception as e:
+        logger.error(f"Error patching session: {e}")
+        return JsonResponse(
+            {
+                "success": False,
+                "message": str(e),
+            },
+            status=500,
+        )
+
+
 @require_GET
 def researcher_load_session(request):
     """
@@ -395,7 +755,7 @@ def researcher_load_session(request):
     """
     try:
         outputs = get_outputs_from_request(request.GET)
-        draft_path = outputs.path.parent / "results.json"
+        draft_path = drafts.draft_path(outputs.path)
 
         if not draft_path.exists():
             return JsonResponse(
@@ -406,13 +766,13 @@ def researcher_load_session(request):
                 status=404,
             )
 
-        with open(draft_path) as f:
-            session_data = json.load(f)
+        draft = drafts.DRAFTS.get(outputs.path)
 
         return JsonResponse(
             {
                 "success": True,
-                "data": session_data,
+                "data": draft.document,
+                "revision": draft.revision,
                 "saved_at": draft_path.stat().st_mtime,
             }
         )
@@ -436,7 +796,7 @@ def researcher_finalize(request):
     """
     try:
         outputs = get_outputs_from_request(request.GET)
-        session_data = json.loads(request.POST.get("session_data", "{}"))
+        session_data = get_session_from_request(request.POST, outputs)
 
         if "version" not in session_data:
             session_data["version"] = outputs.version
@@ -449,12 +809,11 @@ def researcher_finalize(request):
                 status=400,
             )
 
-        with open(outputs.path, "w") as f:
-            json.dump(session_data, f, indent=2)
+        writer.WRITER.write_now(
+            outputs.path, json.dumps(session_data, indent=2).encode(), "finalize"
+        )
 
-        draft_path = outputs.path.parent / "results.json"
-        if draft_path.exists() and draft_path != outputs.path:  # pragma: no branch
-            draft_path.unlink()
+        drafts.DRAFTS.remove(outputs.path)
 
         logger.info(f"Finalized session for {outputs.path}")
 
@@ -476,182 +835,418 @@ def researcher_finalize(request):
         )
 
 
+def set_file_urls(outputs, name, file_info, filename):
+    """Set the URLs file_info's file, filename, is served from as part of
+    output name: its contents, and windows of its rows if it is a table"""
+    params = {"path": str(outputs.path), "output": name, "filename": filename}
+    file_info["url"] = utils.reverse_with_params(params, "contents")
+    if filename.lower().endswith(".csv"):
+        file_info["table_url"] = utils.reverse_with_params(params, "contents-table")
+    else:
+        file_info.pop("table_url", None)
+
+
+def add_file_info(outputs, name, file_info, filename, checksum):
+    """Fill in file_info for a file added to output name, and record its checksum"""
+    set_file_urls(outputs, name, file_info, filename)
+
+    file_info["checksum"] = checksum
+    file_info["checksum_valid"] = True
+
+    # Write checksum to file
+    checksum_dir = outputs.path.parent / "checksums"
+    checksum_dir.mkdir(exist_ok=True)
+    checksum_path = checksum_dir / f"{filename}.txt"
+    with open(checksum_path, "w") as f:
+        f.write(checksum)
+
+    # Add dummy SDC and cell_index to match ACRO format
+    file_info["sdc"] = {}
+    file_info["cell_index"] = models.build_cell_index({})
+
+
 @require_POST
 def researcher_add_output(request):
     try:
         outputs = get_outputs_from_request(request.GET)
-        session_data = json.loads(request.POST.get("session_data", "{}"))
-        new_output_name = request.POST.get("name")
-        new_output_data = json.loads(request.POST.get("data", "{}"))
+        with session_changes(request.POST, outputs) as (session_data, save):
+            new_output_name = request.POST.get("name")
+            new_output_data = json.loads(request.POST.get("data", "{}"))
+
+            if not new_output_name:
+                return JsonResponse(
+                    {"success": False, "message": "Output name is required"}, status=400
+                )
+
+            new_output_data["uid"] = new_output_name
+
+            # Handle file uploads, either in this request or already uploaded in
+            # chunks. Either way, the file is hashed as it is written.
+            checksum = None
+            if "upload" in request.POST:
+                upload = uploads.UPLOADS.get(
+                    outputs.path.parent, request.POST["upload"]
+                )
+                safe_filename = upload.filename
+                output_path = outputs.path.parent / safe_filename
+                checksum = uploads.UPLOADS.commit(
+                    outputs.path.parent, upload.upload_id, output_path
+                )
+            elif "file" in request.FILES:
+                uploaded_file = request.FILES["file"]
+                safe_filename = Path(uploaded_file.name).name
+                output_path = outputs.path.parent / safe_filename
+                checksum = uploads.write_hashed(
+                    uploaded_file.chunks(checksums.CHUNK_SIZE), output_path
+                )
+
+            if checksum is not None:
+                add_file_info(
+                    outputs,
+                    new_output_name,
+                    new_output_data["files"][0],
+                    safe_filename,
+                    checksum,
+                )
+
+            # Format MIME type for better display
+            if (
+                "properties" in new_output_data
+                and "method" in new_output_data["properties"]
+            ):
+                new_output_data["properties"]["method"] = format_mime_type(
+                    new_output_data["properties"]["method"]
+                )
+
+            revision = save(
+                [
+                    {
+                        "op": "add",
+                        "path": jsonpatch.pointer("results", new_output_name),
+                        "value": new_output_data,
+                    }
+                ],
+            )
+
+            item_html = render_to_string(
+                "_researcher_output_list_item.html",
+                {"name": new_output_name, "output": new_output_data},
+            )
 
-        if not new_output_name:
             return JsonResponse(
-                {"success": False, "message": "Output name is required"}, status=400
+                {
+                    "success": True,
+                    "message": "Output added successfully",
+                    "html": item_html,
+                    "output_data": new_output_data,
+                    "revision": revision,
+                }
             )
+    except drafts.RevisionConflict as e:
+        return revision_conflict(e)
+    except uploads.UploadError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error adding output: {e}")
+        return JsonResponse({"success": False, "message": str(e)}, status=500)
 
-        new_output_data["uid"] = new_output_name
-
-        # Handle file uploads
-        if "file" in request.FILES:
-            uploaded_file = request.FILES["file"]
-            safe_filename = Path(uploaded_file.name).name
-            output_path = outputs.path.parent / safe_filename
-            with open(output_path, "wb+") as f:
-                for chunk in uploaded_file.chunks():
-                    f.write(chunk)
-
-            # Update metadata with file info
-            file_info = new_output_data["files"][0]
-            file_info[
-                "url"
-            ] = f"/contents/?path={outputs.path}&output={new_output_name}&filename={safe_filename}"
-
-            # Calculate checksum
-            sha256_hash = hashlib.sha256()
-            with open(output_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            file_info["checksum"] = sha256_hash.hexdigest()
-            file_info["checksum_valid"] = True
-
-            # Write checksum to file
-            checksum_dir = outputs.path.parent / "checksums"
-            checksum_dir.mkdir(exist_ok=True)
-            checksum_path = checksum_dir / f"{safe_filename}.txt"
-            with open(checksum_path, "w") as f:
-                f.write(file_info["checksum"])
-
-            # Add dummy SDC and cell_index to match ACRO format
-            file_info["sdc"] = {}
-            file_info["cell_index"] = {}
-
-        # Format MIME type for better display
-        if (
-            "properties" in new_output_data
-            and "method" in new_output_data["properties"]
-        ):
-            new_output_data["properties"]["method"] = format_mime_type(
-                new_output_data["properties"]["method"]
+
+@require_POST
+def researcher_add_outputs(request):
+    """Add many outputs at once, one for each file.
+
+    The files are either uploaded as files, or copied from the local directory
+    posted as directory, skipping any which are already outputs or would
+    overwrite a file in the outputs directory. Each becomes an output named
+    after the file, of the posted type. The files are written and hashed in
+    parallel, and the session is saved once for all of them.
+    """
+    try:
+        outputs = get_outputs_from_request(request.GET)
+        with session_changes(request.POST, outputs) as (session_data, save):
+            output_type = request.POST.get("type", "custom")
+            directory = outputs.path.parent
+
+            writes = {}
+            mime_types = {}
+            skipped = []
+            if "directory" in request.POST:
+                source_dir = Path(request.POST["directory"])
+                if not source_dir.is_dir():
+                    return JsonResponse(
+                        {
+                            "success": False,
+                            "message": f"{source_dir} is not a directory",
+                        },
+                        status=400,
+                    )
+                for source in sorted(source_dir.iterdir()):
+                    name = source.name
+                    if (
+                        not source.is_file()
+                        or name.startswith(".")
+                        or (
+                            source.suffix == ".json"
+                            and models.sniff_acro_metadata(source)
+                        )
+                    ):
+                        continue
+                    if name in session_data["results"] or (directory / name).exists():
+                        skipped.append(name)
+                        continue
+                    writes[name] = partial(
+                        uploads.copy_hashed, source, directory / name
+                    )
+                    mime_types[name] = mimetypes.guess_type(name)[0]
+            else:
+                for uploaded_file in request.FILES.getlist("files"):
+                    name = Path(uploaded_file.name).name
+                    if not name or name.startswith("."):
+                        message = f"Cannot add {name!r}"
+                    elif name in session_data["results"] or name in writes:
+                        message = f"Output {name} already exists"
+                    elif (directory / name).exists():
+                        message = f"{name} is already in the outputs directory"
+                    else:
+                        writes[name] = partial(
+                            uploads.write_hashed,
+                            uploaded_file.chunks(checksums.CHUNK_SIZE),
+                            directory / name,
+                        )
+                        mime_types[name] = uploaded_file.content_type
+                        continue
+                    return JsonResponse(
+                        {"success": False, "message": message}, status=400
+                    )
+
+            if not writes:
+                return JsonResponse(
+                    {
+                        "success": False,
+                        "message": "No new files to add",
+                        "skipped": skipped,
+                    },
+                    status=400,
+                )
+
+            digests = uploads.write_many(writes)
+
+            new_outputs = {}
+            operations = []
+            for name in writes:
+                output_data = {
+                    "uid": name,
+                    "type": output_type,
+                    "status": "review",
+                    "properties": {"method": format_mime_type(mime_types[name])},
+                    "files": [{"name": name}],
+                    "comments": [],
+                    "exception": None,
+                }
+                add_file_info(
+                    outputs, name, output_data["files"][0], name, digests[name]
+                )
+                new_outputs[name] = output_data
+                operations.append(
+                    {
+                        "op": "add",
+                        "path": jsonpatch.pointer("results", name),
+                        "value": output_data,
+                    }
+                )
+
+            revision = save(operations)
+
+            template = get_template("_researcher_output_list_item.html")
+            items_html = "".join(
+                template.render({"name": name, "output": output_data})
+                for name, output_data in new_outputs.items()
             )
 
-        session_data["results"][new_output_name] = new_output_data
+            return JsonResponse(
+                {
+                    "success": True,
+                    "message": f"Added {len(new_outputs)} outputs",
+                    "html": items_html,
+                    "outputs": new_outputs,
+                    "skipped": skipped,
+                    "revision": revision,
+                }
+            )
+    except drafts.RevisionConflict as e:
+        return revision_conflict(e)
+    except uploads.UploadError as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error adding outputs: {e}")
+        return JsonResponse({"success": False, "message": str(e)}, status=500)
+
 
-        draft_path = outputs.path.parent / "results.json"
-        with open(draft_path, "w") as f:
-            json.dump(session_data, f, indent=2)
+@require_POST
+def researcher_start_upload(request):
+    """Start a resumable upload of an output file.
 
-        item_html = render_to_string(
-            "_researcher_output_list_item.html",
-            {"name": new_output_name, "output": new_output_data},
+    Takes a JSON body of {"filename", "size"}. The file is then sent in chunks
+    to researcher_upload, and added with researcher_add_output.
+    """
+    try:
+        outputs = get_outputs_from_request(request.GET)
+        body = json.loads(request.body)
+        upload = uploads.UPLOADS.start(
+            outputs.path.parent, body["filename"], int(body["size"])
         )
+    except (ValueError, KeyError, TypeError, uploads.UploadError) as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    return JsonResponse(
+        {
+            "success": True,
+            "upload": upload.upload_id,
+            "offset": upload.offset,
+            "url": utils.reverse_with_params(
+                {"path": str(outputs.path)},
+                "researcher-upload",
+                kwargs={"upload_id": upload.upload_id},
+            ),
+        }
+    )
+
 
+@require_http_methods(["GET", "PUT", "DELETE"])
+def researcher_upload(request, upload_id):
+    """A resumable upload of an output file.
+
+    PUT writes the request body at ?offset=n, and GET returns the offset to
+    resume from, if a PUT fails. A PUT at any other offset gets a 409 with
+    the offset to resume from. DELETE abandons the upload.
+    """
+    outputs = get_outputs_from_request(request.GET)
+    directory = outputs.path.parent
+    try:
+        if request.method == "PUT":
+            offset = uploads.UPLOADS.write(
+                directory, upload_id, int(request.GET.get("offset", 0)), request
+            )
+        elif request.method == "DELETE":
+            uploads.UPLOADS.discard(directory, upload_id)
+            return JsonResponse({"success": True})
+        else:
+            offset = uploads.UPLOADS.get(directory, upload_id).offset
+    except uploads.OffsetMismatch as e:
         return JsonResponse(
-            {
-                "success": True,
-                "message": "Output added successfully",
-                "html": item_html,
-                "output_data": new_output_data,
-            }
+            {"success": False, "message": str(e), "offset": e.offset}, status=409
         )
-    except Exception as e:
-        logger.error(f"Error adding output: {e}")
-        return JsonResponse({"success": False, "message": str(e)}, status=500)
+    except (ValueError, uploads.UploadError) as e:
+        return JsonResponse({"success": False, "message": str(e)}, status=400)
+
+    return JsonResponse({"success": True, "offset": offset})
 
 
 @require_POST
 def researcher_edit_output(request):
     try:
         outputs = get_outputs_from_request(request.GET)
-        session_data = json.loads(request.POST.get("session_data", "{}"))
-        original_name = request.POST.get("original_name")
-        new_name = request.POST.get("new_name")
-        new_data = json.loads(request.POST.get("data", "{}"))
+        with session_changes(request.POST, outputs) as (session_data, save):
+            original_name = request.POST.get("original_name")
+            new_name = request.POST.get("new_name")
+            new_data = json.loads(request.POST.get("data", "{}"))
 
-        if not original_name or not new_name:
-            return JsonResponse(
-                {"success": False, "message": "Output names are required"}, status=400
-            )
-
-        if original_name != new_name:
-            if new_name in session_data["results"]:
+            if not original_name or not new_name:
                 return JsonResponse(
-                    {"success": False, "message": "Output name already exists"},
+                    {"success": False, "message": "Output names are required"},
                     status=400,
                 )
-            del session_data["results"][original_name]
 
-            if "files" in new_data:
-                is_custom = new_data.get("command") == "custom"
-                file_count = len(new_data["files"])
+            operations = []
+            if original_name != new_name:
+                if new_name in session_data["results"]:
+                    return JsonResponse(
+                        {"success": False, "message": "Output name already exists"},
+                        status=400,
+                    )
+                operations.append(
+                    {
+                        "op": "remove",
+                        "path": jsonpatch.pointer("results", original_name),
+                    }
+                )
 
-                for file_info in new_data["files"]:
-                    filename = file_info.get("name")
-                    if not filename:
-                        continue
+                if "files" in new_data:
+                    is_custom = new_data.get("command") == "custom"
+                    file_count = len(new_data["files"])
 
-                    new_filename = None
-                    ext = Path(filename).suffix
-
-                    # Matches name.csv, name_0.csv, name_1_0.csv
-                    prefix_pattern = f"^{re.escape(original_name)}(?=[_.]|$)"
-                    if re.match(prefix_pattern, filename):
-                        suffix = filename[len(original_name) :]
-                        new_filename = f"{new_name}{suffix}"
-
-                    elif is_custom and file_count == 1:
-                        new_filename = f"{new_name}{ext}"
-
-                    elif not is_custom:
-                        stem = Path(filename).stem
-                        match = re.search(r"_(\d+(_\d+)*)$", stem)
-                        if match:
-                            index_suffix = match.group(0)
-                            new_filename = f"{new_name}{index_suffix}{ext}"
-                        else:
-                            new_filename = f"{new_name}{ext}"
+                    for file_info in new_data["files"]:
+                        filename = file_info.get("name")
+                        if not filename:
+                            continue
 
-                    if new_filename and new_filename != filename:
-                        old_file = outputs.path.parent / filename
-                        new_file = outputs.path.parent / new_filename
+                        new_filename = None
+                        ext = Path(filename).suffix
 
-                        if old_file.exists() and not new_file.exists():
-                            old_file.rename(new_file)
-                            file_info["name"] = new_filename
+                        # Matches name.csv, name_0.csv, name_1_0.csv
+                        prefix_pattern = f"^{re.escape(original_name)}(?=[_.]|$)"
+                        if re.match(prefix_pattern, filename):
+                            suffix = filename[len(original_name) :]
+                            new_filename = f"{new_name}{suffix}"
 
-                            old_checksum = (
-                                outputs.path.parent / "checksums" / f"{filename}.txt"
-                            )
-                            new_checksum = (
-                                outputs.path.parent
-                                / "checksums"
-                                / f"{new_filename}.txt"
-                            )
-                            if old_checksum.exists() and not new_checksum.exists():
-                                old_checksum.rename(new_checksum)
+                        elif is_custom and file_count == 1:
+                            new_filename = f"{new_name}{ext}"
+
+                        elif not is_custom:
+                            stem = Path(filename).stem
+                            match = re.search(r"_(\d+(_\d+)*)$", stem)
+                            if match:
+                                index_suffix = match.group(0)
+                                new_filename = f"{new_name}{index_suffix}{ext}"
+                            else:
+                                new_filename = f"{new_name}{ext}"
 
-                    if "url" in file_info:  # pragma: no branch
-                        file_info["url"] = file_info["url"].replace(
-                            f"output={original_name}", f"output={new_name}"
-                        )
                         if new_filename and new_filename != filename:
-                            file_info["url"] = file_info["url"].replace(
-                                f"filename={filename}", f"filename={new_filename}"
+                            old_file = outputs.path.parent / filename
+                            new_file = outputs.path.parent / new_filename
+
+                            if old_file.exists() and not new_file.exists():
+                                old_file.rename(new_file)
+                                file_info["name"] = new_filename
+
+                                old_checksum = (
+                                    outputs.path.parent
+                                    / "checksums"
+                                    / f"{filename}.txt"
+                                )
+                                new_checksum = (
+                                    outputs.path.parent
+                                    / "checksums"
+                                    / f"{new_filename}.txt"
+                                )
+                                if old_checksum.exists() and not new_checksum.exists():
+                                    old_checksum.rename(new_checksum)
+
+                        if "url" in file_info:
+                            set_file_urls(
+                                outputs, new_name, file_info, file_info["name"]
                             )
 
-        new_data["uid"] = new_name
-        session_data["results"][new_name] = new_data
-
-        draft_path = outputs.path.parent / "results.json"
-        with open(draft_path, "w") as f:
-            json.dump(session_data, f, indent=2)
+            new_data["uid"] = new_name
+            operations.append(
+                {
+                    "op": "add",
+                    "path": jsonpatch.pointer("results", new_name),
+                    "value": new_data,
+                }
+            )
+            revision = save(operations)
 
-        return JsonResponse(
-            {
-                "success": True,
-                "message": "Output updated successfully",
-                "output_data": new_data,
-            }
-        )
+            return JsonResponse(
+                {
+                    "success": True,
+                    "message": "Output updated successfully",
+                    "output_data": new_data,
+                    "revision": revision,
+                }
+            )
+    except drafts.RevisionConflict as e:
+        return revision_conflict(e)
     except Exception as e:
         logger.error(f"Error editing output: {e}")
         return JsonResponse({"success": False, "message": str(e)}, status=500)
@@ -661,37 +1256,46 @@ def researcher_edit_output(request):
 def researcher_delete_output(request):
     try:
         outputs = get_outputs_from_request(request.GET)
-        session_data = json.loads(request.POST.get("session_data", "{}"))
-        output_name = request.POST.get("name")
+        with session_changes(request.POST, outputs) as (session_data, save):
+            output_name = request.POST.get("name")
 
-        if not output_name:
-            return JsonResponse(
-                {"success": False, "message": "Output name is required"}, status=400
+            if not output_name:
+                return JsonResponse(
+                    {"success": False, "message": "Output name is required"}, status=400
+                )
+
+            if output_name in session_data["results"]:
+                output_data = session_data["results"][output_name]
+                for file_info in output_data.get("files", []):
+                    filename = file_info.get("name")
+                    if not filename:
+                        continue
+                    file_path = outputs.path.parent / filename
+                    if file_path.exists():
+                        file_path.unlink()
+                    checksum_path = (
+                        outputs.path.parent / "checksums" / f"{filename}.txt"
+                    )
+                    if checksum_path.exists():
+                        checksum_path.unlink()
+            else:
+                return JsonResponse(
+                    {"success": False, "message": "Output not found"}, status=404
+                )
+
+            revision = save(
+                [{"op": "remove", "path": jsonpatch.pointer("results", output_name)}],
             )
 
-        if output_name in session_data["results"]:
-            output_data = session_data["results"][output_name]
-            for file_info in output_data.get("files", []):
-                filename = file_info.get("name")
-                if not filename:
-                    continue
-                file_path = outputs.path.parent / filename
-                if file_path.exists():
-                    file_path.unlink()
-                checksum_path = outputs.path.parent / "checksums" / f"{filename}.txt"
-                if checksum_path.exists():
-                    checksum_path.unlink()
-            del session_data["results"][output_name]
-        else:
             return JsonResponse(
-                {"success": False, "message": "Output not found"}, status=404
+                {
+                    "success": True,
+                    "message": "Output deleted successfully",
+                    "revision": revision,
+                }
             )
-
-        draft_path = outputs.path.parent / "results.json"
-        with open(draft_path, "w") as f:
-            json.dump(session_data, f, indent=2)
-
-        return JsonResponse({"success": True, "message": "Output deleted successfully"})
+    except drafts.RevisionConflict as e:
+        return revision_conflict(e)
     except Exception as e:
         logger.error(f"Error deleting output: {e}")
         return JsonResponse({"success": False, "message": str(e)}, status=500)
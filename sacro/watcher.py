@@ -0,0 +1,421 @@
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+
+from sacro import cache, models
+
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) event flags
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+)
+
+# struct inotify_event, minus the trailing variable length name
+EVENT_HEADER = struct.Struct("iIII")
+
+# after a change, keep collecting until the directory has been quiet this
+# long, so a burst of writes is reported as one change
+DEBOUNCE = 0.1
+
+# response header the events view uses to hand a stream over to EventStreamApp
+HANDOFF_HEADER = "X-Sacro-Event-Stream"
+
+CONNECTED = b"retry: 5000\n\n"
+HEARTBEAT = b": heartbeat\n\n"
+
+
+def watched_dirs(dirpath):
+    return [dirpath, dirpath / "checksums"]
+
+
+def snapshot(dirpath):
+    """Stat fingerprint of every file in dirpath and its checksums directory"""
+    files = {}
+    for path in watched_dirs(dirpath):
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+        for entry in entries:
+            files[Path(entry.path)] = cache.stat_fingerprint(entry.path)
+    return files
+
+
+def load_libc():
+    """Return libc if it supports inotify, else None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except (OSError, TypeError):  # pragma: no cover
+        return None
+    if not hasattr(libc, "inotify_init1"):  # pragma: no cover
+        return None
+    return libc
+
+
+class PollingBackend:
+    """Finds changes by re-statting every watched file each interval"""
+
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.files = snapshot(dirpath)
+
+    def read(self, timeout):
+        """Wait for timeout seconds, then return the paths that changed"""
+        time.sleep(timeout)
+        current = snapshot(self.dirpath)
+        changed = {
+            path
+            for path in self.files.keys() | current.keys()
+            if self.files.get(path) != current.get(path)
+        }
+        self.files = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyBackend:
+    """Finds changes with Linux's inotify, so nothing is re-statted"""
+
+    def __init__(self, dirpath):
+        self.libc = load_libc()
+        if self.libc is None:  # pragma: no cover
+            raise OSError("inotify is not available on this platform")
+
+        self.dirpath = dirpath
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:  # pragma: no cover
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.watches = {}
+        for path in watched_dirs(dirpath):
+            self.add_watch(path)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.watches[wd] = path
+
+    def read(self, timeout):
+        """Wait up to timeout seconds for changes, returning the paths changed"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:  # pragma: no cover
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, so assume everything changed
+                changed.update(snapshot(self.dirpath))
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches and name:
+                path = self.watches[wd] / name
+                changed.add(path)
+                if path in watched_dirs(self.dirpath):
+                    # the checksums directory was created after we started
+                    self.add_watch(path)
+
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_backend(dirpath):
+    backend = settings.WATCH_BACKEND
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyBackend(dirpath)
+        except OSError as exc:  # pragma: no cover
+            if backend == "inotify":
+                raise
+            logger.info(f"polling {dirpath} for changes, as {exc}")
+    return PollingBackend(dirpath)
+
+
+class DirectoryWatcher:
+    """Watches an outputs directory, and its checksums, in a background thread.
+
+    on_change is called with the set of paths that changed.
+    """
+
+    def __init__(self, dirpath, on_change, backend=None):
+        self.dirpath = dirpath
+        self.on_change = on_change
+        self.backend = backend or make_backend(dirpath)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"sacro-watch-{dirpath.name}", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.backend.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            changed = self.backend.read(settings.WATCH_POLL_INTERVAL)
+            if not changed:
+                continue
+
+            while not self._stop.is_set() and (more := self.backend.read(DEBOUNCE)):
+                changed |= more
+
+            try:
+                self.on_change(changed)
+            except Exception:
+                logger.exception(f"error handling changes to {self.dirpath}")
+
+
+def changed_names(dirpath, paths):
+    """The names of the output files affected by changes to paths"""
+    checksums_dir = dirpath / "checksums"
+    names = set()
+    for path in paths:
+        if path.name.startswith("."):
+            continue
+        if path.parent == checksums_dir and path.suffix == ".txt":
+            names.add(path.name.removesuffix(".txt"))
+        elif path.parent == dirpath and path != checksums_dir:
+            names.add(path.name)
+    return names
+
+
+def handle_changes(dirpath, paths):
+    """Bring cached outputs for dirpath up to date, returning the names changed.
+
+    Only the affected files are reverified. New files in a directory we
+    scaffolded are added to its metadata.
+    """
+    names = changed_names(dirpath, paths)
+    if not names:
+        return names
+
+    models.OUTPUTS_CACHE.refresh(dirpath, names)
+
+    default = dirpath / "outputs.json"
+    if default.exists() and names - {default.name}:
+        try:
+            models.scaffold_acro_metadata(default)
+        except (OSError, ValueError) as exc:
+            logger.warning(f"could not update scaffolded metadata {default}: {exc}")
+
+    return names
+
+
+class ChangeHub:
+    """Fans out changes in watched directories to subscribers.
+
+    A directory is only watched while it has subscribers. Each subscriber is a
+    callable, called from the watcher thread with the set of changed names.
+    """
+
+    def __init__(self, watcher_class=DirectoryWatcher):
+        self.watcher_class = watcher_class
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._watchers = {}
+
+    def subscribe(self, dirpath, callback):
+        dirpath = Path(dirpath).resolve()
+        with self._lock:
+            if dirpath not in self._watchers:
+                self._watchers[dirpath] = self.watcher_class(
+                    dirpath, partial(self._changed, dirpath)
+                ).start()
+            self._subscribers.setdefault(dirpath, set()).add(callback)
+
+    def unsubscribe(self, dirpath, callback):
+        dirpath = Path(dirpath).resolve()
+        watcher = None
+        with self._lock:
+            subscribers = self._subscribers.get(dirpath, set())
+            subscribers.discard(callback)
+            if not subscribers and dirpath in self._watchers:
+                self._subscribers.pop(dirpath, None)
+                watcher = self._watchers.pop(dirpath)
+
+        if watcher:
+            watcher.stop()
+
+    def publish(self, dirpath, names):
+        with self._lock:
+            subscribers = list(self._subscribers.get(Path(dirpath).resolve(), ()))
+        for callback in subscribers:
+            callback(names)
+
+    def _changed(self, dirpath, paths):
+        if names := handle_changes(dirpath, paths):
+            self.publish(dirpath, names)
+
+
+HUB = ChangeHub()
+
+
+def change_message(path, names):
+    """Format changed names as an SSE change event for the metadata at path.
+
+    metadata is true if the metadata itself or its config changed, in which
+    case the client should reload everything.
+    """
+    metadata_names = {path.name, "config.json"}
+    data = {
+        "files": sorted(names - metadata_names),
+        "metadata": bool(names & metadata_names),
+    }
+    return f"event: change\ndata: {json.dumps(data)}\n\n".encode()
+
+
+def stream(path, heartbeat=None, hub=None):
+    """Server-Sent Events for changes to the outputs of the metadata at path.
+
+    This blocks between events, so is only suitable for serving from a thread.
+    See EventStreamApp for ASGI.
+    """
+    if heartbeat is None:
+        heartbeat = settings.WATCH_HEARTBEAT_INTERVAL
+    if hub is None:
+        hub = HUB
+    path = Path(path).resolve()
+    changes = queue.Queue()
+    hub.subscribe(path.parent, changes.put)
+    try:
+        yield CONNECTED
+        while True:
+            try:
+                names = changes.get(timeout=heartbeat)
+            except queue.Empty:
+                # lets us notice if the client has gone away
+                yield HEARTBEAT
+            else:
+                yield change_message(path, names)
+    finally:
+        hub.unsubscribe(path.parent, changes.put)
+
+
+class EventStreamApp:
+    """ASGI wrapper that serves event streams without blocking the event loop.
+
+    Under ASGI, Django 4.1 iterates streaming responses synchronously on the
+    event loop, which a long lived stream would block. So the events view
+    instead returns an empty response carrying HANDOFF_HEADER, after all the
+    usual middleware has run, and this wrapper streams the events itself.
+    """
+
+    def __init__(self, app, hub=HUB):
+        self.app = app
+        self.hub = hub
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        handoff = None
+
+        async def intercept(message):
+            nonlocal handoff
+            if message["type"] == "http.response.start":
+                headers = []
+                for name, value in message.get("headers", []):
+                    name_lower = name.decode().lower()
+                    if name_lower == HANDOFF_HEADER.lower():
+                        handoff = Path(value.decode())
+                    elif name_lower != "content-length":
+                        headers.append((name, value))
+                if handoff is not None:
+                    # the stream has no length, so drop the empty body's
+                    message = {**message, "headers": headers}
+            elif handoff is not None:
+                # swallow the empty body; we send our own
+                return
+            await send(message)
+
+        await self.app(scope, receive, intercept)
+
+        if handoff is not None:
+            await self.stream(handoff, receive, send)
+
+    async def stream(self, path, receive, send):
+        loop = asyncio.get_running_loop()
+        changes = asyncio.Queue()
+
+        def deliver(names):
+            loop.call_soon_threadsafe(changes.put_nowait, names)
+
+        async def disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        path = path.resolve()
+        await loop.run_in_executor(None, self.hub.subscribe, path.parent, deliver)
+        disconnected = asyncio.ensure_future(disconnect())
+        try:
+            body = CONNECTED
+            while True:
+                await send(
+                    {"type": "http.response.body", "body": body, "more_body": True}
+                )
+                get = asyncio.ensure_future(changes.get())
+                await asyncio.wait(
+                    {get, disconnected},
+                    timeout=settings.WATCH_HEARTBEAT_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if disconnected.done():
+                    get.cancel()
+                    break
+                if get.done():
+                    body = change_message(path, get.result())
+                else:
+                    get.cancel()
+                    body = HEARTBEAT
+        finally:
+            disconnected.cancel()
+            await loop.run_in_executor(None, self.hub.unsubscribe, path.parent, deliver)
@@ -0,0 +1,265 @@
+import atexit
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# a burst of writes to one file delays it by at most this many times the
+# write delay, so a steady stream of writes still gets saved
+MAX_DELAY_FACTOR = 4
+
+
+def write_atomically(path, data, before_replace=None):
+    """Replace the contents of path with data, durably and atomically.
+
+    data is written to a temporary file alongside path and synced, then
+    renamed over path, so readers see either the old contents or the new,
+    never a mixture. Each write has its own temporary file, so writes from
+    several processes at once do not collide. before_replace, if given, is
+    called just before the rename.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    tmp = Path(tmp)
+    try:
+        with open(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if before_replace is not None:
+            before_replace()
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+@dataclass
+class WriteStats:
+    requests: int = 0
+    writes: int = 0
+    errors: int = 0
+    # seconds from each completed request to its data being on disk
+    completed: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    def record(self, latency):
+        self.completed += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "writes": self.writes,
+            "errors": self.errors,
+            # requests which were superseded by a later one before being written
+            "coalesced": self.completed - self.writes - self.errors,
+            "mean_latency": self.total_latency / self.completed
+            if self.completed
+            else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+
+@dataclass
+class PendingWrite:
+    data: bytes
+    kind: str
+    first_requested: float
+    due: float
+    # (requested at, future) for each write this one stands for
+    requests: list = field(default_factory=list)
+
+
+class MetadataWriter:
+    """Writes metadata files in the background, coalescing bursts of writes.
+
+    A write is held for METADATA_WRITE_DELAY seconds, and any further writes
+    to the same file in that time replace it, so only the last is written.
+    Writes are atomic, and pending writes are flushed at exit. Anything which
+    reads a metadata file should flush it first (models.load_from_path does).
+
+    stats() gives the number of writes requested and made, and their latency,
+    for each kind of write.
+    """
+
+    def __init__(self, delay=None):
+        self._delay = delay
+        self._pending = {}
+        self._stats = {}
+        self._condition = threading.Condition()
+        # held while writing, so writes to a file happen in the order requested
+        self._io_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def delay(self):
+        if self._delay is not None:
+            return self._delay
+        return settings.METADATA_WRITE_DELAY
+
+    def _kind_stats(self, kind):
+        return self._stats.setdefault(kind, WriteStats())
+
+    def write(self, path, data, kind):
+        """Write data to path soon, returning a Future for when it is on disk"""
+        future = Future()
+        path = Path(path).resolve()
+        now = time.monotonic()
+        delay = self.delay
+
+        with self._condition:
+            self._kind_stats(kind).requests += 1
+            pending = self._pending.get(path)
+            if pending is None:
+                pending = PendingWrite(data, kind, now, now + delay)
+                self._pending[path] = pending
+            else:
+                pending.data = data
+                pending.kind = kind
+                pending.due = min(
+                    now + delay, pending.first_requested + delay * MAX_DELAY_FACTOR
+                )
+            pending.requests.append((now, future))
+
+            if delay > 0 and not self._closed:
+                self._start()
+                self._condition.notify()
+                return future
+
+        # not deferring, so write it now
+        self.flush(path)
+        return future
+
+    def write_now(self, path, data, kind, before_replace=None):
+        """Write data to path straight away, superseding any pending write"""
+        path = Path(path).resolve()
+        start = time.monotonic()
+        with self._io_lock:
+            with self._condition:
+                self._kind_stats(kind).requests += 1
+                pending = self._pending.pop(path, None)
+            requests = [(start, None)] + (pending.requests if pending else [])
+            self._write(path, data, kind, requests, before_replace)
+
+    def record(self, kind, latency):
+        """Record a write made elsewhere, eg an append, in the stats"""
+        with self._condition:
+            stats = self._kind_stats(kind)
+            stats.requests += 1
+            stats.writes += 1
+            stats.record(latency)
+
+    def _write(self, path, data, kind, requests, before_replace=None):
+        """Write data to path. Must be called with _io_lock held."""
+        try:
+            write_atomically(path, data, before_replace)
+        except Exception as exc:
+            logger.error(f"Error writing {path}: {exc}")
+            error = exc
+        else:
+            error = None
+
+        now = time.monotonic()
+        with self._condition:
+            stats = self._kind_stats(kind)
+            if error is None:
+                stats.writes += 1
+            else:
+                stats.errors += 1
+            for requested, _ in requests:
+                stats.record(now - requested)
+
+        for _, future in requests:
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(path)
+            else:
+                future.set_exception(error)
+
+        if error is not None and requests[0][1] is None:
+            raise error
+
+    def flush(self, path=None):
+        """Write any pending writes, to path or to every file, now"""
+        if path is not None:
+            path = Path(path).resolve()
+            with self._condition:
+                # pending writes are only taken off the queue with _io_lock
+                # held, so if it is free, nothing is on its way to path
+                if path not in self._pending and not self._io_lock.locked():
+                    return
+
+        with self._io_lock:
+            with self._condition:
+                if path is None:
+                    due = list(self._pending.items())
+                    self._pending.clear()
+                else:
+                    pending = self._pending.pop(path, None)
+                    due = [(path, pending)] if pending else []
+
+            for due_path, pending in due:
+                self._write(due_path, pending.data, pending.kind, pending.requests)
+
+    def _start(self):
+        """Start the background thread. Must be called with _condition held."""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="sacro-metadata-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._io_lock:
+                with self._condition:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    due = [
+                        (path, pending)
+                        for path, pending in self._pending.items()
+                        if pending.due <= now
+                    ]
+                    for path, _ in due:
+                        del self._pending[path]
+
+                for path, pending in due:
+                    self._write(path, pending.data, pending.kind, pending.requests)
+
+            with self._condition:
+                if self._closed:
+                    return
+                if not self._pending:
+                    self._condition.wait()
+                else:
+                    next_due = min(p.due for p in self._pending.values())
+                    self._condition.wait(max(0, next_due - time.monotonic()))
+
+    def close(self):
+        """Write anything pending and stop the background thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.flush()
+
+    def stats(self):
+        with self._condition:
+            return {kind: stats.as_dict() for kind, stats in self._stats.items()}
+
+
+WRITER = MetadataWriter()
+atexit.register(WRITER.close)
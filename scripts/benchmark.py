@@ -0,0 +1,222 @@
+"""
+Micro-benchmarks for performance sensitive parts of the viewer.
+
+Usage:
+
+    python scripts/benchmark.py checksums [--files 500] [--size 1048576]
+    python scripts/benchmark.py urls [--files 5000]
+    python scripts/benchmark.py release [--files 200] [--size 1048576]
+
+Each benchmark builds a synthetic output directory in a temporary location and
+prints timings for the variants it compares.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sacro.settings")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+import django  # noqa: E402
+
+
+django.setup()
+
+from sacro import checksums, utils  # noqa: E402
+from sacro.adapters import zipfile  # noqa: E402
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.3f}s")
+    return elapsed, result
+
+
+def make_files(dirpath, count, size):
+    paths = []
+    for i in range(count):
+        path = dirpath / f"output_{i}.bin"
+        path.write_bytes(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def checksums_benchmark(args):
+    """Compare serial and parallel hashing of a synthetic output directory"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dirpath = Path(tmp)
+        paths = make_files(dirpath, args.files, args.size)
+        print(f"{args.files} files of {args.size} bytes, {args.workers} workers")
+
+        serial, expected = timed(
+            "serial",
+            checksums.VerifiedIndex(dirpath).digest_many,
+            paths,
+            workers=1,
+        )
+        parallel, digests = timed(
+            "parallel",
+            checksums.VerifiedIndex(dirpath).digest_many,
+            paths,
+            workers=args.workers,
+        )
+        assert digests == expected
+
+        index = checksums.VerifiedIndex(dirpath)
+        index.digest_many(paths)
+        index.save()
+        timed(
+            "warm index (no hashing)",
+            checksums.VerifiedIndex(dirpath).digest_many,
+            paths,
+        )
+
+        print(f"speedup: {serial / parallel:.1f}x")
+
+
+def urls_benchmark(args):
+    """Compare reversing every file's contents url with a precomputed prefix"""
+    path = str(Path(tempfile.gettempdir()) / "outputs" / "outputs.json")
+    files = [(f"output_{i // 3}", f"output {i}.csv") for i in range(args.files)]
+    print(f"{args.files} files")
+
+    def reverse_each():
+        return [
+            utils.reverse_with_params(
+                {"path": path, "output": output, "filename": filename},
+                "contents",
+            )
+            for output, filename in files
+        ]
+
+    def prefixed():
+        prefix = utils.reverse_with_params({"path": path}, "contents")
+        return [
+            prefix
+            + "&"
+            + utils.encode_param("output", output)
+            + "&"
+            + utils.encode_param("filename", filename)
+            for output, filename in files
+        ]
+
+    before, expected = timed("reverse per file", reverse_each)
+    after, urls = timed("precomputed prefix", prefixed)
+    assert urls == expected
+
+    print(f"speedup: {before / after:.1f}x")
+
+
+class FakeOutputs(dict):
+    """Just enough of ACROOutputs for zipfile.stream"""
+
+    def __init__(self, path, outputs):
+        super().__init__(outputs)
+        self.path = path
+        self.raw_metadata = {"version": "benchmark", "results": outputs}
+
+    def get_file_path(self, output, filename):
+        return self.path.parent / filename
+
+
+def make_mixed_outputs(dirpath, count, size):
+    """A mix of outputs: compressible CSV and text, and incompressible images"""
+    outputs = {}
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            name = f"table_{i}.csv"
+            data = b"".join(
+                b"%d,%d,%.6f\n" % (row, row * 7 % 1000, row * 2654435761 % 10**6 / 7)
+                for row in range(size // 24)
+            )
+        elif kind == 1:
+            name = f"log_{i}.txt"
+            data = b"".join(
+                b"iteration %d: loss %.8f\n" % (n, 1 / (n + 1))
+                for n in range(size // 30)
+            )
+        elif kind == 2:
+            name = f"plot_{i}.png"
+            data = os.urandom(size)
+        else:
+            name = f"report_{i}.pdf"
+            data = os.urandom(size)
+        (dirpath / name).write_bytes(data)
+        outputs[f"output_{i}"] = {"status": "pass", "files": [{"name": name}]}
+    return FakeOutputs(dirpath / "results.json", outputs)
+
+
+def release_benchmark(args):
+    """Compare release zipfiles with every member stored, and with the policy"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dirpath = Path(tmp)
+        outputs = make_mixed_outputs(dirpath, args.files, args.size)
+        approved = list(outputs)
+        review = {"decisions": {name: {"state": True} for name in approved}}
+        total = args.files * args.size
+        print(f"{args.files} mixed files of {args.size} bytes, {total} bytes total")
+
+        def release(workers):
+            return sum(
+                len(chunk)
+                for chunk in zipfile.stream(outputs, review, approved, workers)
+            )
+
+        def stored_release():
+            # every member stored, as before the compression policy
+            compression_for = zipfile.compression_for
+            zipfile.compression_for = lambda name: zipfile.ZIP_STORED
+            try:
+                return release(1)
+            finally:
+                zipfile.compression_for = compression_for
+
+        _, stored_size = timed("all stored", stored_release)
+        serial, serial_size = timed("policy, 1 worker", release, 1)
+        parallel, size = timed(f"policy, {args.workers} workers", release, args.workers)
+        assert size == serial_size
+
+        print(f"size: {stored_size} bytes stored, {size} bytes with policy")
+        print(f"compression speedup: {serial / parallel:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    parser_checksums = subparsers.add_parser("checksums")
+    parser_checksums.add_argument("--files", type=int, default=500)
+    parser_checksums.add_argument("--size", type=int, default=1024 * 1024)
+    parser_checksums.add_argument(
+        "--workers", type=int, default=django.conf.settings.CHECKSUM_WORKERS
+    )
+    parser_checksums.set_defaults(func=checksums_benchmark)
+
+    parser_urls = subparsers.add_parser("urls")
+    parser_urls.add_argument("--files", type=int, default=5000)
+    parser_urls.set_defaults(func=urls_benchmark)
+
+    parser_release = subparsers.add_parser("release")
+    parser_release.add_argument("--files", type=int, default=200)
+    parser_release.add_argument("--size", type=int, default=1024 * 1024)
+    parser_release.add_argument(
+        "--workers",
+        type=int,
+        default=django.conf.settings.RELEASE_COMPRESSION_WORKERS,
+    )
+    parser_release.set_defaults(func=release_benchmark)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,3 +15,23 @@ def TEST_PATH():
 def test_outputs(tmp_path, TEST_PATH):
     shutil.copytree(TEST_PATH.parent, tmp_path, dirs_exist_ok=True)
     return models.ACROOutputs(tmp_path / TEST_PATH.name)
+
+
+@pytest.fixture(autouse=True)
+def release_cache_dir(tmp_path_factory, settings):
+    """Keep cached releases out of the real cache directory"""
+    settings.RELEASE_CACHE_DIR = tmp_path_factory.mktemp("releases")
+    return settings.RELEASE_CACHE_DIR
+
+
+@pytest.fixture(autouse=True)
+def review_store_path(tmp_path_factory, settings):
+    """Keep reviews out of the real review store"""
+    settings.REVIEW_STORE_PATH = tmp_path_factory.mktemp("reviews") / "reviews.sqlite3"
+    return settings.REVIEW_STORE_PATH
+
+
+@pytest.fixture(autouse=True)
+def metadata_write_delay(settings):
+    """Write metadata straight away, so tests can read it back"""
+    settings.METADATA_WRITE_DELAY = 0
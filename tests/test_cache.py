@@ -0,0 +1,296 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from sacro import cache, models
+
+
+@pytest.fixture
+def outputs_cache():
+    return cache.OutputsCache(models.ACROOutputs, max_bytes=10 * 1024 * 1024)
+
+
+def touch(path, delta_ns=1_000_000_000):
+    """Bump mtime deterministically, rather than relying on clock resolution"""
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + delta_ns))
+
+
+def test_stat_fingerprint_missing(tmp_path):
+    assert cache.stat_fingerprint(tmp_path / "nope") is None
+
+
+def test_cache_hit(test_outputs, outputs_cache):
+    first = outputs_cache.get(test_outputs.path)
+    second = outputs_cache.get(test_outputs.path)
+
+    assert first is second
+    assert dict(first) == dict(test_outputs)
+    stats = outputs_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+    assert stats["size"] == test_outputs.path.stat().st_size
+
+
+def test_cache_miss_on_metadata_change(test_outputs, outputs_cache):
+    first = outputs_cache.get(test_outputs.path)
+    touch(test_outputs.path)
+    second = outputs_cache.get(test_outputs.path)
+
+    assert first is not second
+    assert outputs_cache.stats()["misses"] == 2
+    # the stale entry for the same path is replaced, not kept
+    assert outputs_cache.stats()["entries"] == 1
+
+
+def test_cache_miss_on_config_change(test_outputs, outputs_cache):
+    first = outputs_cache.get(test_outputs.path)
+    config = test_outputs.path.parent / "config.json"
+    config.write_text(json.dumps({"safe_threshold": 1000}))
+    second = outputs_cache.get(test_outputs.path)
+
+    assert first is not second
+    assert second.config == {"safe_threshold": 1000}
+
+
+def test_cache_miss_on_output_file_change(test_outputs, outputs_cache):
+    first = outputs_cache.get(test_outputs.path)
+    output = list(test_outputs)[0]
+    filename = test_outputs[output]["files"][0]["name"]
+    path = test_outputs.get_file_path(output, filename)
+    path.write_bytes(path.read_bytes() + b"tampered")
+
+    second = outputs_cache.get(test_outputs.path)
+
+    assert first is not second
+    assert second[output]["files"][0]["checksum_valid"] is False
+
+
+def test_cache_invalidate(test_outputs, outputs_cache):
+    outputs_cache.get(test_outputs.path)
+    outputs_cache.invalidate(test_outputs.path)
+    assert outputs_cache.stats()["entries"] == 0
+
+    outputs_cache.get(test_outputs.path)
+    outputs_cache.invalidate()
+    assert outputs_cache.stats()["entries"] == 0
+
+
+def test_cache_eviction(test_outputs, tmp_path):
+    size = test_outputs.path.stat().st_size
+    outputs_cache = cache.OutputsCache(models.ACROOutputs, max_bytes=size)
+
+    other = tmp_path / "other.json"
+    other.write_text(test_outputs.path.read_text())
+
+    outputs_cache.get(test_outputs.path)
+    outputs_cache.get(other)
+
+    stats = outputs_cache.stats()
+    assert stats["entries"] == 1
+    assert stats["evictions"] == 1
+
+    # the least recently used entry was evicted
+    outputs_cache.get(other)
+    assert outputs_cache.stats()["hits"] == 1
+
+
+def test_cache_max_bytes_from_settings(settings):
+    settings.OUTPUTS_CACHE_MAX_BYTES = 1234
+    assert cache.OutputsCache(models.ACROOutputs).max_bytes == 1234
+
+
+def test_load_from_path_uses_cache(test_outputs, monkeypatch):
+    outputs_cache = cache.OutputsCache(models.ACROOutputs, max_bytes=1024 * 1024)
+    monkeypatch.setattr(models, "OUTPUTS_CACHE", outputs_cache)
+
+    assert models.load_from_path(test_outputs.path) is models.load_from_path(
+        test_outputs.path
+    )
+    assert outputs_cache.stats()["hits"] == 1
+
+
+def test_cache_refresh(test_outputs, outputs_cache, tmp_path_factory):
+    other_dir = tmp_path_factory.mktemp("other")
+    other = other_dir / "other.json"
+    other.write_text(test_outputs.path.read_text())
+    cached = outputs_cache.get(test_outputs.path)
+    cached_other = outputs_cache.get(other)
+
+    output = list(cached)[0]
+    filedata = cached[output]["files"][0]
+    path = cached.get_file_path(output, filedata["name"])
+    path.write_bytes(path.read_bytes() + b"tampered")
+
+    outputs_cache.refresh(test_outputs.path.parent, {filedata["name"], "new.txt"})
+
+    # reverified in place, and still fresh
+    assert filedata["checksum_valid"] is False
+    assert outputs_cache.get(test_outputs.path) is cached
+    assert outputs_cache.get(other) is cached_other
+
+
+def test_cache_refresh_unknown_files(test_outputs, outputs_cache):
+    cached = outputs_cache.get(test_outputs.path)
+
+    outputs_cache.refresh(test_outputs.path.parent, {"new.txt"})
+
+    assert outputs_cache.get(test_outputs.path) is cached
+
+
+def test_cache_refresh_config(test_outputs, outputs_cache):
+    cached = outputs_cache.get(test_outputs.path)
+
+    outputs_cache.refresh(test_outputs.path.parent, {"config.json"})
+
+    assert outputs_cache.stats()["entries"] == 0
+    assert outputs_cache.get(test_outputs.path) is not cached
+
+
+@pytest.fixture
+def release_cache(tmp_path):
+    return cache.ReleaseCache(tmp_path / "releases", max_bytes=100)
+
+
+def test_release_cache_default_settings(release_cache_dir, settings):
+    settings.RELEASE_CACHE_MAX_BYTES = 123
+    release_cache = cache.ReleaseCache()
+
+    assert release_cache.directory == release_cache_dir
+    assert release_cache.max_bytes == 123
+
+
+def test_release_cache_store_and_get(release_cache):
+    assert release_cache.get("key") is None
+
+    chunks = list(release_cache.store("key", iter([b"one", b"two"])))
+
+    assert chunks == [b"one", b"two"]
+    with release_cache.get("key") as f:
+        assert f.read() == b"onetwo"
+    assert (release_cache.hits, release_cache.misses) == (1, 1)
+    # no partial files left behind
+    assert sorted(p.name for p in release_cache.directory.iterdir()) == [
+        "key.sha256",
+        "key.zip",
+    ]
+    assert release_cache.directory.stat().st_mode & 0o777 == 0o700
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        lambda release_cache: release_cache.path("key").write_bytes(b"planted"),
+        lambda release_cache: release_cache.digest_path("key").write_text("other"),
+    ],
+)
+def test_release_cache_checks_digest(release_cache, tamper, caplog):
+    list(release_cache.store("key", iter([b"one", b"two"])))
+    tamper(release_cache)
+
+    assert release_cache.get("key") is None
+    assert "discarding cached release key" in caplog.text
+    assert list(release_cache.directory.iterdir()) == []
+    assert (release_cache.hits, release_cache.misses) == (0, 1)
+
+
+def test_release_cache_without_digest(release_cache):
+    list(release_cache.store("key", iter([b"one", b"two"])))
+    release_cache.digest_path("key").unlink()
+
+    assert release_cache.get("key") is None
+
+
+def test_release_cache_digest_write_error(release_cache, monkeypatch, caplog):
+    def fail(*args, **kwargs):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(Path, "write_text", fail)
+
+    assert list(release_cache.store("key", iter([b"one"]))) == [b"one"]
+    assert "not caching release key: read-only" in caplog.text
+    assert release_cache.get("key") is None
+    assert list(release_cache.directory.iterdir()) == []
+
+
+def test_release_cache_abandoned(release_cache):
+    chunks = release_cache.store("key", iter([b"one", b"two"]))
+    assert next(chunks) == b"one"
+    chunks.close()
+
+    assert release_cache.get("key") is None
+    assert list(release_cache.directory.iterdir()) == []
+
+
+def test_release_cache_source_error(release_cache):
+    def source():
+        yield b"one"
+        raise OSError("gone")
+
+    chunks = release_cache.store("key", source())
+    assert next(chunks) == b"one"
+    with pytest.raises(OSError):
+        next(chunks)
+
+    assert release_cache.get("key") is None
+    assert list(release_cache.directory.iterdir()) == []
+
+
+def test_release_cache_unwritable_directory(tmp_path, caplog):
+    (tmp_path / "file").touch()
+    release_cache = cache.ReleaseCache(tmp_path / "file" / "releases")
+
+    assert list(release_cache.store("key", iter([b"one"]))) == [b"one"]
+    assert "not caching release key" in caplog.text
+
+
+def test_release_cache_write_error(release_cache, monkeypatch, caplog):
+    named_temporary_file = cache.tempfile.NamedTemporaryFile
+
+    class FullFile:
+        def __init__(self, **kwargs):
+            self.f = named_temporary_file(**kwargs)
+            self.name = self.f.name
+
+        def write(self, data):
+            raise OSError("full")
+
+        def close(self):
+            self.f.close()
+
+    monkeypatch.setattr(cache.tempfile, "NamedTemporaryFile", FullFile)
+
+    assert list(release_cache.store("key", iter([b"one", b"two"]))) == [
+        b"one",
+        b"two",
+    ]
+    assert "not caching release key: full" in caplog.text
+    assert release_cache.get("key") is None
+    assert list(release_cache.directory.iterdir()) == []
+
+
+def test_release_cache_evicts_least_recently_used(release_cache):
+    for i, key in enumerate(["old", "used", "new"]):
+        list(release_cache.store(key, iter([b"x" * 40])))
+        path = release_cache.path(key)
+        os.utime(path, ns=(0, i * 1_000_000_000))
+        # within budget so far
+        assert path.exists()
+
+    # reading an entry marks it as recently used
+    release_cache.get("used").close()
+    list(release_cache.store("newest", iter([b"x" * 40])))
+
+    remaining = {p.stem for p in release_cache.directory.glob("*.zip")}
+    assert remaining == {"used", "newest"}
+    digests = {p.stem for p in release_cache.directory.glob("*.sha256")}
+    assert digests == {"used", "newest"}
+
+
+def test_release_cache_keeps_newest_over_budget(release_cache):
+    list(release_cache.store("big", iter([b"x" * 1000])))
+
+    assert release_cache.path("big").exists()
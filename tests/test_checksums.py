@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import tracemalloc
+
+import pytest
+
+from sacro import checksums
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    calls = []
+    original = checksums.sha256_file
+
+    def counting_sha256_file(path):
+        calls.append(path)
+        return original(path)
+
+    monkeypatch.setattr(checksums, "sha256_file", counting_sha256_file)
+    return calls
+
+
+def test_sha256_file(tmp_path):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    assert checksums.sha256_file(path) == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+
+
+def test_verified_index_skips_unchanged_files(tmp_path, hash_calls):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n")
+
+    index = checksums.VerifiedIndex(tmp_path)
+    digest = index.digest(path)
+    index.save()
+
+    # a fresh index reads the sidecar back and does not rehash
+    index = checksums.VerifiedIndex(tmp_path)
+    assert index.digest(path) == digest
+    assert len(hash_calls) == 1
+    assert not index.dirty
+
+
+def test_verified_index_rehashes_changed_files(tmp_path, hash_calls):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n")
+
+    index = checksums.VerifiedIndex(tmp_path)
+    index.digest(path)
+
+    path.write_text("a,b\n1,3\n")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert index.digest(path) == hashlib.sha256(b"a,b\n1,3\n").hexdigest()
+    assert len(hash_calls) == 2
+
+
+def test_verified_index_force(tmp_path, hash_calls):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n")
+
+    index = checksums.VerifiedIndex(tmp_path)
+    index.digest(path)
+    index.digest(path, force=True)
+
+    assert len(hash_calls) == 2
+
+
+def test_verified_index_save_prunes_missing_files(tmp_path):
+    kept = tmp_path / "kept.csv"
+    kept.write_text("kept")
+    removed = tmp_path / "removed.csv"
+    removed.write_text("removed")
+
+    index = checksums.VerifiedIndex(tmp_path)
+    index.digest(kept)
+    index.digest(removed)
+    removed.unlink()
+    index.save()
+
+    saved = json.loads((tmp_path / checksums.INDEX_NAME).read_text())
+    assert list(saved) == [str(kept.resolve())]
+
+
+def test_verified_index_save_noop_when_clean(tmp_path):
+    checksums.VerifiedIndex(tmp_path).save()
+    assert not (tmp_path / checksums.INDEX_NAME).exists()
+
+
+def test_verified_index_save_error(tmp_path, caplog):
+    path = tmp_path / "data.csv"
+    path.write_text("data")
+    index = checksums.VerifiedIndex(tmp_path)
+    index.digest(path)
+    index.path = tmp_path / "missing-dir" / checksums.INDEX_NAME
+
+    index.save()
+
+    assert index.dirty
+    assert "could not write checksum index" in caplog.text
+
+
+@pytest.mark.parametrize("content", ["not json", "[1, 2]"])
+def test_verified_index_ignores_bad_sidecar(tmp_path, content):
+    (tmp_path / checksums.INDEX_NAME).write_text(content)
+    assert checksums.VerifiedIndex(tmp_path).entries == {}
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_verified_index_digest_many(tmp_path, hash_calls, workers):
+    paths = []
+    for i in range(10):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(str(i) * (i + 1))
+        paths.append(path)
+
+    index = checksums.VerifiedIndex(tmp_path)
+    index.digest(paths[0])
+
+    digests = index.digest_many(paths, workers=workers)
+
+    assert digests == {p: hashlib.sha256(p.read_bytes()).hexdigest() for p in paths}
+    # the first file was already in the index
+    assert len(hash_calls) == 10
+
+
+def test_verified_index_digest_many_workers_from_settings(tmp_path, settings):
+    settings.CHECKSUM_WORKERS = 2
+    paths = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    for path in paths:
+        path.write_text(path.name)
+
+    index = checksums.VerifiedIndex(tmp_path)
+
+    assert set(index.digest_many(paths)) == set(paths)
+    assert index.dirty
+
+
+def test_sha256_file_memory_is_bounded(tmp_path):
+    path = tmp_path / "large.bin"
+    block = os.urandom(1024 * 1024)
+    expected = hashlib.sha256()
+    with path.open("wb") as f:
+        for _ in range(32):
+            f.write(block)
+            expected.update(block)
+
+    tracemalloc.start()
+    try:
+        digest = checksums.sha256_file(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert digest == expected.hexdigest()
+    # a single chunk buffer plus small change, not the 32MB file
+    assert peak < checksums.CHUNK_SIZE * 2
+
+
+def test_sha256_file_small_chunks(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_bytes(b"x" * 1000)
+    assert (
+        checksums.sha256_file(path, chunk_size=7)
+        == hashlib.sha256(b"x" * 1000).hexdigest()
+    )
@@ -0,0 +1,424 @@
+import json
+import threading
+
+import pytest
+
+from sacro import drafts, jsonpatch, writer
+
+
+@pytest.fixture
+def metadata(tmp_path):
+    path = tmp_path / "outputs.json"
+    path.write_text(json.dumps({"version": "0.4.5", "results": {"a": {}}}))
+    return path
+
+
+def read_draft(metadata):
+    return json.loads(drafts.draft_path(metadata).read_text())
+
+
+def read_journal_lines(metadata):
+    lines = drafts.journal_path(metadata).read_text().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def wait_for_background():
+    drafts.BACKGROUND.submit(lambda: None).result()
+
+
+def add_title(store, metadata, title):
+    return store.patch(metadata, [{"op": "add", "path": "/title", "value": title}])
+
+
+def test_draft_path(metadata):
+    assert drafts.draft_path(metadata) == metadata.parent / "results.json"
+    assert drafts.journal_path(metadata) == metadata.parent / ".results.json.journal"
+
+
+def test_draft_store_get(metadata):
+    store = drafts.DraftStore()
+
+    draft = store.get(metadata)
+    assert draft.document == {"version": "0.4.5", "results": {"a": {}}}
+    assert draft.source == metadata
+    assert draft.revision == 0
+
+    # held between calls
+    assert store.get(metadata) is draft
+
+
+def test_draft_store_get_prefers_draft(metadata):
+    drafts.draft_path(metadata).write_text(json.dumps({"results": {"draft": {}}}))
+
+    draft = drafts.DraftStore().get(metadata)
+
+    assert draft.document == {"results": {"draft": {}}}
+    assert draft.source == drafts.draft_path(metadata)
+
+
+def test_draft_store_patch(metadata):
+    store = drafts.DraftStore()
+
+    revision = store.patch(
+        metadata, [{"op": "add", "path": "/results/a/comments", "value": ["hi"]}]
+    )
+    assert revision == 1
+    assert store.get(metadata).revision == 1
+    # the first change writes the draft file
+    assert read_draft(metadata)["results"]["a"] == {"comments": ["hi"]}
+
+    revision = store.patch(
+        metadata,
+        [{"op": "add", "path": "/results/a/comments/-", "value": "there"}],
+        revision=1,
+    )
+    assert revision == 2
+    assert store.get(metadata).document["results"]["a"] == {"comments": ["hi", "there"]}
+
+    # later ones are journalled
+    assert read_draft(metadata)["results"]["a"] == {"comments": ["hi"]}
+    journal = read_journal_lines(metadata)
+    assert journal[-1]["revision"] == 2
+
+    # and replayed when the draft is next read, eg after a restart
+    draft = drafts.DraftStore().get(metadata)
+    assert draft.document["results"]["a"] == {"comments": ["hi", "there"]}
+    assert draft.revision == 2
+
+    # the metadata itself is untouched
+    assert json.loads(metadata.read_text())["results"]["a"] == {}
+
+
+def test_draft_store_patch_conflict(metadata):
+    store = drafts.DraftStore()
+    store.patch(metadata, [{"op": "add", "path": "/title", "value": "one"}])
+
+    with pytest.raises(drafts.RevisionConflict) as exc_info:
+        store.patch(metadata, [{"op": "add", "path": "/title", "value": "two"}], 0)
+
+    assert exc_info.value.revision == 1
+    assert "revision 1" in str(exc_info.value)
+    assert store.get(metadata).document["title"] == "one"
+
+
+def test_draft_store_same_draft_by_either_path(metadata):
+    store = drafts.DraftStore()
+    assert add_title(store, metadata, "first") == 1
+    # once it has been saved, the session is opened from its draft file
+    draft = drafts.draft_path(metadata)
+    assert store.get(draft) is store.get(metadata)
+
+    with pytest.raises(drafts.RevisionConflict):
+        store.patch(draft, [{"op": "add", "path": "/title", "value": "b"}], 0)
+    assert store.patch(draft, [{"op": "add", "path": "/title", "value": "b"}], 1) == 2
+    with pytest.raises(drafts.RevisionConflict):
+        store.patch(metadata, [{"op": "add", "path": "/title", "value": "c"}], 1)
+
+    store.discard(draft)
+    assert store.get(metadata).document["title"] == "b"
+
+
+def test_draft_store_changing(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+
+    with store.changing(metadata, revision=1) as (document, patch):
+        assert document["title"] == "one"
+        # held until we are done
+        assert store.get(metadata).lock.locked()
+        assert patch([{"op": "add", "path": "/title", "value": "two"}]) == 2
+        assert patch([{"op": "add", "path": "/title", "value": "three"}]) == 3
+
+    assert store.get(metadata).document["title"] == "three"
+
+    with pytest.raises(drafts.RevisionConflict):
+        with store.changing(metadata, revision=1):
+            pytest.fail("changes made at the wrong revision")  # pragma: no cover
+
+
+def test_draft_store_patch_invalid(metadata):
+    store = drafts.DraftStore()
+
+    with pytest.raises(jsonpatch.PatchError):
+        store.patch(metadata, [{"op": "remove", "path": "/results/missing"}])
+
+    assert store.get(metadata).revision == 0
+    assert not drafts.draft_path(metadata).exists()
+
+
+def test_draft_store_replace(metadata):
+    store = drafts.DraftStore()
+
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+
+    assert store.replace(metadata, {"results": {}}) == 3
+    assert store.get(metadata).document == {"results": {}}
+    assert read_draft(metadata) == {"results": {}}
+    # the journal starts again
+    assert read_journal_lines(metadata) == [
+        {"base": store.get(metadata).base_digest, "revision": 3}
+    ]
+
+
+def test_draft_store_rereads_changed_file(metadata):
+    store = drafts.DraftStore()
+    store.patch(metadata, [{"op": "add", "path": "/title", "value": "one"}])
+
+    # eg the researcher edits the draft by hand
+    drafts.draft_path(metadata).write_text(json.dumps({"title": "changed"}))
+
+    draft = store.get(metadata)
+    assert draft.document == {"title": "changed"}
+    assert draft.revision == 2
+
+
+def test_draft_store_write_error(metadata, monkeypatch):
+    store = drafts.DraftStore()
+    store.get(metadata)
+
+    def fail(*args, **kwargs):
+        raise OSError("Permission denied")
+
+    with monkeypatch.context() as m:
+        m.setattr("builtins.open", fail)
+        with pytest.raises(OSError):
+            store.patch(metadata, [{"op": "add", "path": "/title", "value": "one"}])
+
+    # what we hold is not what was saved, so it is reread
+    draft = store.get(metadata)
+    assert "title" not in draft.document
+    assert draft.revision == 2
+
+
+def test_draft_store_journal_error(metadata, monkeypatch):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+
+    def fail(*args, **kwargs):
+        raise OSError("Permission denied")
+
+    with monkeypatch.context() as m:
+        m.setattr("builtins.open", fail)
+        with pytest.raises(OSError):
+            add_title(store, metadata, "two")
+
+    draft = store.get(metadata)
+    assert draft.document["title"] == "one"
+    assert draft.revision == 3
+
+
+def test_draft_store_discard(metadata):
+    store = drafts.DraftStore()
+    draft = store.get(metadata)
+
+    store.discard(metadata)
+    store.discard(metadata)
+
+    assert store.get(metadata) is not draft
+
+
+def test_draft_store_compacts_in_background(metadata, settings):
+    settings.DRAFT_COMPACT_OPERATIONS = 3
+    store = drafts.DraftStore()
+
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+    add_title(store, metadata, "three")
+    assert read_draft(metadata)["title"] == "one"
+
+    add_title(store, metadata, "four")
+    wait_for_background()
+
+    assert read_draft(metadata)["title"] == "four"
+    draft = store.get(metadata)
+    assert draft.entries == []
+    assert not draft.compacting
+    assert read_journal_lines(metadata) == [{"base": draft.base_digest, "revision": 4}]
+    assert drafts.DraftStore().get(metadata).revision == 4
+
+
+def test_draft_store_background_compaction_keeps_later_changes(
+    metadata, settings, monkeypatch
+):
+    settings.DRAFT_COMPACT_OPERATIONS = 1
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+
+    # changes made while the draft is written out are kept in the journal
+    original = writer.write_atomically
+
+    def write_atomically(path, data, before_replace=None):
+        if path.name.endswith(".compacting"):
+            add_title(store, metadata, "three")
+        original(path, data, before_replace)
+
+    monkeypatch.setattr(writer, "write_atomically", write_atomically)
+    add_title(store, metadata, "two")
+    wait_for_background()
+    monkeypatch.undo()
+
+    assert read_draft(metadata)["title"] == "two"
+    assert [line["revision"] for line in read_journal_lines(metadata)] == [2, 3]
+    draft = drafts.DraftStore().get(metadata)
+    assert draft.document["title"] == "three"
+    assert draft.revision == 3
+
+
+def test_draft_store_background_compaction_superseded(metadata, settings):
+    settings.DRAFT_COMPACT_OPERATIONS = 1
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+
+    # hold up the background thread
+    release = threading.Event()
+    drafts.BACKGROUND.submit(release.wait)
+    add_title(store, metadata, "two")
+    store.replace(metadata, {"title": "replaced"})
+    release.set()
+    wait_for_background()
+
+    assert read_draft(metadata) == {"title": "replaced"}
+    assert store.get(metadata).revision == 3
+    assert not list(metadata.parent.glob(".*.compacting"))
+
+
+def test_draft_store_background_compaction_error(metadata, settings, monkeypatch):
+    settings.DRAFT_COMPACT_OPERATIONS = 1
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_write_base", fail)
+    add_title(store, metadata, "two")
+    wait_for_background()
+
+    assert not list(metadata.parent.glob(".*.compacting"))
+    monkeypatch.undo()
+
+    # reread from the draft file and journal
+    draft = store.get(metadata)
+    assert draft.document["title"] == "two"
+    assert draft.revision == 3
+
+
+def test_draft_store_compact(metadata):
+    store = drafts.DraftStore()
+
+    # nothing to do
+    store.compact(metadata)
+    assert not drafts.draft_path(metadata).exists()
+
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+    store.compact(metadata)
+
+    assert read_draft(metadata)["title"] == "two"
+    assert store.get(metadata).entries == []
+
+    mtime = drafts.draft_path(metadata).stat().st_mtime_ns
+    store.compact(metadata)
+    assert drafts.draft_path(metadata).stat().st_mtime_ns == mtime
+
+
+def test_draft_store_recovers_from_crash_while_compacting(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+    draft = store.get(metadata)
+
+    # as if we crashed after recording the new base, but before replacing
+    # the draft file with it
+    journal = drafts.journal_path(metadata)
+    with journal.open("a") as f:
+        f.write(json.dumps({"base": "new", "revision": 2}) + "\n")
+    assert drafts.DraftStore().get(metadata).document["title"] == "two"
+
+    # and after replacing it
+    data = json.dumps(draft.document, indent=2).encode()
+    drafts.draft_path(metadata).write_bytes(data)
+    with journal.open("a") as f:
+        f.write(json.dumps({"base": drafts.digest(data), "revision": 2}) + "\n")
+    recovered = drafts.DraftStore().get(metadata)
+    assert recovered.document["title"] == "two"
+    assert recovered.revision == 2
+    assert recovered.entries == []
+
+
+def test_draft_store_ignores_torn_journal_line(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+    with drafts.journal_path(metadata).open("a") as f:
+        f.write('{"revision": 3, "operations": [{"op": "add", "pa')
+
+    draft = drafts.DraftStore().get(metadata)
+
+    assert draft.document["title"] == "two"
+    assert draft.revision == 2
+
+
+def test_draft_store_ignores_journal_for_other_draft(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+
+    # eg the draft was replaced by hand
+    drafts.draft_path(metadata).write_text(json.dumps({"title": "by hand"}))
+    other = drafts.DraftStore()
+    assert other.get(metadata).document == {"title": "by hand"}
+
+    # and a new journal is started for it
+    add_title(other, metadata, "three")
+    assert drafts.DraftStore().get(metadata).document == {"title": "three"}
+
+
+def test_draft_store_stops_replaying_at_bad_change(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    with drafts.journal_path(metadata).open("a") as f:
+        bad = {"revision": 2, "operations": [{"op": "remove", "path": "/missing"}]}
+        f.write(json.dumps(bad) + "\n")
+
+    draft = drafts.DraftStore().get(metadata)
+
+    assert draft.document["title"] == "one"
+    assert draft.revision == 1
+
+
+def test_read_journal(tmp_path):
+    path = tmp_path / "journal"
+    assert drafts.read_journal(path, "base") == (None, [])
+
+    path.write_text("")
+    assert drafts.read_journal(path, "base") == (None, [])
+
+    path.write_text(json.dumps({"base": "other", "revision": 1}) + "\n")
+    assert drafts.read_journal(path, "base") == (None, [])
+
+
+def test_draft_store_remove(metadata):
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+
+    store.remove(metadata)
+
+    assert not drafts.draft_path(metadata).exists()
+    assert not drafts.journal_path(metadata).exists()
+    assert metadata.exists()
+    assert "title" not in store.get(metadata).document
+
+
+def test_draft_store_remove_draft_is_metadata(metadata):
+    metadata = metadata.rename(drafts.draft_path(metadata))
+    store = drafts.DraftStore()
+    add_title(store, metadata, "one")
+    add_title(store, metadata, "two")
+
+    store.remove(metadata)
+
+    assert metadata.exists()
+    assert not drafts.journal_path(metadata).exists()
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+
+from django.core.handlers.asgi import ASGIHandler
+from django.http import HttpResponse, StreamingHttpResponse
+
+from sacro import cache, handlers
+from sacro.handlers import StreamingASGIHandler
+
+
+def send_response(response, receive=None):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def main():
+        handlers.RECEIVE.set(receive)
+        await StreamingASGIHandler().send_response(response, send)
+        return threading.get_ident()
+
+    return asyncio.run(main()), sent
+
+
+def test_streaming_response_generated_in_thread():
+    threads = []
+
+    def content():
+        for part in [b"one", b"two"]:
+            threads.append(threading.get_ident())
+            yield part
+
+    response = StreamingHttpResponse(content(), content_type="application/zip")
+    response.set_cookie("name", "value")
+
+    loop_thread, sent = send_response(response)
+
+    start = sent[0]
+    assert start["status"] == 200
+    assert (b"Content-Type", b"application/zip") in start["headers"]
+    assert b"Set-Cookie" in [name for name, _ in start["headers"]]
+    assert [m.get("body") for m in sent[1:]] == [b"one", b"two", None]
+    assert loop_thread not in threads
+
+
+def test_other_responses():
+    loop_thread, sent = send_response(HttpResponse(b"hello"))
+
+    assert [m.get("body") for m in sent] == [None, b"hello"]
+
+
+def test_streaming_response_client_disconnects():
+    generated = []
+    closed = threading.Event()
+
+    def content():
+        try:
+            while True:
+                generated.append(b"part")
+                yield b"part"
+        finally:
+            closed.set()
+
+    async def receive():
+        # the client goes away once it has had a few parts
+        while len(generated) < 3:
+            await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    response = StreamingHttpResponse(content())
+
+    _, sent = send_response(response, receive)
+
+    assert closed.is_set()
+    # the response was never finished
+    assert all(m.get("more_body") for m in sent[1:])
+
+
+def test_streaming_response_client_disconnects_not_cached(tmp_path):
+    release_cache = cache.ReleaseCache(tmp_path / "releases")
+    generated = []
+
+    async def receive():
+        while len(generated) < 3:
+            await asyncio.sleep(0.01)
+        return {"type": "http.disconnect"}
+
+    def content():
+        while True:
+            generated.append(b"part")
+            yield b"part"
+
+    response = StreamingHttpResponse(release_cache.store("key", content()))
+
+    send_response(response, receive)
+
+    assert release_cache.get("key") is None
+    assert list(release_cache.directory.iterdir()) == []
+
+
+def test_streaming_response_receive_other_messages():
+    messages = [{"type": "http.request"}]
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        # no disconnect before the response is complete
+        await asyncio.Event().wait()
+
+    response = StreamingHttpResponse(iter([b"one", b"two"]))
+
+    _, sent = send_response(response, receive)
+
+    assert [m.get("body") for m in sent[1:]] == [b"one", b"two", None]
+    assert not messages
+
+
+def test_handle_sets_receive(monkeypatch):
+    seen = []
+
+    async def handle(self, scope, receive, send):
+        seen.append(handlers.RECEIVE.get())
+
+    monkeypatch.setattr(ASGIHandler, "handle", handle)
+
+    async def receive():  # pragma: no cover
+        pass
+
+    asyncio.run(StreamingASGIHandler().handle({}, receive, None))
+
+    assert seen == [receive]
+    assert handlers.RECEIVE.get() is None
@@ -0,0 +1,145 @@
+import pytest
+
+from sacro import jsonpatch
+
+
+def document():
+    return {
+        "results": {
+            "a": {"comments": ["one", "two"], "exception": None},
+            "b/c": {"comments": []},
+        },
+        "version": "0.4.5",
+    }
+
+
+def test_pointer():
+    assert jsonpatch.pointer() == ""
+    assert jsonpatch.pointer("results", "a/b~c", 0) == "/results/a~1b~0c/0"
+    assert jsonpatch.parse_pointer("/results/a~1b~0c/0") == ["results", "a/b~c", "0"]
+    assert jsonpatch.parse_pointer("") == []
+
+
+@pytest.mark.parametrize("pointer", ["results", 1])
+def test_parse_pointer_invalid(pointer):
+    with pytest.raises(jsonpatch.PatchError):
+        jsonpatch.parse_pointer(pointer)
+
+
+@pytest.mark.parametrize(
+    "operation,expected",
+    [
+        (
+            {"op": "add", "path": "/results/a/comments/-", "value": "three"},
+            ["one", "two", "three"],
+        ),
+        (
+            {"op": "add", "path": "/results/a/comments/0", "value": "zero"},
+            ["zero", "one", "two"],
+        ),
+        (
+            {"op": "add", "path": "/results/a/comments", "value": ["new"]},
+            ["new"],
+        ),
+        ({"op": "remove", "path": "/results/a/comments/0"}, ["two"]),
+        (
+            {"op": "replace", "path": "/results/a/comments/1", "value": "2"},
+            ["one", "2"],
+        ),
+        (
+            {
+                "op": "move",
+                "from": "/results/a/comments/0",
+                "path": "/results/a/comments/-",
+            },
+            ["two", "one"],
+        ),
+        (
+            {
+                "op": "copy",
+                "from": "/results/a/comments/1",
+                "path": "/results/a/comments/0",
+            },
+            ["two", "one", "two"],
+        ),
+        (
+            {"op": "test", "path": "/results/a/comments/0", "value": "one"},
+            ["one", "two"],
+        ),
+    ],
+)
+def test_apply(operation, expected):
+    doc = document()
+    assert jsonpatch.apply(doc, [operation]) is doc
+    assert doc["results"]["a"]["comments"] == expected
+
+
+def test_apply_objects():
+    doc = document()
+    jsonpatch.apply(
+        doc,
+        [
+            {"op": "add", "path": "/results/new", "value": {"comments": []}},
+            {"op": "move", "from": "/results/b~1c", "path": "/results/moved"},
+            {"op": "copy", "from": "/results/a", "path": "/results/copied"},
+            {"op": "remove", "path": "/version"},
+        ],
+    )
+
+    assert sorted(doc["results"]) == ["a", "copied", "moved", "new"]
+    assert "version" not in doc
+
+    # copies are independent of the original
+    doc["results"]["copied"]["comments"].append("three")
+    assert doc["results"]["a"]["comments"] == ["one", "two"]
+
+
+@pytest.mark.parametrize(
+    "operation",
+    [
+        {"op": "test", "path": "/results/a/comments/0", "value": "two"},
+        {"op": "remove", "path": "/results/missing"},
+        {"op": "replace", "path": "/results/missing", "value": 1},
+        {"op": "add", "path": "/results/missing/comments", "value": []},
+        {"op": "add", "path": "/results/a/comments/3", "value": "x"},
+        {"op": "add", "path": "/results/a/comments/01", "value": "x"},
+        {"op": "add", "path": "/results/a/comments/x", "value": "x"},
+        {"op": "remove", "path": "/results/a/comments/-"},
+        {"op": "add", "path": "/version/0", "value": "x"},
+        {"op": "add", "path": "/version/0/x", "value": "x"},
+        {"op": "add", "path": "", "value": {}},
+        {"op": "add", "path": "/results/a"},
+        {"op": "copy", "path": "/results/a"},
+        {"op": "move", "from": "/results", "path": "/results/a/moved"},
+        {"op": "move", "from": "/results/a", "path": "/results/missing/a"},
+        {"op": "frobnicate", "path": "/results"},
+        {"path": "/results"},
+        "add",
+    ],
+)
+def test_apply_invalid(operation):
+    with pytest.raises(jsonpatch.PatchError):
+        jsonpatch.apply(document(), [operation])
+
+
+def test_apply_is_atomic():
+    doc = document()
+    operations = [
+        {"op": "add", "path": "/results/a/comments/-", "value": "three"},
+        {"op": "replace", "path": "/results/a/exception", "value": "please"},
+        {"op": "move", "from": "/results/b~1c", "path": "/results/d"},
+        {"op": "remove", "path": "/results/a/comments/0"},
+        {"op": "add", "path": "/title", "value": "session"},
+        {"op": "add", "path": "/version", "value": "1.0"},
+        {"op": "test", "path": "/version", "value": "wrong"},
+    ]
+
+    with pytest.raises(jsonpatch.PatchError, match="Test failed"):
+        jsonpatch.apply(doc, operations)
+
+    assert doc == document()
+
+
+def test_apply_not_a_list():
+    with pytest.raises(jsonpatch.PatchError):
+        jsonpatch.apply(document(), {"op": "remove", "path": "/version"})
@@ -1,8 +1,9 @@
 import json
+import os
 
 import pytest
 
-from sacro import models
+from sacro import checksums, models, utils, writer
 
 
 def test_outputs_annotation(test_outputs):
@@ -15,15 +16,52 @@ def test_outputs_annotation(test_outputs):
 
             cells = filedata.get("sdc", {}).get("cells", {})
             cell_index = filedata["cell_index"]
+            assert cell_index == models.build_cell_index(cells)
 
-            if cells == {}:
-                assert cell_index == {}
-                continue
 
-            for flag, indicies in cells.items():
-                for x, y in indicies:
-                    key = f"{x},{y}"
-                    assert key in cell_index
+def test_outputs_annotation_urls_match_reverse(tmp_path):
+    for name in ["plain.csv", "a b&c=d.csv", "100%+ü #1?.txt"]:
+        (tmp_path / name).write_text("data")
+    models.scaffold_acro_metadata(tmp_path / "outputs.json")
+
+    outputs = models.ACROOutputs(tmp_path / "outputs.json")
+
+    for output, metadata in outputs.items():
+        for filedata in metadata["files"]:
+            assert filedata["url"] == utils.reverse_with_params(
+                {
+                    "path": str(outputs.path),
+                    "output": output,
+                    "filename": filedata["name"],
+                },
+                "contents",
+            )
+
+
+def test_build_cell_index():
+    cells = {
+        "negative": [],
+        "threshold": [[2, 2], [1, 0], [2, 0]],
+        "p-ratio": [[1, 0], [2, 0], [2, 1]],
+    }
+
+    cell_index = models.build_cell_index(cells)
+
+    assert cell_index == {
+        "flags": ["negative", "threshold", "p-ratio"],
+        "rows": [1, 2, 2, 2],
+        "cols": [0, 0, 1, 2],
+        "masks": [0b110, 0b110, 0b100, 0b010],
+    }
+
+
+def test_build_cell_index_empty():
+    assert models.build_cell_index({}) == {
+        "flags": [],
+        "rows": [],
+        "cols": [],
+        "masks": [],
+    }
 
 
 def test_outputs_annotation_checksum_failed(test_outputs):
@@ -46,6 +84,24 @@ def test_outputs_annotation_checksum_failed(test_outputs):
         {"version": "1"},
         {"version": "1", "results": {"name": {"files": []}}},
         {"version": "1", "results": {"name": {"notfiles": "foo"}}},
+        {
+            "version": "1",
+            "results": {
+                "name": {
+                    "files": [
+                        {
+                            "name": "table.csv",
+                            "sdc": {
+                                "cells": {
+                                    f"flag{i}": []
+                                    for i in range(models.MAX_CELL_FLAGS + 1)
+                                }
+                            },
+                        }
+                    ]
+                }
+            },
+        },
     ],
 )
 def test_validation(data, tmp_path):
@@ -80,6 +136,43 @@ def test_find_acro_metadata(test_outputs):
         models.find_acro_metadata(dirpath)
 
 
+def test_find_acro_metadata_does_not_load_candidates(test_outputs, monkeypatch):
+    dirpath = test_outputs.path.parent
+    (dirpath / "data.json").write_text(json.dumps([{"version": 1, "results": {}}]))
+    (dirpath / "broken.json").write_text("{not json")
+
+    loaded = []
+    monkeypatch.setattr(models.ACROOutputs, "__post_init__", loaded.append)
+
+    assert models.find_acro_metadata(dirpath) == test_outputs.path
+    assert loaded == []
+
+
+def test_sniff_acro_metadata(test_outputs, tmp_path):
+    assert models.sniff_acro_metadata(test_outputs.path)
+    assert not models.sniff_acro_metadata(tmp_path / "missing.json")
+
+    path = tmp_path / "test.json"
+    for contents in [
+        "",
+        "[]",
+        "{broken",
+        "{}",
+        '{"version": "0.4.0", "results": []}',
+        '{"version": "0.4.0", "results": {"a": {"files": []}}}',
+    ]:
+        path.write_text(contents)
+        assert not models.sniff_acro_metadata(path), contents
+
+    path.write_text('  {"version": "0.4.0", "results": {}}')
+    assert models.sniff_acro_metadata(path)
+
+
+def test_sniff_acro_metadata_size_cap(test_outputs, monkeypatch):
+    monkeypatch.setattr(models, "SNIFF_MAX_BYTES", 10)
+    assert not models.sniff_acro_metadata(test_outputs.path)
+
+
 def test_find_acro_metadata_no_file(test_outputs):
     test_outputs.path.unlink()
 
@@ -93,3 +186,332 @@ def test_find_acro_metadata_no_file(test_outputs):
         assert result["type"] == "custom"
         assert result["command"] == "custom"
         assert result["summary"] == "review"
+
+
+def test_scaffold_acro_metadata_incremental(tmp_path, monkeypatch):
+    (tmp_path / "keep.txt").write_text("keep")
+    (tmp_path / "change.txt").write_text("change")
+    (tmp_path / "remove.txt").write_text("remove")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    assert set(json.loads(path.read_text())["results"]) == {
+        "keep.txt",
+        "change.txt",
+        "remove.txt",
+    }
+
+    hashed = []
+    sha256_file = checksums.sha256_file
+
+    def record(path):
+        hashed.append(path.name)
+        return sha256_file(path)
+
+    monkeypatch.setattr(checksums, "sha256_file", record)
+
+    (tmp_path / "new.txt").write_text("new")
+    (tmp_path / "change.txt").write_text("changed")
+    (tmp_path / "remove.txt").unlink()
+    # a researcher's draft is metadata, not an output
+    (tmp_path / "results.json").write_text(path.read_text())
+
+    models.scaffold_acro_metadata(path)
+
+    assert hashed == ["new.txt"]
+    results = json.loads(path.read_text())["results"]
+    assert set(results) == {"keep.txt", "change.txt", "new.txt"}
+    assert not (tmp_path / "checksums" / "remove.txt.txt").exists()
+
+    outputs = models.ACROOutputs(path)
+    assert {
+        name: metadata["files"][0]["checksum_valid"]
+        for name, metadata in outputs.items()
+    } == {"keep.txt": True, "change.txt": False, "new.txt": True}
+
+
+def test_scaffold_acro_metadata_unchanged(tmp_path):
+    (tmp_path / "output.txt").write_text("output")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    mtime = path.stat().st_mtime_ns
+
+    models.scaffold_acro_metadata(path)
+
+    assert path.stat().st_mtime_ns == mtime
+
+
+def test_scaffold_acro_metadata_keeps_other_results(tmp_path):
+    (tmp_path / "output.txt").write_text("output")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    metadata = json.loads(path.read_text())
+    metadata["results"]["custom.txt"] = {
+        "uid": "custom.txt",
+        "files": [{"name": "custom.txt"}],
+    }
+    path.write_text(json.dumps(metadata))
+
+    (tmp_path / "custom.txt").write_text("custom")
+    (tmp_path / "output.txt").write_text("changed")
+    models.scaffold_acro_metadata(path)
+
+    results = json.loads(path.read_text())["results"]
+    assert set(results) == {"output.txt", "custom.txt"}
+    assert results["custom.txt"] == metadata["results"]["custom.txt"]
+
+
+def test_scaffold_acro_metadata_ignores_acro_metadata(test_outputs, tmp_path):
+    dirpath = tmp_path / "acro"
+    dirpath.mkdir()
+    path = dirpath / "outputs.json"
+    path.write_text(test_outputs.path.read_text())
+    (dirpath / "new.txt").write_text("new")
+
+    models.scaffold_acro_metadata(path)
+
+    assert path.read_text() == test_outputs.path.read_text()
+    assert not (dirpath / "checksums").exists()
+
+
+def test_scaffold_acro_metadata_keeps_renamed_results(tmp_path):
+    (tmp_path / "output.txt").write_text("output")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    metadata = json.loads(path.read_text())
+    result = metadata["results"].pop("output.txt")
+    result["uid"] = "renamed"
+    result["files"] = [{"name": "renamed.txt"}]
+    result["comments"].append("a researcher's comment")
+    metadata["results"]["renamed"] = result
+    path.write_text(json.dumps(metadata))
+    (tmp_path / "output.txt").rename(tmp_path / "renamed.txt")
+
+    models.scaffold_acro_metadata(path)
+
+    assert json.loads(path.read_text())["results"] == {"renamed": result}
+
+
+def test_scaffold_acro_metadata_changed_keeps_annotations(tmp_path):
+    output = tmp_path / "output.txt"
+    output.write_text("output")
+    os.utime(output, (0, 0))
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    metadata = json.loads(path.read_text())
+    result = metadata["results"]["output.txt"]
+    result["status"] = "pass"
+    result["exception"] = "an exception"
+    result["comments"].append("a researcher's comment")
+    path.write_text(json.dumps(metadata))
+
+    checksum_path = tmp_path / "checksums" / "output.txt.txt"
+    checksum = checksum_path.read_text()
+
+    output.write_text("changed")
+    models.scaffold_acro_metadata(path)
+
+    changed = json.loads(path.read_text())["results"]["output.txt"]
+    assert changed["timestamp"] != result["timestamp"]
+    assert changed == {**result, "timestamp": changed["timestamp"]}
+    # the checksum it was reviewed against is kept, so it fails verification
+    assert checksum_path.read_text() == checksum
+    filedata = models.ACROOutputs(path)["output.txt"]["files"][0]
+    assert filedata["checksum_valid"] is False
+
+
+def test_scaffold_acro_metadata_ignores_empty_acro_metadata(tmp_path):
+    path = tmp_path / "outputs.json"
+    path.write_text(json.dumps({"version": "0.4.0", "results": {}}))
+    before = path.read_text()
+    (tmp_path / "new.txt").write_text("new")
+
+    models.scaffold_acro_metadata(path)
+
+    assert path.read_text() == before
+
+
+def test_scaffold_acro_metadata_empty_directory(tmp_path):
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    assert json.loads(path.read_text())["results"] == {}
+
+    (tmp_path / "new.txt").write_text("new")
+    models.scaffold_acro_metadata(path)
+
+    assert set(json.loads(path.read_text())["results"]) == {"new.txt"}
+
+
+def test_scaffold_acro_metadata_skips_taken_uid(tmp_path):
+    (tmp_path / "output.txt").write_text("output")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+    metadata = json.loads(path.read_text())
+    # a result renamed to the name of a file which is not its own
+    metadata["results"]["output.txt"]["uid"] = "other.txt"
+    metadata["results"]["other.txt"] = metadata["results"].pop("output.txt")
+    path.write_text(json.dumps(metadata))
+    (tmp_path / "other.txt").write_text("other")
+
+    models.scaffold_acro_metadata(path)
+
+    assert json.loads(path.read_text()) == metadata
+
+
+def test_scaffold_acro_metadata_keeps_pending_write(tmp_path, settings):
+    (tmp_path / "output.txt").write_text("output")
+    path = tmp_path / "outputs.json"
+    models.scaffold_acro_metadata(path)
+
+    settings.METADATA_WRITE_DELAY = 60
+    metadata = json.loads(path.read_text())
+    metadata["title"] = "pending"
+    written = writer.WRITER.write(path, json.dumps(metadata).encode(), "test")
+    (tmp_path / "new.txt").write_text("new")
+    models.scaffold_acro_metadata(path)
+
+    assert written.done()
+    metadata = json.loads(path.read_text())
+    assert metadata["title"] == "pending"
+    assert set(metadata["results"]) == {"output.txt", "new.txt"}
+
+
+def test_find_acro_metadata_rescaffolds(tmp_path):
+    (tmp_path / "output.txt").write_text("output")
+    path = models.find_acro_metadata(tmp_path)
+    (tmp_path / "new.txt").write_text("new")
+
+    assert models.find_acro_metadata(tmp_path) == path
+    assert set(json.loads(path.read_text())["results"]) == {"output.txt", "new.txt"}
+
+
+def test_reverify(test_outputs):
+    output = list(test_outputs)[0]
+    filedata = test_outputs[output]["files"][0]
+    path = test_outputs.get_file_path(output, filedata["name"])
+    checksum_path = test_outputs.path.parent / "checksums" / (path.name + ".txt")
+
+    assert test_outputs.reverify({"unrelated.txt"}) == set()
+
+    path.write_bytes(path.read_bytes() + b"tampered")
+    assert test_outputs.reverify({filedata["name"]}) == {output}
+    assert filedata["checksum_valid"] is False
+
+    path.unlink()
+    test_outputs.reverify({filedata["name"]})
+    assert filedata["checksum"] is not None
+    assert filedata["checksum_valid"] is False
+
+    checksum_path.unlink()
+    test_outputs.reverify({filedata["name"]})
+    assert filedata["checksum"] is None
+    assert filedata["checksum_valid"] is False
+
+
+def test_outputs_annotation_uses_checksum_index(test_outputs, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(checksums, "sha256_file", hashed.append)
+
+    # the fixture has already hashed every file, so reloading should not
+    reloaded = models.ACROOutputs(test_outputs.path)
+
+    assert hashed == []
+    assert dict(reloaded) == dict(test_outputs)
+
+
+def test_outputs_annotation_force_verify(test_outputs, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(checksums, "sha256_file", hashed.append)
+
+    models.ACROOutputs(test_outputs.path, force_verify=True)
+
+    assert len(hashed) == sum(len(m["files"]) for m in test_outputs.values())
+
+
+def test_load_from_path_force_verify(test_outputs, monkeypatch):
+    cached = models.load_from_path(test_outputs.path)
+    reverified = models.load_from_path(test_outputs.path, force_verify=True)
+
+    assert reverified is not cached
+    assert reverified.force_verify is True
+    assert dict(reverified) == dict(cached)
+
+
+def test_outputs_annotation_lazy(test_outputs):
+    # tamper with one file, so that we have a fresh fingerprint to verify
+    first_output = list(test_outputs)[0]
+    first_file = test_outputs[first_output]["files"][0]["name"]
+    actual_file = test_outputs.get_file_path(first_output, first_file)
+    actual_file.write_bytes(actual_file.read_bytes() + b"tampered")
+
+    outputs = models.ACROOutputs(test_outputs.path, lazy_verify=True)
+
+    assert outputs[first_output]["files"][0]["checksum_valid"] == "pending"
+    # everything else was answered from the checksum index
+    for output, metadata in outputs.items():
+        if output != first_output:
+            assert metadata["files"][0]["checksum_valid"] is True
+
+    outputs.verification.result()
+
+    assert outputs.verification_complete
+    assert outputs[first_output]["files"][0]["checksum_valid"] is False
+
+
+def test_outputs_annotation_lazy_nothing_pending(test_outputs):
+    outputs = models.ACROOutputs(test_outputs.path, lazy_verify=True)
+
+    assert outputs.verification is None
+    assert outputs.verification_complete
+    assert dict(outputs) == dict(test_outputs)
+
+
+def test_outputs_annotation_lazy_error(test_outputs, monkeypatch, settings):
+    settings.CHECKSUM_WORKERS = 1
+    last_output = list(test_outputs)[-1]
+    last_file = test_outputs[last_output]["files"][-1]["name"]
+    unreadable = test_outputs.get_file_path(last_output, last_file)
+    sha256_file = checksums.sha256_file
+
+    def fake_sha256_file(path):
+        if path == unreadable:
+            raise OSError("unreadable")
+        return sha256_file(path)
+
+    monkeypatch.setattr(checksums, "sha256_file", fake_sha256_file)
+
+    outputs = models.ACROOutputs(test_outputs.path, lazy_verify=True, force_verify=True)
+    outputs.verification.result()
+
+    for output, metadata in outputs.items():
+        for filedata in metadata["files"]:
+            expected = filedata["name"] != last_file
+            assert filedata["checksum_valid"] is expected
+
+
+def test_outputs_summary(test_outputs):
+    summary = test_outputs.summary()
+
+    assert list(summary) == list(test_outputs)
+    for name, metadata in test_outputs.items():
+        assert summary[name]["status"] == metadata["status"]
+        assert summary[name]["type"] == metadata["type"]
+        assert summary[name]["properties"]["method"] == metadata["properties"].get(
+            "method"
+        )
+        assert summary[name]["files"] == [
+            {"name": f["name"], "checksum_valid": f["checksum_valid"]}
+            for f in metadata["files"]
+        ]
+
+
+def test_outputs_digest(test_outputs):
+    digest = test_outputs.digest()
+
+    assert digest == models.ACROOutputs(test_outputs.path).digest()
+    # does not depend on whether checksums have been verified yet
+    first = list(test_outputs)[0]
+    test_outputs[first]["files"][0]["checksum_valid"] = "pending"
+    assert test_outputs.digest() == digest
+
+    test_outputs[first]["status"] = "changed"
+    assert test_outputs.digest() != digest
@@ -0,0 +1,37 @@
+from sacro import reviews
+
+
+def test_review_store(tmp_path):
+    store = reviews.ReviewStore(tmp_path / "store" / "reviews.sqlite3")
+    decisions = {"output": {"state": True, "comment": "fine 😀"}}
+
+    first = store.create(tmp_path / "results.json", "ok", decisions, "digest")
+    second = store.create(tmp_path / "other" / "results.json", "", {}, "other")
+
+    assert first != second
+    review = store.get(first)
+    assert review["id"] == first
+    assert review["path"] == (tmp_path / "results.json").resolve()
+    assert review["comment"] == "ok"
+    assert review["decisions"] == decisions
+    assert review["metadata_digest"] == "digest"
+    assert review["created"]
+    assert store.get(second)["path"].parent.name == "other"
+
+    assert store.get("unknown") is None
+
+
+def test_review_store_persists(tmp_path):
+    path = tmp_path / "reviews.sqlite3"
+    pk = reviews.ReviewStore(path).create(tmp_path, "ok", {}, "digest")
+
+    # as after a restart
+    assert reviews.ReviewStore(path).get(pk)["comment"] == "ok"
+
+
+def test_review_store_default_path(review_store_path):
+    store = reviews.ReviewStore()
+
+    assert store.path == review_store_path
+    pk = store.create(review_store_path.parent, "ok", {}, "digest")
+    assert reviews.REVIEWS.get(pk)["comment"] == "ok"
@@ -0,0 +1,123 @@
+import os
+import sys
+
+from sacro import tables
+
+
+def write_csv(path, rows):
+    path.write_text("\n".join(",".join(row) for row in rows) + "\n")
+    return path
+
+
+def test_parse_csv(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text('a,b\n1,"two\nlines"\n3,4\n')
+
+    assert tables.parse_csv(path) == (["a", "b"], [["1", "two\nlines"], ["3", "4"]])
+
+
+def test_parse_csv_empty(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("")
+
+    assert tables.parse_csv(path) == ([], [])
+
+
+def test_table_cache(tmp_path):
+    table_cache = tables.TableCache(max_bytes=1024)
+    path = write_csv(tmp_path / "table.csv", [["a"], ["1"]])
+
+    first = table_cache.get(path)
+    assert table_cache.get(path) is first
+
+    write_csv(path, [["a"], ["1"], ["2"]])
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    second = table_cache.get(path)
+
+    assert second is not first
+    assert second == (["a"], [["1"], ["2"]])
+
+
+def test_table_size():
+    rows = [[str(i), "x" * 10] for i in range(100)]
+    size = tables.table_size((["a", "b"], rows))
+
+    assert tables.table_size(([], [])) == 2 * sys.getsizeof([])
+    # far more than the 1.5KB of CSV the rows would take on disk
+    assert size > 10 * 1500
+    assert size == (
+        sys.getsizeof(rows)
+        + sys.getsizeof(["a", "b"])
+        + 2 * sys.getsizeof("a")
+        + sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in rows)
+    )
+
+
+def test_table_size_sampled(monkeypatch):
+    monkeypatch.setattr(tables, "SIZE_SAMPLE_ROWS", 10)
+    rows = [["x" * 10]] * 100
+
+    size = tables.table_size(([], rows))
+
+    assert size == sys.getsizeof(rows) + sys.getsizeof([]) + 100 * tables.row_size(
+        rows[0]
+    )
+
+
+def test_table_cache_eviction(tmp_path):
+    first = write_csv(tmp_path / "first.csv", [["a"], ["1"]])
+    second = write_csv(tmp_path / "second.csv", [["b"], ["2"]])
+    # room for one parsed table, though the files are far smaller
+    size = tables.table_size(tables.parse_csv(first))
+    table_cache = tables.TableCache(max_bytes=size)
+
+    cached = table_cache.get(first)
+    table_cache.get(second)
+
+    assert table_cache.size == tables.table_size(tables.parse_csv(second))
+    assert table_cache.get(first) is not cached
+
+
+def test_table_cache_max_bytes_from_settings(settings):
+    settings.TABLE_CACHE_MAX_BYTES = 1234
+    assert tables.TableCache().max_bytes == 1234
+
+
+def test_cells_in_window():
+    cell_index = {
+        "flags": ["threshold", "p-ratio"],
+        "rows": [0, 2, 2, 5],
+        "cols": [1, 0, 3, 2],
+        "masks": [1, 2, 3, 1],
+    }
+
+    assert tables.cells_in_window(cell_index, 1, 4) == {
+        "flags": ["threshold", "p-ratio"],
+        "rows": [2, 2],
+        "cols": [0, 3],
+        "masks": [2, 3],
+    }
+    assert tables.cells_in_window(cell_index, 6, 10)["rows"] == []
+
+
+def test_window(tmp_path):
+    rows = [["h1", "h2"]] + [[str(i), str(i * 2)] for i in range(10)]
+    path = write_csv(tmp_path / "table.csv", rows)
+    cell_index = {
+        "flags": ["threshold"],
+        "rows": [1, 4],
+        "cols": [0, 0],
+        "masks": [1, 1],
+    }
+
+    window = tables.window(path, 3, 2, cell_index)
+
+    assert window == {
+        "header": ["h1", "h2"],
+        "total": 10,
+        "offset": 3,
+        "limit": 2,
+        "rows": [["3", "6"], ["4", "8"]],
+        "cells": {"flags": ["threshold"], "rows": [4], "cols": [0], "masks": [1]},
+    }
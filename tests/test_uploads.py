@@ -0,0 +1,199 @@
+import hashlib
+import io
+from functools import partial
+
+import pytest
+
+from sacro import uploads
+
+
+@pytest.fixture
+def store():
+    return uploads.UploadStore()
+
+
+def test_write_hashed(tmp_path):
+    path = tmp_path / "output.csv"
+
+    digest = uploads.write_hashed([b"a,b\n", b"1,2\n"], path)
+
+    assert path.read_bytes() == b"a,b\n1,2\n"
+    assert digest == hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+
+
+def test_write_hashed_existing(tmp_path):
+    path = tmp_path / "output.csv"
+    path.write_bytes(b"existing")
+
+    with pytest.raises(uploads.FileExists, match="output.csv is already"):
+        uploads.write_hashed([b"a,b\n"], path)
+
+    assert path.read_bytes() == b"existing"
+
+
+def test_upload_in_chunks(tmp_path, store):
+    content = b"x" * 1000 + b"y" * 500
+    upload = store.start(tmp_path, "../output.csv", len(content))
+    assert upload.filename == "output.csv"
+    assert upload.offset == 0
+
+    assert (
+        store.write(tmp_path, upload.upload_id, 0, io.BytesIO(content[:1000])) == 1000
+    )
+    assert store.get(tmp_path, upload.upload_id).offset == 1000
+    assert (
+        store.write(tmp_path, upload.upload_id, 1000, io.BytesIO(content[1000:]))
+        == 1500
+    )
+
+    destination = tmp_path / "output.csv"
+    digest = store.commit(tmp_path, upload.upload_id, destination)
+
+    assert destination.read_bytes() == content
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert not list((tmp_path / uploads.UPLOADS_DIR).iterdir())
+    with pytest.raises(uploads.UploadError):
+        store.get(tmp_path, upload.upload_id)
+
+
+def test_upload_offset_mismatch(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 10)
+    store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"12345"))
+
+    # eg the response to a chunk which did arrive was lost, so it is resent
+    with pytest.raises(uploads.OffsetMismatch) as exc_info:
+        store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"12345"))
+
+    assert exc_info.value.offset == 5
+    assert "offset 5" in str(exc_info.value)
+    assert upload.part_path.read_bytes() == b"12345"
+
+
+def test_upload_too_large(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 8)
+    store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"1234"))
+
+    with pytest.raises(uploads.UploadError, match="larger"):
+        store.write(tmp_path, upload.upload_id, 4, io.BytesIO(b"56789"))
+
+    # none of the failed chunk is kept
+    assert upload.offset == 4
+    assert upload.part_path.read_bytes() == b"1234"
+    store.write(tmp_path, upload.upload_id, 4, io.BytesIO(b"5678"))
+    digest = store.commit(tmp_path, upload.upload_id, tmp_path / "output.csv")
+    assert digest == hashlib.sha256(b"12345678").hexdigest()
+
+
+def test_upload_interrupted(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 8)
+
+    class Dropped(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell():
+                raise OSError("connection reset")
+            return super().read(2)
+
+    with pytest.raises(OSError):
+        store.write(tmp_path, upload.upload_id, 0, Dropped(b"12345678"))
+
+    assert upload.offset == 0
+    assert upload.part_path.read_bytes() == b""
+
+
+def test_upload_resumes_after_restart(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 8)
+    store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"1234"))
+
+    restarted = uploads.UploadStore()
+    resumed = restarted.get(tmp_path, upload.upload_id)
+    assert resumed.filename == "output.csv"
+    assert resumed.size == 8
+    assert resumed.offset == 4
+
+    restarted.write(tmp_path, upload.upload_id, 4, io.BytesIO(b"5678"))
+    digest = restarted.commit(tmp_path, upload.upload_id, tmp_path / "output.csv")
+    assert digest == hashlib.sha256(b"12345678").hexdigest()
+
+
+def test_upload_commit_incomplete(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 8)
+    store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"1234"))
+
+    with pytest.raises(uploads.UploadError, match="4 of 8"):
+        store.commit(tmp_path, upload.upload_id, tmp_path / "output.csv")
+
+    assert not (tmp_path / "output.csv").exists()
+
+
+def test_upload_commit_existing(tmp_path, store):
+    destination = tmp_path / "outputs.json"
+    destination.write_bytes(b"existing")
+    upload = store.start(tmp_path, "outputs.json", 4)
+    store.write(tmp_path, upload.upload_id, 0, io.BytesIO(b"1234"))
+
+    with pytest.raises(uploads.FileExists):
+        store.commit(tmp_path, upload.upload_id, destination)
+
+    assert destination.read_bytes() == b"existing"
+    # the upload is kept, so can still be added under another name
+    digest = store.commit(tmp_path, upload.upload_id, tmp_path / "other.json")
+    assert digest == hashlib.sha256(b"1234").hexdigest()
+    assert not upload.part_path.exists()
+
+
+def test_upload_discard(tmp_path, store):
+    upload = store.start(tmp_path, "output.csv", 8)
+
+    store.discard(tmp_path, upload.upload_id)
+
+    assert not upload.part_path.exists()
+    assert not upload.state_path.exists()
+    with pytest.raises(uploads.UploadError):
+        store.get(tmp_path, upload.upload_id)
+
+
+@pytest.mark.parametrize("filename,size", [("", 1), (".hidden", 1), ("a.csv", -1)])
+def test_upload_start_invalid(tmp_path, store, filename, size):
+    with pytest.raises(uploads.UploadError):
+        store.start(tmp_path, filename, size)
+
+
+@pytest.mark.parametrize("upload_id", ["../../etc/passwd", "0" * 32])
+def test_upload_unknown(tmp_path, store, upload_id):
+    with pytest.raises(uploads.UploadError, match="Unknown upload"):
+        store.get(tmp_path, upload_id)
+
+
+def test_copy_hashed(tmp_path):
+    source = tmp_path / "source.csv"
+    source.write_bytes(b"a,b\n1,2\n")
+    expected = hashlib.sha256(b"a,b\n1,2\n").hexdigest()
+
+    assert uploads.copy_hashed(source, tmp_path / "copy.csv") == expected
+    assert (tmp_path / "copy.csv").read_bytes() == b"a,b\n1,2\n"
+    # already in place, so just hashed
+    assert uploads.copy_hashed(source, source) == expected
+
+
+def test_write_many(tmp_path, settings):
+    settings.CHECKSUM_WORKERS = 2
+    writes = {
+        f"{i}.txt": partial(uploads.write_hashed, [f"{i}".encode()], tmp_path / f"{i}")
+        for i in range(5)
+    }
+
+    digests = uploads.write_many(writes)
+
+    assert digests == {
+        f"{i}.txt": hashlib.sha256(f"{i}".encode()).hexdigest() for i in range(5)
+    }
+
+
+def test_write_many_error(tmp_path):
+    writes = {
+        "ok": partial(uploads.write_hashed, [b"ok"], tmp_path / "ok"),
+        "missing": partial(uploads.copy_hashed, tmp_path / "missing", tmp_path / "x"),
+    }
+
+    with pytest.raises(FileNotFoundError):
+        uploads.write_many(writes, workers=2)
@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+from sacro import utils
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-9", (0, 9)),
+        ("bytes=5-", (5, 99)),
+        ("bytes=90-200", (90, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-200", (0, 99)),
+        (" Bytes = 1-2", (1, 2)),
+        ("bytes=0-1,5-6", None),
+        ("items=0-9", None),
+        ("bytes=9-0", None),
+        ("bytes=-", None),
+        ("bytes=5", None),
+        ("bytes=a-b", None),
+        ("bytes=1-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert utils.parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header,size", [("bytes=100-", 100), ("bytes=-0", 100), ("bytes=-5", 0)]
+)
+def test_parse_range_not_satisfiable(header, size):
+    with pytest.raises(utils.RangeNotSatisfiable):
+        utils.parse_range(header, size)
+
+
+def test_file_range():
+    f = io.BytesIO(b"0123456789")
+    file_range = utils.FileRange(f, 2, 5)
+
+    assert file_range.read(3) == b"234"
+    assert file_range.read() == b"56"
+    assert file_range.read(10) == b""
+
+    file_range.close()
+    assert f.closed
@@ -1,15 +1,28 @@
+import hashlib
 import io
 import json
 import zipfile
+from concurrent.futures import Future
 from pathlib import Path
-from urllib.parse import urlencode
+from urllib.parse import parse_qs, urlencode, urlsplit
 
 import pytest
+from django.core.handlers.asgi import ASGIRequest
 from django.http import Http404
 from django.test import RequestFactory, override_settings
 from django.urls import reverse
+from django.utils.http import http_date
 
-from sacro import models, views
+from sacro import (
+    drafts,
+    jsonpatch,
+    models,
+    reviews,
+    tables,
+    views,
+    watcher,
+    writer,
+)
 
 
 def test_load(test_outputs):
@@ -39,7 +52,7 @@ def test_index(test_outputs):
     request = RequestFactory().get(path="/", data={"path": str(test_outputs.path)})
 
     response = views.index(request)
-    assert response.context_data["outputs"] == dict(test_outputs)
+    assert response.context_data["outputs"] == test_outputs.summary()
     assert (
         response.context_data["create_url"]
         == f"/review/?{urlencode({'path': test_outputs.path})}"
@@ -51,7 +64,7 @@ def test_index_no_path(TEST_PATH):
     request = RequestFactory().get(path="/")
 
     response = views.index(request)
-    assert response.context_data["outputs"] == dict(models.ACROOutputs(TEST_PATH))
+    assert response.context_data["outputs"] == models.ACROOutputs(TEST_PATH).summary()
 
 
 @override_settings(DEBUG=False)
@@ -61,6 +74,64 @@ def test_index_no_path_no_debug():
         views.index(request)
 
 
+def test_index_embeds_only_summary(test_outputs):
+    request = RequestFactory().get(path="/", data={"path": str(test_outputs.path)})
+
+    response = views.index(request).render()
+
+    content = response.content.decode("utf8")
+    assert "cell_index" not in content
+    assert "outputsMetadataUrl" in content
+
+
+def get_metadata(test_outputs, **params):
+    request = RequestFactory().get(
+        path="/outputs/", data={"path": str(test_outputs.path), **params}
+    )
+    return json.loads(views.outputs_metadata(request).content)
+
+
+def test_outputs_metadata(test_outputs):
+    data = get_metadata(test_outputs)
+
+    assert data["total"] == len(test_outputs)
+    assert data["offset"] == 0
+    assert data["limit"] == views.METADATA_PAGE_SIZE
+    assert data["outputs"] == json.loads(json.dumps(dict(test_outputs)))
+
+
+def test_outputs_metadata_paging(test_outputs):
+    names = list(test_outputs)
+
+    data = get_metadata(test_outputs, offset=2, limit=3)
+
+    assert data["total"] == len(names)
+    assert list(data["outputs"]) == names[2:5]
+
+
+@pytest.mark.parametrize(
+    "params,expected",
+    [
+        ({"limit": "bad"}, views.METADATA_PAGE_SIZE),
+        ({"limit": "-1"}, 0),
+        ({"limit": "1000000"}, views.METADATA_MAX_PAGE_SIZE),
+    ],
+)
+def test_outputs_metadata_bad_limit(test_outputs, params, expected):
+    assert get_metadata(test_outputs, **params)["limit"] == expected
+
+
+def test_outputs_metadata_filters(test_outputs):
+    names = list(test_outputs)
+    failing = [n for n, m in test_outputs.items() if m["status"] == "fail"]
+
+    assert list(get_metadata(test_outputs, status="fail")["outputs"]) == failing
+    assert list(get_metadata(test_outputs, name=names[:2])["outputs"]) == names[:2]
+    assert list(get_metadata(test_outputs, q=names[0].upper())["outputs"]) == [
+        n for n in names if names[0] in n
+    ]
+
+
 def test_contents_success(test_outputs):
     for metadata in test_outputs.values():
         for filedata in metadata["files"]:
@@ -111,6 +182,16 @@ def review_summary(review_data, test_outputs):
     }
 
 
+def add_review(review):
+    """Store review, as submitted for the outputs as they are now"""
+    return reviews.REVIEWS.create(
+        path=review["path"],
+        comment=review.get("comment", ""),
+        decisions=review["decisions"],
+        metadata_digest=models.OUTPUTS_CACHE.get(review["path"]).digest(),
+    )
+
+
 def test_approved_outputs_missing_metadata(tmp_path, monkeypatch):
     path = tmp_path / "results.json"
     path.write_text(
@@ -123,11 +204,11 @@ def test_approved_outputs_missing_metadata(tmp_path, monkeypatch):
     )
 
     review_data = {"decisions": {"test": {"state": True}}, "path": path}
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_data})
+    pk = add_review(review_data)
 
     request = RequestFactory().post("/")
 
-    response = views.approved_outputs(request, pk="current")
+    response = views.approved_outputs(request, pk=pk)
 
     zf = io.BytesIO(response.getvalue())
     with zipfile.ZipFile(zf, "r") as zip_obj:
@@ -147,12 +228,12 @@ def test_approved_outputs_success_all_files(test_outputs, review_summary):
     for k, v in review_summary["decisions"].items():
         v["state"] = True
 
-    views.REVIEWS["current"] = review_summary
+    pk = add_review(review_summary)
 
     path = urlencode({"path": test_outputs.path})
     request = RequestFactory().post(f"/?{path}")
 
-    response = views.approved_outputs(request, pk="current")
+    response = views.approved_outputs(request, pk=pk)
 
     expected_namelist = []
 
@@ -179,16 +260,50 @@ def test_approved_outputs_success_all_files(test_outputs, review_summary):
             assert "comments" in output_data
 
 
+def test_approved_outputs_cached(test_outputs, review_summary, monkeypatch):
+    pk = add_review(review_summary)
+    request = RequestFactory().post("/")
+
+    built = views.approved_outputs(request, pk=pk)
+    assert built.file_to_stream is None
+    content = built.getvalue()
+
+    cached = views.approved_outputs(request, pk=pk)
+    assert cached.file_to_stream is not None
+    assert cached.getvalue() == content
+    assert cached["Content-Length"] == str(len(content))
+    assert cached["Content-Disposition"] == built["Content-Disposition"]
+
+    # a different decision is a different release
+    review_summary["comment"] = "changed"
+    rebuilt = views.approved_outputs(request, pk=add_review(review_summary))
+    assert rebuilt.file_to_stream is None
+    rebuilt.close()
+
+
+def test_approved_outputs_changed_since_review(test_outputs, review_summary):
+    pk = add_review(review_summary)
+    metadata = json.loads(test_outputs.path.read_text())
+    first = list(metadata["results"])[0]
+    metadata["results"][first]["status"] = "changed"
+    test_outputs.path.write_text(json.dumps(metadata))
+
+    response = views.approved_outputs(RequestFactory().post("/"), pk=pk)
+
+    assert response.status_code == 409
+    assert b"changed since they were reviewed" in response.content
+
+
 def test_approved_outputs_success_logs_audit_trail(
     test_outputs, review_summary, mocker, monkeypatch
 ):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    pk = add_review(review_summary)
     mocked_local_audit = mocker.patch("sacro.views.local_audit")
 
     path = urlencode({"path": test_outputs.path})
     request = RequestFactory().post(f"/?{path}")
 
-    response = views.approved_outputs(request, pk="current")
+    response = views.approved_outputs(request, pk=pk)
 
     assert response.status_code == 200
     mocked_local_audit.log_release.assert_called_once()
@@ -224,10 +339,10 @@ def test_approved_outputs_coverage_edge_cases(tmp_path, monkeypatch):
         },
         "path": path,
     }
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_data})
+    pk = add_review(review_data)
 
     request = RequestFactory().post("/")
-    response = views.approved_outputs(request, pk="current")
+    response = views.approved_outputs(request, pk=pk)
 
     zf = io.BytesIO(response.getvalue())
     with zipfile.ZipFile(zf, "r") as zip_obj:
@@ -245,7 +360,7 @@ def test_approved_outputs_coverage_edge_cases(tmp_path, monkeypatch):
 
 
 def test_approved_outputs_unknown_review(review_summary, monkeypatch):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    add_review(review_summary)
 
     request = RequestFactory().post("/")
 
@@ -285,12 +400,15 @@ def test_review_create_success(test_outputs, review_data, tmp_path):
     response = views.review_create(request)
 
     assert response.status_code == 302, response.content
-    assert response.url == reverse("review-detail", kwargs={"pk": "current"})
+    pk = response.url.split("/")[-2]
+    assert response.url == reverse("review-detail", kwargs={"pk": pk})
 
-    assert views.REVIEWS["current"]["comment"] == "test"
-    assert views.REVIEWS["current"]["path"] == temp_results
+    stored = reviews.REVIEWS.get(pk)
+    assert stored["comment"] == "test"
+    assert stored["path"] == temp_results.resolve()
+    assert stored["metadata_digest"] == models.ACROOutputs(temp_results).digest()
 
-    review = views.REVIEWS["current"]["decisions"]
+    review = stored["decisions"]
     first = list(review)[0]
     assert review[first]["comment"] == "comment with ' and 😀"
 
@@ -307,9 +425,10 @@ def test_review_create_html_entities(test_outputs, review_data):
         f"/?{path}", data={"comment": "test", "review": json.dumps(review_data)}
     )
 
-    views.review_create(request)
+    response = views.review_create(request)
 
-    assert views.REVIEWS["current"]["decisions"][first]["comment"] == "&"
+    pk = response.url.split("/")[-2]
+    assert reviews.REVIEWS.get(pk)["decisions"][first]["comment"] == "&"
 
 
 def test_review_create_unrecognized_files(test_outputs):
@@ -327,18 +446,22 @@ def test_review_create_unrecognized_files(test_outputs):
 
 
 def test_review_detail_success(review_summary, monkeypatch):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    pk = add_review(review_summary)
 
     request = RequestFactory().get("/")
 
-    response = views.review_detail(request, pk="current")
+    response = views.review_detail(request, pk=pk)
 
     assert response.status_code == 200
-    assert response.context_data["review"] == review_summary
+    review = response.context_data["review"]
+    assert review["id"] == pk
+    assert review["comment"] == review_summary["comment"]
+    assert review["decisions"] == review_summary["decisions"]
+    assert response.context_data["summary_url"] == reverse("summary", kwargs={"pk": pk})
 
 
 def test_review_detail_unknown_review(review_summary, monkeypatch):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    add_review(review_summary)
 
     request = RequestFactory().get("/")
 
@@ -347,11 +470,11 @@ def test_review_detail_unknown_review(review_summary, monkeypatch):
 
 
 def test_summary_success(review_summary, monkeypatch):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    pk = add_review(review_summary)
 
     request = RequestFactory().post("/")
 
-    response = views.summary(request, pk="current")
+    response = views.summary(request, pk=pk)
 
     assert response.status_code == 200
 
@@ -363,7 +486,7 @@ def test_summary_success(review_summary, monkeypatch):
 
 
 def test_summary_unknown_review(review_summary, monkeypatch):
-    monkeypatch.setattr(views, "REVIEWS", {"current": review_summary})
+    add_review(review_summary)
 
     request = RequestFactory().post("/")
 
@@ -823,19 +946,16 @@ def test_load_with_invalid_directory(client, tmp_path):
 def test_approved_outputs_with_post_request(test_outputs, review_summary):
     """Test approved_outputs with POST request (requires POST)"""
     # First create a review entry
-    views.REVIEWS["test"] = review_summary
+    pk = add_review(review_summary)
 
     request = RequestFactory().post(
         path="/review/test/approved-outputs/",
         data={"path": str(test_outputs.path)},
     )
-    response = views.approved_outputs(request, pk="test")
+    response = views.approved_outputs(request, pk=pk)
     # View should work with POST
     assert response.status_code in [200, 400, 500]
 
-    # Clean up
-    del views.REVIEWS["test"]
-
 
 def test_index_with_absolute_path(test_outputs):
     """Test index with absolute file path"""
@@ -1058,9 +1178,9 @@ def test_researcher_load_session_exists(client, test_outputs, tmp_path):
     assert response.status_code == 200
 
 
-def test_researcher_add_output_with_file_upload(client, test_outputs, tmp_path):
+def test_researcher_add_output_with_file_upload(client, test_outputs, sources):
     """Test researcher_add_output with file upload"""
-    test_file = tmp_path / "test.csv"
+    test_file = sources / "test.csv"
     test_file.write_text("col1,col2\n1,2\n3,4")
 
     session_data = {"version": "1.0", "results": {}}
@@ -1489,3 +1609,872 @@ def test_reviewer_text_written_to_results(test_outputs, tmp_path):
         reviewer_text = updated_data["reviewer_summary"]
         assert "Overall review comment" in reviewer_text
         assert "test_output" in reviewer_text
+
+
+def test_researcher_add_output_file_upload_checksum(client, test_outputs, sources):
+    content = b"col1,col2\n1,2\n3,4\n" * 1000
+    test_file = sources / "upload.csv"
+    test_file.write_bytes(content)
+
+    session_data = {"version": "1.0", "results": {}}
+    with open(test_file, "rb") as f:
+        response = client.post(
+            f"/researcher/output/add/?path={test_outputs.path}",
+            {
+                "session_data": json.dumps(session_data),
+                "name": "upload",
+                "data": json.dumps({"files": [{"name": "upload.csv"}]}),
+                "file": f,
+            },
+        )
+
+    expected = hashlib.sha256(content).hexdigest()
+    assert response.json()["output_data"]["files"][0]["checksum"] == expected
+    checksum_path = test_outputs.path.parent / "checksums" / "upload.csv.txt"
+    assert checksum_path.read_text() == expected
+
+
+def patch_session(client, path, body):
+    return client.post(
+        f"/researcher/session/patch/?path={path}",
+        data=json.dumps(body),
+        content_type="application/json",
+    )
+
+
+def test_researcher_patch_session(client, metadata_path):
+    output = list(json.loads(metadata_path.read_text())["results"])[0]
+    comments = jsonpatch.pointer("results", output, "comments")
+
+    response = patch_session(
+        client,
+        metadata_path,
+        {
+            "revision": 0,
+            "operations": [
+                {"op": "add", "path": comments, "value": ["first"]},
+                {"op": "add", "path": "/title", "value": "session"},
+            ],
+        },
+    )
+
+    assert response.status_code == 200
+    assert response.json()["revision"] == 1
+    draft = json.loads(drafts.draft_path(metadata_path).read_text())
+    assert draft["results"][output]["comments"] == ["first"]
+    assert draft["title"] == "session"
+
+    response = patch_session(
+        client,
+        metadata_path,
+        {
+            "revision": 1,
+            "operations": [{"op": "add", "path": comments + "/-", "value": "second"}],
+        },
+    )
+
+    assert response.json()["revision"] == 2
+    session = client.get(f"/researcher/session/load/?path={metadata_path}")
+    assert session.json()["revision"] == 2
+    assert session.json()["data"]["results"][output]["comments"] == [
+        "first",
+        "second",
+    ]
+
+
+def test_researcher_patch_session_conflict(client, test_outputs):
+    operations = [{"op": "add", "path": "/title", "value": "session"}]
+    patch_session(client, test_outputs.path, {"revision": 0, "operations": operations})
+
+    # made against the revision before the one above
+    response = patch_session(
+        client, test_outputs.path, {"revision": 0, "operations": operations}
+    )
+
+    assert response.status_code == 409
+    assert response.json()["revision"] == 1
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        "not json",
+        ["not an object"],
+        {"revision": 0, "operations": [{"op": "remove", "path": "/missing"}]},
+        {"revision": 0},
+        {"revision": "latest", "operations": []},
+    ],
+)
+def test_researcher_patch_session_invalid(client, test_outputs, body):
+    response = client.post(
+        f"/researcher/session/patch/?path={test_outputs.path}",
+        data=body if isinstance(body, str) else json.dumps(body),
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert response.json()["success"] is False
+
+
+def test_researcher_patch_session_error(client, test_outputs, mocker):
+    mocker.patch.object(
+        drafts.DRAFTS, "patch", side_effect=OSError("Permission denied")
+    )
+
+    response = patch_session(
+        client, test_outputs.path, {"revision": 0, "operations": []}
+    )
+
+    assert response.status_code == 500
+
+
+def test_researcher_index_revision(client, test_outputs):
+    drafts.DRAFTS.patch(test_outputs.path, [])
+
+    response = client.get(f"/researcher/?path={test_outputs.path}")
+
+    assert response.context["revision"] == 1
+
+
+def test_researcher_index_compacts_draft(client, metadata_path):
+    output = list(json.loads(metadata_path.read_text())["results"])[0]
+    comments = jsonpatch.pointer("results", output, "comments")
+    drafts.DRAFTS.patch(metadata_path, [{"op": "add", "path": comments, "value": []}])
+    drafts.DRAFTS.patch(
+        metadata_path, [{"op": "add", "path": comments + "/-", "value": "journal"}]
+    )
+    draft_path = drafts.draft_path(metadata_path)
+    assert json.loads(draft_path.read_text())["results"][output]["comments"] == []
+
+    response = client.get(f"/researcher/?path={metadata_path}")
+
+    assert response.status_code == 200
+    draft = json.loads(draft_path.read_text())
+    assert draft["results"][output]["comments"] == ["journal"]
+
+
+@pytest.fixture
+def metadata_path(test_outputs):
+    """ACRO metadata which is not also where the researcher's draft is saved"""
+    path = test_outputs.path.parent / "outputs.json"
+    test_outputs.path.rename(path)
+    return path
+
+
+def test_researcher_outputs_use_held_session(client, metadata_path):
+    """Without session_data, output changes apply to the session held on the server"""
+    url = "/researcher/output/{}/?path=" + str(metadata_path)
+    existing = list(json.loads(metadata_path.read_text())["results"])
+
+    response = client.post(
+        url.format("add"),
+        {"name": "new", "data": json.dumps({"files": []}), "revision": 0},
+    )
+    assert response.json()["revision"] == 1
+
+    response = client.post(
+        url.format("edit"),
+        {
+            "original_name": "new",
+            "new_name": "renamed",
+            "data": json.dumps({"files": []}),
+            "revision": 1,
+        },
+    )
+    assert response.json()["revision"] == 2
+
+    response = client.post(url.format("delete"), {"name": existing[0], "revision": 2})
+    assert response.json()["revision"] == 3
+
+    results = drafts.DRAFTS.get(metadata_path).document["results"]
+    assert "new" not in results
+    assert results["renamed"] == {"files": [], "uid": "renamed"}
+    assert existing[0] not in results
+    assert set(existing[1:]) < set(results)
+
+
+@pytest.mark.parametrize(
+    "action,data",
+    [
+        ("add", {"name": "new", "data": "{}"}),
+        (
+            "edit",
+            {
+                "original_name": "ols_pass",
+                "new_name": "renamed",
+                "data": json.dumps(
+                    {"files": [{"name": f"ols_pass_{i}.csv"} for i in range(3)]}
+                ),
+            },
+        ),
+        ("delete", {"name": "ols_pass"}),
+    ],
+)
+def test_researcher_outputs_revision_conflict(client, metadata_path, action, data):
+    drafts.DRAFTS.patch(
+        metadata_path, [{"op": "add", "path": "/title", "value": "changed"}]
+    )
+
+    response = client.post(
+        f"/researcher/output/{action}/?path={metadata_path}",
+        {**data, "revision": 0},
+    )
+
+    assert response.status_code == 409
+    assert response.json()["revision"] == 1
+    results = drafts.DRAFTS.get(metadata_path).document["results"]
+    assert "ols_pass" in results
+    assert "new" not in results
+    assert "renamed" not in results
+    # nothing on disk is touched either
+    directory = metadata_path.parent
+    for file_info in results["ols_pass"]["files"]:
+        assert (directory / file_info["name"]).exists()
+        assert (directory / "checksums" / f"{file_info['name']}.txt").exists()
+    assert not list(directory.glob("renamed*"))
+
+
+def test_researcher_finalize_held_session(client, metadata_path):
+    drafts.DRAFTS.patch(
+        metadata_path, [{"op": "add", "path": "/title", "value": "done"}]
+    )
+    assert drafts.draft_path(metadata_path).exists()
+
+    response = client.post(f"/researcher/finalize/?path={metadata_path}")
+
+    assert response.status_code == 200
+    assert json.loads(metadata_path.read_text())["title"] == "done"
+    assert not drafts.draft_path(metadata_path).exists()
+    assert drafts.DRAFTS.get(metadata_path).revision == 0
+
+
+def test_write_stats(client):
+    writer.WRITER.record("test", 0.5)
+
+    response = client.get("/stats/writes/")
+
+    assert response.status_code == 200
+    assert response.json() == writer.WRITER.stats()
+    assert response.json()["test"]["max_latency"] >= 0.5
+
+
+def test_checksum_status(test_outputs):
+    request = RequestFactory().get(
+        path="/checksums/status/", data={"path": str(test_outputs.path)}
+    )
+
+    response = views.checksum_status(request)
+
+    data = json.loads(response.content)
+    assert data["complete"] is True
+    for output, metadata in test_outputs.items():
+        for filedata in metadata["files"]:
+            assert data["files"][output][filedata["name"]] is True
+
+
+def test_checksum_status_pending(test_outputs, monkeypatch):
+    outputs = models.ACROOutputs(test_outputs.path, lazy_verify=True)
+    first_output = list(outputs)[0]
+    outputs[first_output]["files"][0]["checksum_valid"] = "pending"
+    # a verification job which has not finished yet
+    outputs.verification = Future()
+    monkeypatch.setattr(views.models, "load_from_path", lambda *a, **kw: outputs)
+
+    request = RequestFactory().get(
+        path="/checksums/status/", data={"path": str(test_outputs.path)}
+    )
+    data = json.loads(views.checksum_status(request).content)
+
+    assert data["complete"] is False
+    assert first_output not in data["files"]
+    assert len(data["files"]) == len(outputs) - 1
+
+
+@override_settings(CHECKSUM_LAZY=True)
+def test_index_lazy_checksums(test_outputs):
+    request = RequestFactory().get(path="/", data={"path": str(test_outputs.path)})
+
+    response = views.index(request)
+
+    assert response.status_code == 200
+    assert response.context_data["checksum_status_url"] == (
+        f"/checksums/status/?{urlencode({'path': test_outputs.path})}"
+    )
+
+
+def test_events(test_outputs, monkeypatch, mocker):
+    hub = watcher.ChangeHub(watcher_class=mocker.MagicMock())
+    monkeypatch.setattr(watcher, "HUB", hub)
+    request = RequestFactory().get(
+        path="/events/", data={"path": str(test_outputs.path)}
+    )
+
+    response = views.events(request)
+
+    assert response["Content-Type"] == "text/event-stream"
+    assert response["Cache-Control"] == "no-cache"
+    assert next(response.streaming_content) == watcher.CONNECTED
+    response.close()
+    assert hub._watchers == {}
+
+
+def test_events_asgi_handoff(test_outputs):
+    request = ASGIRequest(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/events/",
+            "query_string": urlencode({"path": test_outputs.path}).encode(),
+            "headers": [],
+        },
+        io.BytesIO(),
+    )
+
+    response = views.events(request)
+
+    assert not response.streaming
+    assert response[watcher.HANDOFF_HEADER] == str(test_outputs.path)
+
+
+def contents_request(test_outputs, **headers):
+    output = list(test_outputs)[0]
+    filedata = test_outputs[output]["files"][0]
+    path = test_outputs.get_file_path(output, filedata["name"])
+    meta = {f"HTTP_{name.upper()}": value for name, value in headers.items()}
+    request = RequestFactory().get(path=filedata["url"], **meta)
+    return request, filedata, path
+
+
+def test_contents_validators(test_outputs):
+    request, filedata, path = contents_request(test_outputs)
+
+    response = views.contents(request)
+
+    assert response.status_code == 200
+    assert response["ETag"] == f'"{filedata["checksum"]}"'
+    assert response["Last-Modified"] == http_date(int(path.stat().st_mtime))
+    assert response["Accept-Ranges"] == "bytes"
+
+
+def test_contents_etag_changed_file(test_outputs):
+    request, filedata, path = contents_request(test_outputs)
+    path.write_bytes(path.read_bytes() + b"tampered")
+
+    response = views.contents(request)
+
+    assert response.status_code == 200
+    assert response["ETag"] != f'"{filedata["checksum"]}"'
+
+
+def test_contents_if_none_match(test_outputs):
+    _, filedata, _ = contents_request(test_outputs)
+    request, _, _ = contents_request(
+        test_outputs, if_none_match=f'"{filedata["checksum"]}"'
+    )
+
+    response = views.contents(request)
+
+    assert response.status_code == 304
+    assert response["ETag"] == f'"{filedata["checksum"]}"'
+    assert response.content == b""
+
+
+def test_contents_if_modified_since(test_outputs):
+    _, _, path = contents_request(test_outputs)
+    request, _, _ = contents_request(
+        test_outputs, if_modified_since=http_date(path.stat().st_mtime + 10)
+    )
+
+    assert views.contents(request).status_code == 304
+
+    request, _, _ = contents_request(
+        test_outputs, if_modified_since=http_date(path.stat().st_mtime - 10)
+    )
+    assert views.contents(request).status_code == 200
+
+
+def test_contents_range(test_outputs):
+    request, _, path = contents_request(test_outputs, range="bytes=2-5")
+    size = path.stat().st_size
+
+    response = views.contents(request)
+
+    assert response.status_code == 206
+    assert response["Content-Range"] == f"bytes 2-5/{size}"
+    assert response["Content-Length"] == "4"
+    assert response.getvalue() == path.read_bytes()[2:6]
+
+
+def test_contents_range_suffix(test_outputs):
+    request, _, path = contents_request(test_outputs, range="bytes=-3")
+
+    response = views.contents(request)
+
+    assert response.status_code == 206
+    assert response.getvalue() == path.read_bytes()[-3:]
+
+
+def test_contents_range_not_satisfiable(test_outputs):
+    _, _, path = contents_request(test_outputs)
+    size = path.stat().st_size
+    request, _, _ = contents_request(test_outputs, range=f"bytes={size}-")
+
+    response = views.contents(request)
+
+    assert response.status_code == 416
+    assert response["Content-Range"] == f"bytes */{size}"
+
+
+def test_contents_multiple_ranges(test_outputs):
+    request, _, path = contents_request(test_outputs, range="bytes=0-1,3-4")
+
+    response = views.contents(request)
+
+    assert response.status_code == 200
+    assert response.getvalue() == path.read_bytes()
+
+
+def test_contents_if_range(test_outputs):
+    _, filedata, path = contents_request(test_outputs)
+    mtime = path.stat().st_mtime
+
+    for if_range, status in [
+        (f'"{filedata["checksum"]}"', 206),
+        ('"stale"', 200),
+        (f'W/"{filedata["checksum"]}"', 200),
+        (http_date(mtime), 206),
+        (http_date(mtime - 10), 200),
+    ]:
+        request, _, _ = contents_request(
+            test_outputs, range="bytes=0-1", if_range=if_range
+        )
+        assert views.contents(request).status_code == status, if_range
+
+
+def test_contents_table(test_outputs):
+    filedata = test_outputs["crosstab_fail"]["files"][0]
+    request = RequestFactory().get(path=filedata["table_url"] + "&offset=1&limit=2")
+
+    response = views.contents_table(request)
+
+    data = json.loads(response.content)
+    path = test_outputs.path.parent / filedata["name"]
+    lines = path.read_text().splitlines()
+    assert data["header"] == lines[0].split(",")
+    assert data["total"] == len(lines) - 1
+    assert data["offset"] == 1
+    assert data["limit"] == 2
+    assert data["rows"] == [line.split(",") for line in lines[2:4]]
+    cell_index = filedata["cell_index"]
+    assert data["cells"] == tables.cells_in_window(cell_index, 1, 2)
+    assert all(1 <= row < 3 for row in data["cells"]["rows"])
+
+
+def test_contents_table_not_csv(test_outputs):
+    filedata = test_outputs["custom_txt"]["files"][0]
+    assert "table_url" not in filedata
+    request = RequestFactory().get(
+        path="/contents/table/",
+        data={
+            "path": str(test_outputs.path),
+            "output": "custom_txt",
+            "filename": filedata["name"],
+        },
+    )
+
+    assert views.contents_table(request).status_code == 400
+
+
+def test_contents_table_not_in_outputs(test_outputs):
+    request = RequestFactory().get(
+        path="/contents/table/",
+        data={"path": str(test_outputs.path), "output": "nope", "filename": "a.csv"},
+    )
+
+    with pytest.raises(Http404):
+        views.contents_table(request)
+
+
+def start_upload(client, path, filename, size):
+    return client.post(
+        f"/researcher/upload/?path={path}",
+        data=json.dumps({"filename": filename, "size": size}),
+        content_type="application/json",
+    )
+
+
+def test_researcher_upload_in_chunks(client, test_outputs):
+    content = b"col1,col2\n1,2\n3,4\n" * 1000
+    response = start_upload(client, test_outputs.path, "chunked.csv", len(content))
+    assert response.status_code == 200
+    url = response.json()["url"]
+    upload = response.json()["upload"]
+
+    for offset in range(0, len(content), 4096):
+        response = client.put(
+            f"{url}&offset={offset}",
+            data=content[offset : offset + 4096],
+            content_type="application/octet-stream",
+        )
+        assert response.json() == {
+            "success": True,
+            "offset": min(offset + 4096, len(content)),
+        }
+
+    # resending a chunk which arrived says where to carry on from
+    response = client.put(f"{url}&offset=0", data=b"col1", content_type="text/csv")
+    assert response.status_code == 409
+    assert response.json()["offset"] == len(content)
+    assert client.get(url).json()["offset"] == len(content)
+
+    response = client.post(
+        f"/researcher/output/add/?path={test_outputs.path}",
+        {
+            "session_data": json.dumps({"version": "1.0", "results": {}}),
+            "name": "chunked",
+            "data": json.dumps({"files": [{"name": "chunked.csv"}]}),
+            "upload": upload,
+        },
+    )
+
+    assert response.status_code == 200
+    file_info = response.json()["output_data"]["files"][0]
+    assert file_info["checksum"] == hashlib.sha256(content).hexdigest()
+    assert (test_outputs.path.parent / "chunked.csv").read_bytes() == content
+    checksum_path = test_outputs.path.parent / "checksums" / "chunked.csv.txt"
+    assert checksum_path.read_text() == file_info["checksum"]
+
+
+def test_researcher_add_output_incomplete_upload(client, test_outputs):
+    upload = start_upload(client, test_outputs.path, "partial.csv", 10).json()
+
+    response = client.post(
+        f"/researcher/output/add/?path={test_outputs.path}",
+        {
+            "session_data": json.dumps({"version": "1.0", "results": {}}),
+            "name": "partial",
+            "data": json.dumps({"files": [{"name": "partial.csv"}]}),
+            "upload": upload["upload"],
+        },
+    )
+
+    assert response.status_code == 400
+    assert "incomplete" in response.json()["message"]
+
+
+def test_researcher_add_output_upload_existing_file(client, metadata_path):
+    directory = metadata_path.parent
+    before = (directory / "config.json").read_bytes()
+    started = start_upload(client, metadata_path, "config.json", 2).json()
+    client.put(started["url"], data=b"{}", content_type="application/json")
+
+    response = client.post(
+        f"/researcher/output/add/?path={metadata_path}",
+        {
+            "name": "config",
+            "data": json.dumps({"files": [{"name": "config.json"}]}),
+            "upload": started["upload"],
+        },
+    )
+
+    assert response.status_code == 400
+    assert "already in the outputs directory" in response.json()["message"]
+    assert (directory / "config.json").read_bytes() == before
+    assert "config" not in drafts.DRAFTS.get(metadata_path).document["results"]
+
+
+def test_researcher_add_output_file_existing_file(client, metadata_path, sources):
+    directory = metadata_path.parent
+    before = (directory / "ols_pass_0.csv").read_bytes()
+    (sources / "ols_pass_0.csv").write_text("overwritten")
+
+    with (sources / "ols_pass_0.csv").open("rb") as f:
+        response = client.post(
+            f"/researcher/output/add/?path={metadata_path}",
+            {
+                "name": "other",
+                "data": json.dumps({"files": [{"name": "ols_pass_0.csv"}]}),
+                "file": f,
+            },
+        )
+
+    assert response.status_code == 400
+    assert "already in the outputs directory" in response.json()["message"]
+    assert (directory / "ols_pass_0.csv").read_bytes() == before
+    assert "other" not in drafts.DRAFTS.get(metadata_path).document["results"]
+
+
+def test_researcher_output_urls_encoded(client, metadata_path, sources):
+    def params(url):
+        assert url.startswith("/contents/")
+        return {k: v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+
+    (sources / "odd name&+#%.csv").write_text("a,b\n1,2\n")
+    with (sources / "odd name&+#%.csv").open("rb") as f:
+        response = client.post(
+            f"/researcher/output/add/?path={metadata_path}",
+            {
+                "name": "a&b #1+%",
+                "data": json.dumps({"files": [{"name": "odd name&+#%.csv"}]}),
+                "file": f,
+            },
+        )
+    file_info = response.json()["output_data"]["files"][0]
+    expected = {
+        "path": str(metadata_path),
+        "output": "a&b #1+%",
+        "filename": "odd name&+#%.csv",
+    }
+    assert params(file_info["url"]) == expected
+    assert params(file_info["table_url"]) == expected
+
+    response = client.post(
+        f"/researcher/output/edit/?path={metadata_path}",
+        {
+            "original_name": "a&b #1+%",
+            "new_name": "c&d 2%",
+            "data": json.dumps(response.json()["output_data"]),
+        },
+    )
+
+    file_info = response.json()["output_data"]["files"][0]
+    assert file_info["name"] == "c&d 2%.csv"
+    expected = {
+        "path": str(metadata_path),
+        "output": "c&d 2%",
+        "filename": "c&d 2%.csv",
+    }
+    assert params(file_info["url"]) == expected
+    assert params(file_info["table_url"]) == expected
+
+
+def test_researcher_upload_errors(client, test_outputs):
+    response = start_upload(client, test_outputs.path, ".hidden", 10)
+    assert response.status_code == 400
+    response = client.post(
+        f"/researcher/upload/?path={test_outputs.path}",
+        data="not json",
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+
+    url = start_upload(client, test_outputs.path, "small.csv", 2).json()["url"]
+    response = client.put(url, data=b"too big", content_type="text/csv")
+    assert response.status_code == 400
+    response = client.put(f"{url}&offset=x", data=b"1", content_type="text/csv")
+    assert response.status_code == 400
+
+    assert client.delete(url).json() == {"success": True}
+    assert client.get(url).status_code == 400
+
+
+@pytest.fixture
+def sources(tmp_path_factory):
+    """Files to add, from somewhere other than the outputs directory"""
+    return tmp_path_factory.mktemp("sources")
+
+
+def test_researcher_add_outputs_files(client, metadata_path, sources):
+    url = f"/researcher/outputs/add/?path={metadata_path}"
+    files = []
+    for i in range(3):
+        path = sources / f"figure{i}.png"
+        path.write_bytes(f"png {i}".encode())
+        files.append(path.open("rb"))
+    table = sources / "table.csv"
+    table.write_text("a,b\n1,2\n")
+    files.append(table.open("rb"))
+
+    try:
+        response = client.post(url, {"files": files, "type": "plot", "revision": 0})
+    finally:
+        for f in files:
+            f.close()
+
+    assert response.status_code == 200
+    result = response.json()
+    # the session is saved once, for all of them
+    assert result["revision"] == 1
+    assert list(result["outputs"]) == [
+        "figure0.png",
+        "figure1.png",
+        "figure2.png",
+        "table.csv",
+    ]
+    assert result["html"].count("data-output-name") >= 4
+
+    figure = result["outputs"]["figure1.png"]
+    assert figure["type"] == "plot"
+    assert figure["properties"]["method"] == "PNG Image"
+    file_info = figure["files"][0]
+    assert file_info["checksum"] == hashlib.sha256(b"png 1").hexdigest()
+    assert "table_url" not in file_info
+    assert "table_url" in result["outputs"]["table.csv"]["files"][0]
+
+    directory = metadata_path.parent
+    assert (directory / "figure1.png").read_bytes() == b"png 1"
+    assert (directory / "checksums" / "figure1.png.txt").read_text() == (
+        file_info["checksum"]
+    )
+    results = drafts.DRAFTS.get(metadata_path).document["results"]
+    assert results["table.csv"]["properties"]["method"] == "CSV"
+
+
+def test_researcher_add_outputs_directory(client, metadata_path, sources):
+    source = sources
+    (source / "a.png").write_bytes(b"a")
+    (source / "b.txt").write_bytes(b"b")
+    (source / ".hidden").write_bytes(b"hidden")
+    (source / "nested").mkdir()
+    (source / "results.json").write_text(
+        json.dumps({"version": "0.4.5", "results": {}})
+    )
+    existing = list(json.loads(metadata_path.read_text())["results"])[0]
+    (source / existing).write_bytes(b"existing")
+
+    response = client.post(
+        f"/researcher/outputs/add/?path={metadata_path}",
+        {"directory": str(source), "revision": 0},
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert list(result["outputs"]) == ["a.png", "b.txt"]
+    assert result["skipped"] == [existing]
+    assert result["outputs"]["a.png"]["type"] == "custom"
+    assert result["outputs"]["b.txt"]["properties"]["method"] == "Text"
+    assert (metadata_path.parent / "a.png").read_bytes() == b"a"
+    assert (source / "a.png").exists()
+
+    # nothing new to add the second time
+    response = client.post(
+        f"/researcher/outputs/add/?path={metadata_path}", {"directory": str(source)}
+    )
+    assert response.status_code == 400
+    assert response.json()["skipped"] == sorted([existing, "a.png", "b.txt"])
+
+
+def test_researcher_add_outputs_errors(client, metadata_path, sources):
+    url = f"/researcher/outputs/add/?path={metadata_path}"
+    existing = list(json.loads(metadata_path.read_text())["results"])[0]
+
+    response = client.post(url, {"directory": str(sources / "missing")})
+    assert response.status_code == 400
+    assert "not a directory" in response.json()["message"]
+
+    response = client.post(url, {})
+    assert response.status_code == 400
+    assert response.json()["message"] == "No new files to add"
+
+    for name, message in [
+        (existing, "already exists"),
+        (".hidden", "Cannot add"),
+    ]:
+        path = sources / name
+        path.write_bytes(b"data")
+        with path.open("rb") as f:
+            response = client.post(url, {"files": [f]})
+        assert response.status_code == 400
+        assert message in response.json()["message"]
+
+    with (sources / "a.png").open("wb") as f:
+        f.write(b"a")
+    with (sources / "a.png").open("rb") as f, (sources / "a.png").open("rb") as g:
+        response = client.post(url, {"files": [f, g]})
+    assert response.status_code == 400
+    assert "already exists" in response.json()["message"]
+
+
+def test_researcher_add_outputs_keeps_existing_files(client, metadata_path, sources):
+    """Files already in the outputs directory, eg those of an existing output
+    or the ACRO config, are never overwritten"""
+    url = f"/researcher/outputs/add/?path={metadata_path}"
+    directory = metadata_path.parent
+    before = {
+        name: (directory / name).read_bytes()
+        for name in ["config.json", "ols_pass_0.csv", "checksums/ols_pass_0.csv.txt"]
+    }
+    (sources / "config.json").write_text("{}")
+    (sources / "ols_pass_0.csv").write_text("overwritten")
+    (sources / "new.csv").write_text("a,b")
+
+    response = client.post(url, {"directory": str(sources)})
+
+    assert response.status_code == 200
+    assert list(response.json()["outputs"]) == ["new.csv"]
+    assert response.json()["skipped"] == ["config.json", "ols_pass_0.csv"]
+
+    with (sources / "ols_pass_0.csv").open("rb") as f:
+        response = client.post(url, {"files": [f]})
+    assert response.status_code == 400
+    assert "already in the outputs directory" in response.json()["message"]
+
+    for name, content in before.items():
+        assert (directory / name).read_bytes() == content
+
+
+def test_researcher_add_outputs_revision_conflict(client, metadata_path, sources):
+    drafts.DRAFTS.patch(
+        metadata_path, [{"op": "add", "path": "/results/new", "value": {}}]
+    )
+    (sources / "a.png").write_bytes(b"a")
+
+    with (sources / "a.png").open("rb") as f:
+        response = client.post(
+            f"/researcher/outputs/add/?path={metadata_path}",
+            {"files": [f], "revision": 0},
+        )
+
+    assert response.status_code == 409
+    # nothing is written
+    assert not (metadata_path.parent / "a.png").exists()
+    assert not (metadata_path.parent / "checksums" / "a.png.txt").exists()
+
+
+def test_researcher_add_outputs_write_error(client, metadata_path, sources, mocker):
+    mocker.patch("sacro.uploads.write_many", side_effect=OSError("disk full"))
+    (sources / "a.png").write_bytes(b"a")
+
+    with (sources / "a.png").open("rb") as f:
+        response = client.post(
+            f"/researcher/outputs/add/?path={metadata_path}", {"files": [f]}
+        )
+
+    assert response.status_code == 500
+    assert response.json()["message"] == "disk full"
+
+
+def test_researcher_add_output_upload_revision_conflict(client, metadata_path):
+    started = start_upload(client, metadata_path, "late.csv", 3).json()
+    client.put(started["url"], data=b"a,b", content_type="text/csv")
+    drafts.DRAFTS.patch(
+        metadata_path, [{"op": "add", "path": "/title", "value": "changed"}]
+    )
+
+    response = client.post(
+        f"/researcher/output/add/?path={metadata_path}",
+        {
+            "name": "late",
+            "data": json.dumps({"files": [{"name": "late.csv"}]}),
+            "upload": started["upload"],
+            "revision": 0,
+        },
+    )
+
+    assert response.status_code == 409
+    directory = metadata_path.parent
+    assert not (directory / "late.csv").exists()
+    assert not (directory / "checksums" / "late.csv.txt").exists()
+    # the upload can still be added, at the current revision
+    assert client.get(started["url"]).json()["offset"] == 3
+    response = client.post(
+        f"/researcher/output/add/?path={metadata_path}",
+        {
+            "name": "late",
+            "data": json.dumps({"files": [{"name": "late.csv"}]}),
+            "upload": started["upload"],
+            "revision": 1,
+        },
+    )
+    assert response.status_code == 200
+    assert (directory / "late.csv").read_bytes() == b"a,b"
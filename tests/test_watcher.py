@@ -0,0 +1,382 @@
+import asyncio
+import json
+import queue
+import threading
+
+import pytest
+
+from sacro import cache, models, watcher
+
+
+class FakeWatcher:
+    def __init__(self, dirpath, on_change):
+        self.dirpath = dirpath
+        self.on_change = on_change
+        self.running = False
+
+    def start(self):
+        self.running = True
+        return self
+
+    def stop(self):
+        self.running = False
+
+
+@pytest.fixture
+def outputs_cache(monkeypatch):
+    outputs_cache = cache.OutputsCache(models.ACROOutputs, max_bytes=10 * 1024 * 1024)
+    monkeypatch.setattr(models, "OUTPUTS_CACHE", outputs_cache)
+    return outputs_cache
+
+
+@pytest.fixture(params=[watcher.PollingBackend, watcher.InotifyBackend])
+def backend(request, tmp_path):
+    (tmp_path / "checksums").mkdir()
+    backend = request.param(tmp_path)
+    yield backend
+    backend.close()
+
+
+class FakeBackend:
+    def __init__(self, reads):
+        self.reads = list(reads)
+
+    def read(self, timeout):
+        return self.reads.pop(0) if self.reads else set()
+
+    def close(self):
+        pass
+
+
+def read_until(backend, expected, timeout=0.05):
+    changed = set()
+    while not expected <= changed:
+        changed |= backend.read(timeout)
+    return changed
+
+
+def test_backend_changes(backend, tmp_path):
+    output = tmp_path / "output.txt"
+    output.write_text("output")
+    checksum = tmp_path / "checksums" / "output.txt.txt"
+    checksum.write_text("checksum")
+
+    assert {output, checksum} <= read_until(backend, {output, checksum})
+
+    output.unlink()
+    assert output in read_until(backend, {output})
+
+
+def test_backend_no_changes(backend):
+    assert backend.read(0.01) == set()
+
+
+def test_inotify_backend_watches_new_checksums_dir(tmp_path):
+    backend = watcher.InotifyBackend(tmp_path)
+    try:
+        checksums_dir = tmp_path / "checksums"
+        checksums_dir.mkdir()
+        assert checksums_dir in read_until(backend, {checksums_dir})
+
+        checksum = checksums_dir / "output.txt.txt"
+        checksum.write_text("checksum")
+        assert checksum in read_until(backend, {checksum})
+
+        # removing the directory drops the watch
+        checksum.unlink()
+        checksums_dir.rmdir()
+        read_until(backend, {checksums_dir})
+        assert checksums_dir not in backend.watches.values()
+    finally:
+        backend.close()
+
+
+def test_inotify_backend_overflow(tmp_path, monkeypatch):
+    (tmp_path / "output.txt").write_text("output")
+    backend = watcher.InotifyBackend(tmp_path)
+    try:
+        overflow = watcher.EVENT_HEADER.pack(-1, watcher.IN_Q_OVERFLOW, 0, 0)
+        monkeypatch.setattr(watcher.select, "select", lambda r, w, x, t: (r, w, x))
+        monkeypatch.setattr(watcher.os, "read", lambda fd, size: overflow)
+
+        assert backend.read(0) == {tmp_path / "output.txt"}
+    finally:
+        backend.close()
+
+
+def test_inotify_backend_unknown_watch(tmp_path, monkeypatch):
+    backend = watcher.InotifyBackend(tmp_path)
+    try:
+        events = watcher.EVENT_HEADER.pack(999, watcher.IN_CREATE, 0, 0)
+        monkeypatch.setattr(watcher.select, "select", lambda r, w, x, t: (r, w, x))
+        monkeypatch.setattr(watcher.os, "read", lambda fd, size: events)
+
+        assert backend.read(0) == set()
+    finally:
+        backend.close()
+
+
+def test_make_backend(tmp_path, settings):
+    settings.WATCH_BACKEND = "poll"
+    assert isinstance(watcher.make_backend(tmp_path), watcher.PollingBackend)
+
+    settings.WATCH_BACKEND = "auto"
+    backend = watcher.make_backend(tmp_path)
+    backend.close()
+    assert isinstance(backend, watcher.InotifyBackend)
+
+
+def test_directory_watcher(tmp_path, settings):
+    settings.WATCH_BACKEND = "poll"
+    settings.WATCH_POLL_INTERVAL = 0.01
+    changes = queue.Queue()
+    directory_watcher = watcher.DirectoryWatcher(tmp_path, changes.put).start()
+    try:
+        (tmp_path / "output.txt").write_text("output")
+        assert changes.get(timeout=5) == {tmp_path / "output.txt"}
+    finally:
+        directory_watcher.stop()
+
+
+def test_directory_watcher_debounces(tmp_path, settings):
+    changes = queue.Queue()
+    backend = FakeBackend([{tmp_path / "a"}, {tmp_path / "b"}, set()])
+    directory_watcher = watcher.DirectoryWatcher(tmp_path, changes.put, backend)
+    directory_watcher.start()
+    try:
+        assert changes.get(timeout=5) == {tmp_path / "a", tmp_path / "b"}
+    finally:
+        directory_watcher.stop()
+
+
+def test_directory_watcher_logs_errors(tmp_path, settings, caplog):
+    settings.WATCH_BACKEND = "poll"
+    settings.WATCH_POLL_INTERVAL = 0.01
+    called = threading.Event()
+
+    def on_change(paths):
+        called.set()
+        raise ValueError("oops")
+
+    directory_watcher = watcher.DirectoryWatcher(tmp_path, on_change).start()
+    try:
+        (tmp_path / "output.txt").write_text("output")
+        assert called.wait(timeout=5)
+    finally:
+        directory_watcher.stop()
+
+    assert "error handling changes" in caplog.text
+
+
+def test_changed_names(tmp_path):
+    checksums_dir = tmp_path / "checksums"
+    paths = {
+        tmp_path / "output.csv",
+        tmp_path / ".hidden",
+        checksums_dir,
+        checksums_dir / "other.png.txt",
+        checksums_dir / ".verified",
+        checksums_dir / "notes.md",
+        tmp_path / "elsewhere" / "file.csv",
+    }
+
+    assert watcher.changed_names(tmp_path, paths) == {"output.csv", "other.png"}
+
+
+def test_handle_changes_reverifies_output(test_outputs, outputs_cache):
+    dirpath = test_outputs.path.parent.resolve()
+    cached = outputs_cache.get(test_outputs.path)
+    output = list(cached)[0]
+    filedata = cached[output]["files"][0]
+    path = cached.get_file_path(output, filedata["name"])
+    path.write_bytes(path.read_bytes() + b"tampered")
+
+    names = watcher.handle_changes(dirpath, {path})
+
+    assert names == {filedata["name"]}
+    # updated in place, and still cached
+    assert filedata["checksum_valid"] is False
+    assert outputs_cache.get(test_outputs.path) is cached
+
+
+def test_handle_changes_metadata(test_outputs, outputs_cache):
+    dirpath = test_outputs.path.parent.resolve()
+    cached = outputs_cache.get(test_outputs.path)
+
+    watcher.handle_changes(dirpath, {dirpath / test_outputs.path.name})
+
+    assert outputs_cache.get(test_outputs.path) is not cached
+
+
+def test_handle_changes_ignored(tmp_path):
+    assert watcher.handle_changes(tmp_path, {tmp_path / ".hidden"}) == set()
+
+
+def test_handle_changes_rescaffolds(tmp_path, outputs_cache):
+    (tmp_path / "output.txt").write_text("output")
+    path = models.find_acro_metadata(tmp_path)
+    new = tmp_path / "new.txt"
+    new.write_text("new")
+
+    assert watcher.handle_changes(tmp_path, {new}) == {"new.txt"}
+    assert "new.txt" in json.loads(path.read_text())["results"]
+
+
+def test_handle_changes_rescaffold_keeps_checksum(tmp_path, outputs_cache):
+    output = tmp_path / "output.txt"
+    output.write_text("output")
+    path = models.find_acro_metadata(tmp_path)
+    outputs_cache.get(path)
+    output.write_text("changed")
+
+    assert watcher.handle_changes(tmp_path, {output}) == {"output.txt"}
+
+    filedata = outputs_cache.get(path)["output.txt"]["files"][0]
+    assert filedata["checksum_valid"] is False
+
+
+def test_handle_changes_rescaffold_error(tmp_path, outputs_cache, caplog):
+    (tmp_path / "outputs.json").write_text("{broken")
+    new = tmp_path / "new.txt"
+    new.write_text("new")
+
+    assert watcher.handle_changes(tmp_path, {new}) == {"new.txt"}
+    assert "could not update scaffolded metadata" in caplog.text
+
+
+def test_change_hub(tmp_path, monkeypatch):
+    hub = watcher.ChangeHub(watcher_class=FakeWatcher)
+    first, second = [], []
+
+    hub.subscribe(tmp_path, first.append)
+    hub.subscribe(tmp_path, second.append)
+    directory_watcher = hub._watchers[tmp_path.resolve()]
+    assert directory_watcher.running
+
+    monkeypatch.setattr(watcher, "handle_changes", lambda dirpath, paths: {"a.csv"})
+    directory_watcher.on_change({tmp_path / "a.csv"})
+    assert first == second == [{"a.csv"}]
+
+    # nothing relevant changed
+    monkeypatch.setattr(watcher, "handle_changes", lambda dirpath, paths: set())
+    directory_watcher.on_change({tmp_path / ".hidden"})
+    assert len(first) == 1
+
+    hub.unsubscribe(tmp_path, first.append)
+    assert directory_watcher.running
+    hub.unsubscribe(tmp_path, second.append)
+    assert not directory_watcher.running
+    assert hub._watchers == {}
+
+    # unknown subscribers are ignored
+    hub.unsubscribe(tmp_path, second.append)
+
+
+def test_change_message(tmp_path):
+    path = tmp_path / "results.json"
+
+    message = watcher.change_message(path, {"a.csv", "b.png"})
+    event, data = message.decode().strip().split("\n")
+    assert event == "event: change"
+    assert json.loads(data.removeprefix("data: ")) == {
+        "files": ["a.csv", "b.png"],
+        "metadata": False,
+    }
+
+    message = watcher.change_message(path, {"a.csv", "results.json"})
+    data = json.loads(message.decode().strip().split("\n")[1].removeprefix("data: "))
+    assert data == {"files": ["a.csv"], "metadata": True}
+
+
+def test_stream(tmp_path):
+    hub = watcher.ChangeHub(watcher_class=FakeWatcher)
+    path = tmp_path / "results.json"
+    events = watcher.stream(path, heartbeat=0.01, hub=hub)
+
+    assert next(events) == watcher.CONNECTED
+    assert next(events) == watcher.HEARTBEAT
+
+    hub.publish(tmp_path, {"a.csv"})
+    assert next(events) == watcher.change_message(path.resolve(), {"a.csv"})
+
+    events.close()
+    assert hub._watchers == {}
+
+
+def test_stream_default_heartbeat(tmp_path, settings):
+    settings.WATCH_HEARTBEAT_INTERVAL = 0.01
+    hub = watcher.ChangeHub(watcher_class=FakeWatcher)
+    events = watcher.stream(tmp_path / "results.json", hub=hub)
+
+    assert next(events) == watcher.CONNECTED
+    assert next(events) == watcher.HEARTBEAT
+    events.close()
+
+
+def test_event_stream_app_passes_through():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"hello"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def main():
+        event_app = watcher.EventStreamApp(app)
+        await event_app({"type": "http"}, None, send)
+        await event_app({"type": "lifespan"}, None, send)
+
+    asyncio.run(main())
+
+    assert [m.get("body") for m in sent] == [None, b"hello", None, b"hello"]
+
+
+def test_event_stream_app_streams(tmp_path, settings):
+    settings.WATCH_HEARTBEAT_INTERVAL = 0.01
+    hub = watcher.ChangeHub(watcher_class=FakeWatcher)
+    path = tmp_path / "results.json"
+
+    async def app(scope, receive, send):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"Content-Type", b"text/event-stream"),
+                    (b"Content-Length", b"0"),
+                    (watcher.HANDOFF_HEADER.encode(), str(path).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+    messages = asyncio.Queue()
+
+    async def receive():
+        return await messages.get()
+
+    async def send(message):
+        sent.append(message)
+        bodies = [m["body"] for m in sent if m["type"] == "http.response.body"]
+        if bodies == [watcher.CONNECTED]:
+            await asyncio.get_running_loop().run_in_executor(
+                None, hub.publish, tmp_path, {"a.csv"}
+            )
+        elif watcher.HEARTBEAT in bodies:
+            await messages.put({"type": "http.request"})
+            await messages.put({"type": "http.disconnect"})
+
+    asyncio.run(watcher.EventStreamApp(app, hub=hub)({"type": "http"}, receive, send))
+
+    start = sent[0]
+    assert start["headers"] == [(b"Content-Type", b"text/event-stream")]
+    bodies = [m["body"] for m in sent[1:]]
+    assert bodies[:3] == [
+        watcher.CONNECTED,
+        watcher.change_message(path, {"a.csv"}),
+        watcher.HEARTBEAT,
+    ]
+    assert hub._watchers == {}
@@ -0,0 +1,210 @@
+import threading
+
+import pytest
+
+from sacro import writer
+
+
+@pytest.fixture
+def metadata_writer():
+    metadata_writer = writer.MetadataWriter(delay=60)
+    yield metadata_writer
+    metadata_writer.close()
+
+
+def test_write_atomically(tmp_path):
+    path = tmp_path / "outputs.json"
+    path.write_text("old")
+    seen = []
+
+    writer.write_atomically(path, b"new", lambda: seen.append(path.read_text()))
+
+    assert path.read_text() == "new"
+    # the hook runs before the new contents are in place
+    assert seen == ["old"]
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_write_atomically_concurrently(tmp_path):
+    path = tmp_path / "outputs.json"
+
+    # as if another process wrote the file while we were writing it
+    writer.write_atomically(
+        path, b"first", lambda: writer.write_atomically(path, b"second")
+    )
+
+    assert path.read_text() == "first"
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_write_atomically_error(tmp_path):
+    path = tmp_path / "outputs.json"
+    path.write_text("old")
+
+    def fail():
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        writer.write_atomically(path, b"new", fail)
+
+    assert path.read_text() == "old"
+    assert not list(tmp_path.glob(".*.tmp"))
+
+
+def test_write_coalesces(tmp_path, metadata_writer):
+    path = tmp_path / "outputs.json"
+
+    futures = [metadata_writer.write(path, f"{i}".encode(), "test") for i in range(3)]
+    assert not path.exists()
+    assert not any(f.done() for f in futures)
+
+    metadata_writer.flush(path)
+
+    assert path.read_text() == "2"
+    assert [f.result() for f in futures] == [path.resolve()] * 3
+    stats = metadata_writer.stats()["test"]
+    assert stats["requests"] == 3
+    assert stats["writes"] == 1
+    assert stats["coalesced"] == 2
+    assert stats["errors"] == 0
+    assert stats["max_latency"] >= stats["mean_latency"] > 0
+
+
+def test_write_in_background(tmp_path):
+    metadata_writer = writer.MetadataWriter(delay=0.01)
+    path = tmp_path / "outputs.json"
+
+    try:
+        future = metadata_writer.write(path, b"data", "test")
+        assert future.result(timeout=10) == path.resolve()
+        assert path.read_text() == "data"
+
+        # and again, once the thread has gone back to waiting
+        future = metadata_writer.write(path, b"more", "test")
+        assert future.result(timeout=10) == path.resolve()
+        assert path.read_text() == "more"
+    finally:
+        metadata_writer.close()
+
+
+def test_write_without_delay(tmp_path, settings):
+    settings.METADATA_WRITE_DELAY = 0
+    metadata_writer = writer.MetadataWriter()
+    path = tmp_path / "outputs.json"
+
+    future = metadata_writer.write(path, b"data", "test")
+
+    assert future.done()
+    assert path.read_text() == "data"
+
+
+def test_write_now_supersedes_pending(tmp_path, metadata_writer):
+    path = tmp_path / "outputs.json"
+    pending = metadata_writer.write(path, b"pending", "test")
+
+    metadata_writer.write_now(path, b"now", "test")
+
+    assert path.read_text() == "now"
+    assert pending.result() == path.resolve()
+    # nothing left to write over it
+    metadata_writer.flush()
+    assert path.read_text() == "now"
+    assert metadata_writer.stats()["test"]["writes"] == 1
+
+
+def test_write_errors(tmp_path, metadata_writer):
+    path = tmp_path / "missing" / "outputs.json"
+
+    future = metadata_writer.write(path, b"data", "test")
+    metadata_writer.flush()
+    with pytest.raises(OSError):
+        future.result()
+
+    with pytest.raises(OSError):
+        metadata_writer.write_now(path, b"data", "test")
+
+    assert metadata_writer.stats()["test"]["errors"] == 2
+
+
+def test_flush_nothing_pending(tmp_path, metadata_writer):
+    metadata_writer.flush(tmp_path / "outputs.json")
+    metadata_writer.flush()
+    assert metadata_writer.stats() == {}
+
+
+def test_flush_waits_for_write_in_progress(tmp_path, metadata_writer):
+    path = tmp_path / "outputs.json"
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow_write():
+        started.set()
+        release.wait()
+
+    thread = threading.Thread(
+        target=metadata_writer.write_now,
+        args=(path, b"data", "test"),
+        kwargs={"before_replace": slow_write},
+    )
+    thread.start()
+    started.wait()
+
+    flushed = threading.Thread(target=metadata_writer.flush, args=(path,))
+    flushed.start()
+    flushed.join(timeout=0.1)
+    assert flushed.is_alive()
+
+    release.set()
+    thread.join()
+    flushed.join()
+    assert path.read_text() == "data"
+
+
+def test_record(metadata_writer):
+    metadata_writer.record("append", 0.5)
+    metadata_writer.record("append", 1.5)
+
+    assert metadata_writer.stats()["append"] == {
+        "requests": 2,
+        "writes": 2,
+        "errors": 0,
+        "coalesced": 0,
+        "mean_latency": 1.0,
+        "max_latency": 1.5,
+    }
+
+
+def test_close(tmp_path):
+    metadata_writer = writer.MetadataWriter(delay=60)
+    path = tmp_path / "outputs.json"
+    metadata_writer.write(path, b"pending", "test")
+
+    metadata_writer.close()
+    assert path.read_text() == "pending"
+
+    # anything written after closing is written straight away
+    future = metadata_writer.write(path, b"after", "test")
+    assert future.done()
+    assert path.read_text() == "after"
+
+
+def test_write_stats_empty():
+    assert writer.WriteStats().as_dict()["mean_latency"] == 0.0
+
+
+def test_close_while_writing_in_background(tmp_path, monkeypatch):
+    metadata_writer = writer.MetadataWriter(delay=0.01)
+    path = tmp_path / "outputs.json"
+    original = writer.write_atomically
+
+    def write_atomically(path, data, before_replace=None):
+        # as if close() were called while the background thread was writing
+        metadata_writer._closed = True
+        original(path, data, before_replace)
+
+    monkeypatch.setattr(writer, "write_atomically", write_atomically)
+    metadata_writer.write(path, b"data", "test").result(timeout=10)
+    metadata_writer._thread.join(timeout=10)
+
+    assert not metadata_writer._thread.is_alive()
+    assert path.read_text() == "data"
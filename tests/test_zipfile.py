@@ -0,0 +1,301 @@
+import copy
+import hashlib
+import io
+import os
+import zipfile as stdlib_zipfile
+import zlib
+
+import pytest
+
+from sacro.adapters import zipfile
+
+
+def read_zip(chunks):
+    zip_obj = stdlib_zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert zip_obj.testzip() is None
+    return zip_obj
+
+
+def test_compression_for():
+    assert zipfile.compression_for("table.csv") == zipfile.ZIP_DEFLATED
+    assert zipfile.compression_for("results.json") == zipfile.ZIP_DEFLATED
+    assert zipfile.compression_for("plot.PNG") == zipfile.ZIP_STORED
+    assert zipfile.compression_for("report.pdf") == zipfile.ZIP_STORED
+    assert zipfile.compression_for("tables.xlsx") == zipfile.ZIP_STORED
+
+
+def test_dos_datetime():
+    date, time_ = zipfile.dos_datetime((2024, 3, 5, 13, 7, 9))
+    assert date == (44 << 9) | (3 << 5) | 5
+    assert time_ == (13 << 11) | (7 << 5) | 4
+
+    # dates before 1980 cannot be represented
+    assert zipfile.dos_datetime((1970, 1, 1, 0, 0, 0)) == (1 << 5 | 1, 0)
+
+
+def test_zip_writer():
+    writer = zipfile.ZipWriter()
+    chunks = []
+    chunks += writer.writestr("results.json", '{"a": 1}' * 100)
+    chunks += writer.writestr("plot.png", b"\x89PNG")
+    chunks += writer.writestr("tablé.csv", "a,b\n1,2\n")
+    chunks.append(writer.close())
+
+    assert writer.offset == sum(len(chunk) for chunk in chunks)
+    with read_zip(chunks) as zip_obj:
+        assert zip_obj.namelist() == ["results.json", "plot.png", "tablé.csv"]
+        assert zip_obj.read("results.json") == b'{"a": 1}' * 100
+        assert zip_obj.read("plot.png") == b"\x89PNG"
+        assert zip_obj.read("tablé.csv") == b"a,b\n1,2\n"
+
+        assert zip_obj.getinfo("results.json").compress_type == zipfile.ZIP_DEFLATED
+        assert zip_obj.getinfo("plot.png").compress_type == zipfile.ZIP_STORED
+        assert zip_obj.getinfo("plot.png").external_attr >> 16 == 0o600
+
+
+def test_zip_writer_zip64(monkeypatch):
+    # pretend everything is over the ZIP64 limits
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 5)
+    monkeypatch.setattr(zipfile, "ZIP_FILECOUNT_LIMIT", 1)
+
+    writer = zipfile.ZipWriter()
+    chunks = []
+    chunks += writer.writestr("one.png", b"0123456789")
+    chunks += writer.writestr("two.png", b"9876543210")
+    chunks.append(writer.close())
+
+    with read_zip(chunks) as zip_obj:
+        assert zip_obj.read("one.png") == b"0123456789"
+        assert zip_obj.read("two.png") == b"9876543210"
+        for info in zip_obj.infolist():
+            assert info.extract_version == zipfile.ZIP64_VERSION
+        assert zip_obj.getinfo("two.png").header_offset > 5
+
+
+def test_zip_writer_member_grew(monkeypatch):
+    monkeypatch.setattr(zipfile, "ZIP64_LIMIT", 5)
+    member = zipfile.Member(
+        name="output.csv", chunks=[(b"0123456789", b"0123456789")], file_size=1
+    )
+
+    with pytest.raises(RuntimeError, match="grew too large"):
+        list(zipfile.ZipWriter().write(member))
+
+
+def test_zip_writer_output_changed():
+    data = b"0123456789"
+    member = zipfile.Member(
+        name="output.png",
+        chunks=[(data, data)],
+        file_size=len(data),
+        expected=hashlib.sha256(b"reviewed").hexdigest(),
+    )
+
+    chunks = zipfile.ZipWriter().write(member)
+    with pytest.raises(zipfile.OutputChanged, match="output.png"):
+        list(chunks)
+
+
+def test_deflate_piece():
+    pieces = [b"x" * 1000, b"", b"y" * 1000]
+
+    deflated = b"".join(map(zipfile.deflate_piece, pieces)) + zipfile.DEFLATE_END
+
+    assert zlib.decompress(deflated, -zlib.MAX_WBITS) == b"".join(pieces)
+
+
+def test_read_ahead(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipfile, "CHUNK_SIZE", 10)
+    csv = tmp_path / "output.csv"
+    csv.write_bytes(b"x" * 95)
+    png = tmp_path / "output.png"
+    png.write_bytes(b"y" * 25)
+    empty = tmp_path / "empty.csv"
+    empty.touch()
+    paths = [csv, png, empty]
+
+    with zipfile.ReadAhead(paths, workers=2, limit=30) as read_ahead:
+        chunks = read_ahead.chunks(csv)
+        data, compressed = next(chunks)
+        assert data == b"x" * 10
+        # reading has got ahead, but only as far as it is allowed to
+        assert read_ahead.buffered <= 30
+        rest = list(chunks)
+        assert b"".join([data] + [data for data, _ in rest]) == b"x" * 95
+        deflated = compressed + b"".join(compressed for _, compressed in rest)
+        assert zlib.decompress(deflated, -zlib.MAX_WBITS) == b"x" * 95
+
+        # stored as it is
+        assert list(read_ahead.chunks(png)) == [
+            (b"y" * 10, b"y" * 10),
+            (b"y" * 10, b"y" * 10),
+            (b"y" * 5, b"y" * 5),
+        ]
+        assert list(read_ahead.chunks(empty)) == [(b"", zipfile.DEFLATE_END)]
+        assert read_ahead.buffered == 0
+
+
+def test_read_ahead_reads_once(tmp_path, monkeypatch):
+    path = tmp_path / "output.csv"
+    path.write_bytes(b"x" * 100)
+    opened = []
+    monkeypatch.setattr(
+        zipfile, "open", lambda *args: opened.append(args) or open(*args), raising=False
+    )
+
+    writer = zipfile.ZipWriter()
+    with zipfile.ReadAhead([path], workers=2, limit=10) as read_ahead:
+        member = zipfile.Member(
+            name=path.name,
+            chunks=read_ahead.chunks(path),
+            file_size=100,
+            compress_type=zipfile.ZIP_DEFLATED,
+            expected=hashlib.sha256(b"x" * 100).hexdigest(),
+        )
+        chunks = list(writer.write(member)) + [writer.close()]
+
+    assert opened == [(path, "rb")]
+    with read_zip(chunks) as zip_obj:
+        assert zip_obj.read(path.name) == b"x" * 100
+
+
+def test_read_ahead_close(tmp_path, monkeypatch):
+    monkeypatch.setattr(zipfile, "CHUNK_SIZE", 10)
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"output_{i}.csv"
+        path.write_bytes(b"x" * 25)
+        paths.append(path)
+
+    read_ahead = zipfile.ReadAhead(paths, workers=1, limit=40)
+    next(read_ahead.chunks(paths[0]))
+    reading = read_ahead.reading[1]
+    read_ahead.close()
+
+    # whatever was being read is closed, and nothing is left queued
+    assert reading.closed
+    assert read_ahead.reading is None
+    assert not read_ahead.queue
+
+
+def test_redact_metadata(test_outputs):
+    approved, rejected = list(test_outputs)[:2]
+    review = {"decisions": {approved: {"state": True, "comment": "fine"}}}
+
+    redacted = zipfile.redact_metadata(test_outputs, review, [approved, "unknown"])
+
+    assert list(redacted["results"]) == [approved]
+    result = redacted["results"][approved]
+    assert result["status"] == "approved"
+    assert result["comments"][-1] == "Output Checker: fine"
+    # the loaded metadata is untouched
+    assert rejected in test_outputs.raw_metadata["results"]
+
+
+def test_stream(test_outputs, settings):
+    settings.RELEASE_COMPRESSION_WORKERS = 2
+    approved = list(test_outputs) + ["unknown"]
+    review = {"decisions": {name: {"state": True} for name in approved}}
+
+    chunks = list(zipfile.stream(test_outputs, review, approved))
+
+    with read_zip(chunks) as zip_obj:
+        names = zip_obj.namelist()
+        assert names[0] == "results.json"
+        assert names[-1] == "summary.txt"
+        for output in test_outputs:
+            for filedata in test_outputs[output]["files"]:
+                path = test_outputs.get_file_path(output, filedata["name"])
+                assert zip_obj.read(path.name) == path.read_bytes()
+                info = zip_obj.getinfo(path.name)
+                assert info.compress_type == zipfile.compression_for(path.name)
+
+
+def test_stream_same_with_any_workers(test_outputs):
+    approved = list(test_outputs)
+    review = {"decisions": {name: {"state": True} for name in approved}}
+
+    serial = read_zip(zipfile.stream(test_outputs, review, approved, workers=1))
+    parallel = read_zip(zipfile.stream(test_outputs, review, approved, workers=8))
+
+    with serial, parallel:
+        assert serial.namelist() == parallel.namelist()
+        for name in serial.namelist():
+            assert serial.read(name) == parallel.read(name)
+
+
+def test_recorded_checksum(tmp_path):
+    (tmp_path / "output.csv.txt").write_text("abc")
+
+    assert zipfile.recorded_checksum(tmp_path, "output.csv") == "abc"
+    assert zipfile.recorded_checksum(tmp_path, "other.csv") is None
+
+
+def test_stream_refuses_changed_files(test_outputs, caplog):
+    approved = list(test_outputs)
+    review = {"decisions": {name: {"state": True} for name in approved}}
+    changed = test_outputs.get_file_path(
+        approved[-1], test_outputs[approved[-1]]["files"][0]["name"]
+    )
+    changed.write_bytes(changed.read_bytes() + b"tampered")
+
+    chunks = zipfile.stream(test_outputs, review, approved)
+    with pytest.raises(zipfile.OutputChanged):
+        list(chunks)
+
+    assert f"{changed} has changed since review" in caplog.text
+
+
+def test_stream_unchecked_and_missing_files(test_outputs):
+    approved = list(test_outputs)
+    review = {"decisions": {name: {"state": True} for name in approved}}
+    unchecked, missing = (
+        test_outputs.get_file_path(output, test_outputs[output]["files"][0]["name"])
+        for output in approved[:2]
+    )
+    (test_outputs.path.parent / "checksums" / f"{unchecked.name}.txt").unlink()
+    missing.unlink()
+
+    with read_zip(zipfile.stream(test_outputs, review, approved)) as zip_obj:
+        # nothing to check it against, so included as before
+        assert zip_obj.read(unchecked.name) == unchecked.read_bytes()
+        contents = zip_obj.read("missing-files.txt").decode()
+
+    found, found_paths = contents.split("\n\n")
+    assert "were not found" in found
+    assert found_paths == str(missing)
+
+
+def test_release_key(test_outputs):
+    approved = list(test_outputs)
+    review = {
+        "comment": "ok",
+        "decisions": {name: {"state": True, "comment": ""} for name in approved},
+    }
+    key = zipfile.release_key(test_outputs, review, approved)
+
+    assert zipfile.release_key(test_outputs, review, approved) == key
+    # derived data added while building a release does not matter
+    review["decisions"][approved[0]]["acro_status"] = "pass"
+    assert zipfile.release_key(test_outputs, review, approved) == key
+
+    changed_comment = copy.deepcopy(review)
+    changed_comment["decisions"][approved[0]]["comment"] = "hmm"
+    assert zipfile.release_key(test_outputs, changed_comment, approved) != key
+
+    assert zipfile.release_key(test_outputs, review, approved[1:]) != key
+
+    path = test_outputs.get_file_path(
+        approved[0], test_outputs[approved[0]]["files"][0]["name"]
+    )
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    touched = zipfile.release_key(test_outputs, review, approved)
+    assert touched != key
+
+    checksum = test_outputs.path.parent / "checksums" / f"{path.name}.txt"
+    checksum.write_text("different")
+    assert zipfile.release_key(test_outputs, review, approved) != touched
+
+    path.unlink()
+    assert zipfile.release_key(test_outputs, review, approved + ["unknown"])